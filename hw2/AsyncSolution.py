@@ -0,0 +1,674 @@
+"""
+asyncio twin of Solution.py on top of an asyncpg pool.
+Every function of the Solution API except the schema functions has a twin here that runs the same Statements
+definitions, returns the same Business objects and ReturnValue codes, and invalidates the same Cache entries; the
+stream* twins are async generators, used with async for.
+Schema management (createTables, clearTables, dropTables) stays in Solution.py.
+Reads run on the asyncpg pool, on the primary. With replicas configured, a write that changed something reads the
+primary's WAL position on its own connection after its commit and hands it to Replicas, so routed reads on the
+event loop's thread, and writeToken(), see it.
+"""
+import asyncio
+import os
+import random
+from configparser import ConfigParser
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+
+import Cache
+import Placement
+import Replicas
+import Solution
+import Statements
+import Views
+import Utility.DBConnector as Connector
+from Business.Disk import Disk
+from Business.Photo import Photo
+from Business.RAM import RAM
+from Utility.ReturnValue import ReturnValue
+
+NOT_NULL_VIOLATION = "23502"
+FOREIGN_KEY_VIOLATION = "23503"
+UNIQUE_VIOLATION = "23505"
+CHECK_VIOLATION = "23514"
+
+# same mapping as Solution.addTuple
+ADD_ERRORS = {CHECK_VIOLATION: ReturnValue.BAD_PARAMS, NOT_NULL_VIOLATION: ReturnValue.BAD_PARAMS,
+              FOREIGN_KEY_VIOLATION: ReturnValue.NOT_EXISTS, UNIQUE_VIOLATION: ReturnValue.ALREADY_EXISTS}
+
+# same mapping as Solution.addPhotoToDisk
+PLACEMENT_ERRORS = {NOT_NULL_VIOLATION: ReturnValue.NOT_EXISTS, UNIQUE_VIOLATION: ReturnValue.ALREADY_EXISTS,
+                    CHECK_VIOLATION: ReturnValue.BAD_PARAMS}
+
+_pool: Optional[asyncpg.Pool] = None
+_poolLock = asyncio.Lock()
+
+
+def connectionParams(filename: str = None, section: str = "postgresql") -> dict:
+    """Reads the same database.ini that Utility.DBConnector connects with."""
+    if filename is None:
+        filename = os.path.join(os.path.dirname(Connector.__file__), "database.ini")
+    parser = ConfigParser()
+    parser.read(filename)
+    params = dict(parser.items(section)) if parser.has_section(section) else {}
+    if "port" in params:
+        params["port"] = int(params["port"])
+    return params
+
+
+async def configurePool(minSize: int = 1, maxSize: int = 10, **params) -> asyncpg.Pool:
+    global _pool
+    async with _poolLock:
+        old = _pool
+        _pool = await asyncpg.create_pool(min_size=minSize, max_size=maxSize, **(params or connectionParams()))
+    if old is not None:
+        await old.close()
+    return _pool
+
+
+async def getPool() -> asyncpg.Pool:
+    if _pool is None:
+        await configurePool()
+    return _pool
+
+
+async def closePool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def affectedRows(status: str) -> int:
+    """asyncpg returns the command tag, e.g. 'DELETE 1' or 'INSERT 0 1'; the row count is its last word."""
+    try:
+        return int(status.rsplit(" ", 1)[-1])
+    except ValueError:
+        return 0
+
+
+async def invalidate(kind: str, ids: Iterable):
+    # local only, other processes hear of the write from the triggers, see Cache.enableNotifications
+    Cache.invalidate(kind, ids)
+
+
+async def noteWrite(conn):
+    """Replicas.notePosition with the position read on the connection that committed the write."""
+    if not Replicas.configured():
+        return
+    try:
+        Replicas.notePosition(await conn.fetchval(Statements.CURRENT_WAL_LSN.typedText))
+    except Exception:
+        # the write is committed either way, the position is then read at the next routed read
+        Replicas.noteWrite()
+
+
+async def withRetries(work: Callable[[], Awaitable]):
+    """Solution.withRetries for autocommitted asyncpg calls: reruns work() on a deadlock or serialization failure."""
+    for attempt in range(Solution.RETRY_ATTEMPTS):
+        try:
+            return await work()
+        except asyncpg.PostgresError as e:
+            if e.sqlstate not in Solution.TRANSIENT_SQLSTATES:
+                raise
+            with Solution._retryLock:
+                Solution.retryStats["exhausted" if attempt + 1 == Solution.RETRY_ATTEMPTS else "retries"] += 1
+            if attempt + 1 == Solution.RETRY_ATTEMPTS:
+                raise
+            await asyncio.sleep(random.uniform(0.5, 1.0) *
+                                min(Solution.RETRY_MAX_DELAY, Solution.RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def addTuple(statement: Statements.Statement, *params) -> ReturnValue:
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            await withRetries(lambda: conn.execute(statement.typedText, *params))
+            await noteWrite(conn)
+        return ReturnValue.OK
+    except asyncpg.PostgresError as e:
+        return ADD_ERRORS.get(e.sqlstate, ReturnValue.ERROR)
+    except Exception:
+        return ReturnValue.ERROR
+
+
+async def deleteTuple(statement: Statements.Statement, *params, not_photo=False) -> ReturnValue:
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            if affectedRows(await withRetries(lambda: conn.execute(statement.typedText, *params))) == 0 and not_photo:
+                return ReturnValue.NOT_EXISTS
+            await noteWrite(conn)
+        return ReturnValue.OK
+    except Exception:
+        return ReturnValue.ERROR
+
+
+async def fetch(statement: Statements.Statement, *params) -> list:
+    pool = await getPool()
+    async with pool.acquire() as conn:
+        return await conn.fetch(statement.typedText, *params)
+
+
+async def fetchValue(statement: Statements.Statement, *params):
+    pool = await getPool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(statement.typedText, *params)
+
+
+async def getByID(cache: Cache.LRUCache, statement: Statements.Statement, key: int):
+    row = cache.get(key)
+    if row is Cache.MISSING:
+        version = cache.version()
+        rows = await fetch(statement, key)
+        row = tuple(rows[0]) if rows else None
+        cache.put(key, row, version)
+    return row
+
+
+async def addPhoto(photo: Photo) -> ReturnValue:
+    result = await addTuple(Statements.ADD_PHOTO, *Solution.photoParams(photo))
+    await invalidate("photo", [photo.getPhotoID()])
+    return result
+
+
+async def getPhotoByID(photoID: int) -> Photo:
+    try:
+        return Solution.photoFromRow(await getByID(Cache.photos, Statements.PHOTO_BY_ID, photoID))
+    except Exception:
+        return Photo.badPhoto()
+
+
+async def deletePhoto(photo: Photo) -> ReturnValue:
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            disk_ids, deleted = await withRetries(
+                lambda: conn.fetchrow(Statements.DELETE_PHOTO.typedText, *Solution.photoParams(photo)))
+            if deleted != 0:
+                await noteWrite(conn)
+        if deleted != 0:
+            await invalidate("photo", [photo.getPhotoID()])
+            await invalidate("disk", disk_ids)
+        return ReturnValue.OK
+    except Exception:
+        return ReturnValue.ERROR
+
+
+async def addDisk(disk: Disk) -> ReturnValue:
+    result = await addTuple(Statements.ADD_DISK, *Solution.diskParams(disk))
+    await invalidate("disk", [disk.getDiskID()])
+    return result
+
+
+async def getDiskByID(diskID: int) -> Disk:
+    try:
+        return Solution.diskFromRow(await getByID(Cache.disks, Statements.DISK_BY_ID, diskID))
+    except Exception:
+        return Disk.badDisk()
+
+
+async def deleteDisk(diskID: int) -> ReturnValue:
+    result = await deleteTuple(Statements.DELETE_DISK, diskID, not_photo=True)
+    await invalidate("disk", [diskID])
+    return result
+
+
+async def addRAM(ram: RAM) -> ReturnValue:
+    result = await addTuple(Statements.ADD_RAM, *Solution.ramParams(ram))
+    await invalidate("ram", [ram.getRamID()])
+    return result
+
+
+async def getRAMByID(ramID: int) -> RAM:
+    try:
+        return Solution.ramFromRow(await getByID(Cache.rams, Statements.RAM_BY_ID, ramID))
+    except Exception:
+        return RAM.badRAM()
+
+
+async def deleteRAM(ramID: int) -> ReturnValue:
+    result = await deleteTuple(Statements.DELETE_RAM, ramID, not_photo=True)
+    await invalidate("ram", [ramID])
+    return result
+
+
+async def rowsByIDs(cache: Cache.LRUCache, statement: Statements.Statement, ids: List[int]) -> dict:
+    """Same as Solution.rowsByIDs: cached rows plus one = ANY query for the rest."""
+    rows = {}
+    missing = []
+    for key in ids:
+        row = cache.get(key)
+        if row is Cache.MISSING:
+            missing.append(key)
+        else:
+            rows[key] = row
+    if missing:
+        version = cache.version()
+        found = {row[0]: tuple(row) for row in await fetch(statement, sorted(set(missing)))}
+        for key in missing:
+            rows[key] = found.get(key)
+            cache.put(key, rows[key], version)
+    return rows
+
+
+async def getPhotosByIDs(photoIDs: Iterable[int], views: bool = False) -> List[Photo]:
+    photoIDs = list(photoIDs)
+    try:
+        rows = await rowsByIDs(Cache.photos, Statements.PHOTOS_BY_IDS, [key for key in photoIDs if key is not None])
+    except Exception:
+        rows = {}
+    if views:
+        return [Views.PhotoView._make(rows[key]) if rows.get(key) else Views.BAD_PHOTO for key in photoIDs]
+    return [Solution.photoFromRow(rows.get(key)) for key in photoIDs]
+
+
+async def getDisksByIDs(diskIDs: Iterable[int], views: bool = False) -> List[Disk]:
+    diskIDs = list(diskIDs)
+    try:
+        rows = await rowsByIDs(Cache.disks, Statements.DISKS_BY_IDS, [key for key in diskIDs if key is not None])
+    except Exception:
+        rows = {}
+    if views:
+        return [Views.DiskView._make(rows[key]) if rows.get(key) else Views.BAD_DISK for key in diskIDs]
+    return [Solution.diskFromRow(rows.get(key)) for key in diskIDs]
+
+
+async def getRAMsByIDs(ramIDs: Iterable[int], views: bool = False) -> List[RAM]:
+    ramIDs = list(ramIDs)
+    try:
+        rows = await rowsByIDs(Cache.rams, Statements.RAMS_BY_IDS, [key for key in ramIDs if key is not None])
+    except Exception:
+        rows = {}
+    if views:
+        return [Views.RAMView._make(rows[key]) if rows.get(key) else Views.BAD_RAM for key in ramIDs]
+    return [Solution.ramFromRow(rows.get(key)) for key in ramIDs]
+
+
+async def addDiskAndPhoto(disk: Disk, photo: Photo) -> ReturnValue:
+    result = await addTuple(Statements.ADD_DISK_AND_PHOTO, *Solution.diskParams(disk), *Solution.photoParams(photo))
+    await invalidate("disk", [disk.getDiskID()])
+    await invalidate("photo", [photo.getPhotoID()])
+    return result
+
+
+async def addPhotoToDisk(photo: Photo, diskID: int) -> ReturnValue:
+    result = ReturnValue.OK
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            await withRetries(
+                lambda: conn.execute(Statements.ADD_PHOTO_TO_DISK.typedText, *Solution.photoParams(photo), diskID))
+            await noteWrite(conn)
+    except asyncpg.PostgresError as e:
+        result = PLACEMENT_ERRORS.get(e.sqlstate, ReturnValue.ERROR)
+    except Exception:
+        result = ReturnValue.ERROR
+    await invalidate("disk", [diskID])
+    return result
+
+
+async def addPhotoToAnyDisk(photo: Photo) -> Tuple[ReturnValue, Optional[int]]:
+    photo_exists = False
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            for statement in (Statements.ADD_PHOTO_TO_ANY_DISK_SKIP_LOCKED, Statements.ADD_PHOTO_TO_ANY_DISK):
+                disk_id, photo_exists = await withRetries(
+                    lambda: conn.fetchrow(statement.typedText, *Solution.photoParams(photo)))
+                if disk_id is not None:
+                    await noteWrite(conn)
+                    await invalidate("disk", [disk_id])
+                    return ReturnValue.OK, disk_id
+                if not photo_exists:
+                    break
+    except Exception:
+        return ReturnValue.ERROR, None
+    return (ReturnValue.BAD_PARAMS if photo_exists else ReturnValue.NOT_EXISTS), None
+
+
+async def removePhotoFromDisk(photo: Photo, diskID: int) -> ReturnValue:
+    result = await deleteTuple(Statements.REMOVE_PHOTO_FROM_DISK, photo.getPhotoID(), diskID)
+    await invalidate("disk", [diskID])
+    return result
+
+
+async def addRAMToDisk(ramID: int, diskID: int) -> ReturnValue:
+    return await addTuple(Statements.ADD_RAM_TO_DISK, ramID, diskID)
+
+
+async def removeRAMFromDisk(ramID: int, diskID: int) -> ReturnValue:
+    return await deleteTuple(Statements.REMOVE_RAM_FROM_DISK, ramID, diskID, not_photo=True)
+
+
+async def addTuplesChunk(conn, batch: Statements.Statement, single: Statements.Statement,
+                         chunk: List[tuple]) -> List[ReturnValue]:
+    try:
+        async with conn.transaction():
+            rows = await conn.fetch(batch.typedText, *Solution.columns(chunk))
+        return Solution.insertedResults(chunk, (row[0] for row in rows))
+    except asyncpg.PostgresError:
+        pass
+    result = []
+    for row in chunk:
+        try:
+            async with conn.transaction():
+                await conn.execute(single.typedText, *row)
+            result.append(ReturnValue.OK)
+        except asyncpg.PostgresError as e:
+            result.append(ADD_ERRORS.get(e.sqlstate, ReturnValue.ERROR))
+    return result
+
+
+async def addTuples(kind: str, batch: Statements.Statement, single: Statements.Statement, rows: Iterable[tuple],
+                    chunkSize: int = Solution.BATCH_SIZE) -> List[ReturnValue]:
+    result = []
+    pool = await getPool()
+    async with pool.acquire() as conn:
+        for chunk in Solution.chunks(rows, chunkSize):
+            try:
+                async with conn.transaction():
+                    chunkResult = await addTuplesChunk(conn, batch, single, chunk)
+                result.extend(chunkResult)
+                if ReturnValue.OK in chunkResult:
+                    await noteWrite(conn)
+            except Exception:
+                result.extend([ReturnValue.ERROR] * len(chunk))
+            await invalidate(kind, [row[0] for row in chunk])
+    return result
+
+
+async def addPhotos(photos: Iterable[Photo], chunkSize: int = Solution.BATCH_SIZE) -> List[ReturnValue]:
+    return await addTuples("photo", Statements.ADD_PHOTOS, Statements.ADD_PHOTO,
+                           map(Solution.photoParams, photos), chunkSize)
+
+
+async def addDisks(disks: Iterable[Disk], chunkSize: int = Solution.BATCH_SIZE) -> List[ReturnValue]:
+    return await addTuples("disk", Statements.ADD_DISKS, Statements.ADD_DISK,
+                           map(Solution.diskParams, disks), chunkSize)
+
+
+async def addRAMs(rams: Iterable[RAM], chunkSize: int = Solution.BATCH_SIZE) -> List[ReturnValue]:
+    return await addTuples("ram", Statements.ADD_RAMS, Statements.ADD_RAM, map(Solution.ramParams, rams), chunkSize)
+
+
+async def placeInSavepoint(conn, photo: Photo, diskID: int) -> ReturnValue:
+    """Solution.placeInSavepoint: addPhotoToDisk in the caller's transaction, transient errors are raised."""
+    try:
+        async with conn.transaction():
+            await conn.execute(Statements.ADD_PHOTO_TO_DISK.typedText, *Solution.photoParams(photo), diskID)
+        return ReturnValue.OK
+    except asyncpg.PostgresError as e:
+        if e.sqlstate in Solution.TRANSIENT_SQLSTATES:
+            raise
+        return PLACEMENT_ERRORS.get(e.sqlstate, ReturnValue.ERROR)
+    except Exception:
+        return ReturnValue.ERROR
+
+
+async def addPhotosToDiskChunk(conn, chunk: List[Tuple[Photo, int]]) -> List[ReturnValue]:
+    """Solution.addPhotosToDiskChunk: set-based, replayed pair by pair if that fails, e.g. on an id outside int4."""
+    try:
+        async with conn.transaction():
+            photoIDs, diskIDs = Solution.placementKeys(chunk)
+            disks = await conn.fetch(Statements.PLACEMENT_DISKS.typedText, diskIDs)
+            photos = await conn.fetch(Statements.PLACEMENT_PHOTOS.typedText, photoIDs)
+            pairs = await conn.fetch(Statements.PLACEMENT_PAIRS.typedText, photoIDs, diskIDs)
+            result, inserts, params = Solution.planPlacements(chunk, disks, photos, pairs)
+            if inserts:
+                await conn.execute(Statements.PLACE_PHOTOS.typedText, *params)
+        return result
+    except asyncpg.PostgresError as e:
+        if e.sqlstate in Solution.TRANSIENT_SQLSTATES:
+            raise
+    except Exception:
+        pass
+    return [await placeInSavepoint(conn, photo, diskID) for photo, diskID in chunk]
+
+
+async def addPhotosToDisk(placements: Iterable[Tuple[Photo, int]],
+                          chunkSize: int = Solution.BATCH_SIZE) -> List[ReturnValue]:
+    result = []
+    pool = await getPool()
+    async with pool.acquire() as conn:
+        for chunk in Solution.chunks(placements, chunkSize):
+            async def work() -> List[ReturnValue]:
+                async with conn.transaction():
+                    return await addPhotosToDiskChunk(conn, chunk)
+
+            try:
+                chunkResult = await withRetries(work)
+                result.extend(chunkResult)
+                if ReturnValue.OK in chunkResult:
+                    await noteWrite(conn)
+            except Exception:
+                result.extend([ReturnValue.ERROR] * len(chunk))
+            await invalidate("disk", {diskID for _, diskID in chunk})
+    return result
+
+
+async def lockPlannedDisks(conn, placement: Dict[int, int], sizes: Dict[int, int],
+                           respectRAM: bool) -> Optional[Dict[int, int]]:
+    """Solution.lockPlannedDisks on an asyncpg connection."""
+    usedSpace, largest = Solution.plannedUse(placement, sizes)
+    disks = await conn.fetch(Statements.PLANNER_CHOSEN_DISKS.typedText, sorted(usedSpace))
+    pairs = await conn.fetch(Statements.PLACEMENT_PAIRS.typedText, sorted(placement), sorted(usedSpace))
+    return usedSpace if Solution.planHolds(placement, usedSpace, largest, disks, pairs, respectRAM) else None
+
+
+async def placePhotos(photoIDs: Iterable[int], strategy: str = Placement.FIRST_FIT_DECREASING,
+                      respectRAM: bool = False) -> Tuple[Dict[int, int], List[int]]:
+    """Solution.placePhotos: plan unlocked, lock and check the chosen disks, replan when the plan went stale."""
+    photoIDs = sorted(set(photoIDs))
+    result = {}, photoIDs
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            async def work() -> Tuple[Dict[int, int], List[int]]:
+                for attempt in range(Solution.PLACEMENT_REPLANS + 1):
+                    locked = attempt == Solution.PLACEMENT_REPLANS
+                    transaction = conn.transaction()
+                    await transaction.start()
+                    try:
+                        disks = await conn.fetch(Statements.PLANNER_DISKS_LOCKED.typedText if locked
+                                                 else Statements.PLANNER_DISKS.typedText)
+                        photos = await conn.fetch(Statements.PLANNER_PHOTOS.typedText, photoIDs)
+                        pairs = await conn.fetch(Statements.PLANNER_PAIRS.typedText, photoIDs)
+                        sizes = {photo_id: size for photo_id, size in photos}
+                        placement, unplaced = Placement.plan(sizes.items(),
+                                                             [Placement.DiskCandidate(*row) for row in disks],
+                                                             {tuple(row) for row in pairs}, strategy, respectRAM)
+                        usedSpace = await lockPlannedDisks(conn, placement, sizes, respectRAM) if placement else {}
+                        if usedSpace is None:
+                            await transaction.rollback()
+                            continue
+                        if placement:
+                            await conn.execute(Statements.PLACE_PHOTOS.typedText,
+                                               *Solution.columns(list(placement.items())),
+                                               *Solution.columns(list(usedSpace.items())))
+                    except BaseException:
+                        await transaction.rollback()
+                        raise
+                    await transaction.commit()
+                    return placement, sorted(unplaced + [photo_id for photo_id in photoIDs if photo_id not in sizes])
+                return {}, photoIDs
+
+            result = await withRetries(work)
+            if result[0]:
+                await noteWrite(conn)
+    except Exception:
+        result = {}, photoIDs
+    await invalidate("disk", set(result[0].values()))
+    return result
+
+
+async def averagePhotosSizeOnDisk(diskID: int) -> float:
+    try:
+        return await fetchValue(Statements.AVERAGE_PHOTOS_SIZE_ON_DISK, diskID)
+    except Exception:
+        return -1
+
+
+async def getTotalRamOnDisk(diskID: int) -> int:
+    try:
+        result = await fetchValue(Statements.TOTAL_RAM_ON_DISK, diskID)
+        return 0 if result is None else result
+    except Exception:
+        return -1
+
+
+async def getCostForDescription(description: str) -> int:
+    try:
+        return await fetchValue(Statements.COST_FOR_DESCRIPTION, description)
+    except Exception:
+        return -1
+
+
+async def ids(statement: Statements.Statement, *params) -> List[int]:
+    try:
+        return [row[0] for row in await fetch(statement, *params)]
+    except Exception:
+        return []
+
+
+async def getPhotosCanBeAddedToDisk(diskID: int, k: int = 5) -> List[int]:
+    return await ids(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK, diskID, k)
+
+
+async def getPhotosCanBeAddedToDiskAndRAM(diskID: int, k: int = 5) -> List[int]:
+    return await ids(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_AND_RAM, diskID, k)
+
+
+async def isCompanyExclusive(diskID: int) -> bool:
+    try:
+        return await fetchValue(Statements.IS_COMPANY_EXCLUSIVE, diskID)
+    except Exception:
+        return False
+
+
+async def isDiskContainingAtLeastNumExists(description: str, num: int) -> bool:
+    try:
+        return await fetchValue(Statements.DISK_CONTAINING_AT_LEAST_NUM_EXISTS, description, num)
+    except Exception:
+        return False
+
+
+async def getDisksContainingTheMostData() -> List[int]:
+    return await ids(Statements.DISKS_CONTAINING_THE_MOST_DATA)
+
+
+async def getConflictingDisks() -> List[int]:
+    return await ids(Statements.CONFLICTING_DISKS)
+
+
+async def mostAvailableDisks() -> List[int]:
+    return await ids(Statements.MOST_AVAILABLE_DISKS)
+
+
+async def rebuildPhotoCoOccurrence() -> ReturnValue:
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(Solution.REBUILD_PHOTO_CO_OCCURRENCE)
+            await noteWrite(conn)
+        return ReturnValue.OK
+    except Exception:
+        return ReturnValue.ERROR
+
+
+async def setClosePhotosStrategy(strategy: str) -> ReturnValue:
+    """Solution.setClosePhotosStrategy: the strategy is the state of the PhotoInDisk co-occurrence triggers."""
+    if strategy not in (Solution.CLOSE_PHOTOS_QUERY, Solution.CLOSE_PHOTOS_PRECOMPUTED):
+        return ReturnValue.BAD_PARAMS
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                if strategy == Solution.CLOSE_PHOTOS_PRECOMPUTED:
+                    await conn.execute(Solution.ENABLE_CO_OCCURRENCE)
+                    await conn.execute(Solution.REBUILD_PHOTO_CO_OCCURRENCE)
+                else:
+                    await conn.execute(Solution.DISABLE_CO_OCCURRENCE)
+            await noteWrite(conn)
+        return ReturnValue.OK
+    except Exception:
+        return ReturnValue.ERROR
+
+
+async def getClosePhotos(photoID: int) -> List[int]:
+    return await ids(Statements.CLOSE_PHOTOS_CURRENT, photoID)
+
+
+async def streamIDs(statement: Statements.Statement, *params, fetchSize: Optional[int] = None) -> AsyncIterator[int]:
+    """
+    Solution.streamIDs with an asyncpg cursor: the page statement with no boundary and no limit, fetchSize rows per
+    round trip. The connection stays acquired until the generator is exhausted or closed; an error ends the stream.
+    """
+    try:
+        pool = await getPool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(statement.typedText, *params, None, None,
+                                             prefetch=fetchSize or Solution.STREAM_FETCH_SIZE):
+                    yield row[0]
+    except Exception:
+        return
+
+
+def streamConflictingDisks(fetchSize: Optional[int] = None) -> AsyncIterator[int]:
+    return streamIDs(Statements.CONFLICTING_DISKS_PAGE, fetchSize=fetchSize)
+
+
+def streamPhotosCanBeAddedToDisk(diskID: int, fetchSize: Optional[int] = None) -> AsyncIterator[int]:
+    return streamIDs(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_PAGE, diskID, fetchSize=fetchSize)
+
+
+def streamPhotosCanBeAddedToDiskAndRAM(diskID: int, fetchSize: Optional[int] = None) -> AsyncIterator[int]:
+    return streamIDs(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_AND_RAM_PAGE, diskID, fetchSize=fetchSize)
+
+
+def streamDisksContainingTheMostData(fetchSize: Optional[int] = None) -> AsyncIterator[int]:
+    return streamIDs(Statements.DISKS_CONTAINING_THE_MOST_DATA_PAGE, fetchSize=fetchSize)
+
+
+def streamClosePhotos(photoID: int, fetchSize: Optional[int] = None) -> AsyncIterator[int]:
+    return streamIDs(Statements.CLOSE_PHOTOS_CURRENT_PAGE, photoID, fetchSize=fetchSize)
+
+
+async def getConflictingDisksPage(after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return await ids(Statements.CONFLICTING_DISKS_PAGE, after_id, limit)
+
+
+async def getPhotosCanBeAddedToDiskPage(diskID: int, after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return await ids(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_PAGE, diskID, after_id, limit)
+
+
+async def getPhotosCanBeAddedToDiskAndRAMPage(diskID: int, after_id: Optional[int] = None,
+                                              limit: int = 100) -> List[int]:
+    return await ids(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_AND_RAM_PAGE, diskID, after_id, limit)
+
+
+async def getDisksContainingTheMostDataPage(after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return await ids(Statements.DISKS_CONTAINING_THE_MOST_DATA_PAGE, after_id, limit)
+
+
+async def getClosePhotosPage(photoID: int, after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return await ids(Statements.CLOSE_PHOTOS_CURRENT_PAGE, photoID, after_id, limit)
+
+
+async def gatherMany(function: Callable[..., Awaitable], arguments: Iterable, concurrency: int = 50) -> list:
+    """
+    Runs function(argument) for every argument with at most `concurrency` calls in flight and returns the results
+    in argument order, e.g. await gatherMany(getPhotoByID, photoIDs). Tuples are unpacked into positional arguments.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(argument):
+        async with semaphore:
+            if isinstance(argument, tuple):
+                return await function(*argument)
+            return await function(argument)
+
+    return await asyncio.gather(*(call(argument) for argument in arguments))
@@ -0,0 +1,46 @@
+"""
+Chooses the implementation behind the Solution API: "postgres" is Solution.py, "memory" is
+MemorySolution.MemoryEngine, "sharded" is Solution.py over the databases of Sharding. The choice comes from
+configureBackend() or, when nothing was configured, from the SOLUTION_BACKEND environment variable. Code that
+imports Backend instead of Solution calls whichever is selected, e.g. Backend.addPhoto(photo).
+"""
+import os
+
+POSTGRES = "postgres"
+MEMORY = "memory"
+SHARDED = "sharded"
+BACKENDS = (POSTGRES, MEMORY, SHARDED)
+
+_name = None
+_backend = None
+
+
+def configureBackend(name: str = POSTGRES):
+    global _name, _backend
+    if name not in BACKENDS:
+        raise ValueError("unknown backend {}".format(name))
+    _name = name
+    _backend = None
+
+
+def backendName() -> str:
+    return _name or os.environ.get("SOLUTION_BACKEND", POSTGRES)
+
+
+def get():
+    global _backend
+    if _backend is None:
+        if backendName() == MEMORY:
+            import MemorySolution
+            _backend = MemorySolution.MemoryEngine()
+        elif backendName() == SHARDED:
+            import Sharding
+            _backend = Sharding
+        else:
+            import Solution
+            _backend = Solution
+    return _backend
+
+
+def __getattr__(name: str):
+    return getattr(get(), name)
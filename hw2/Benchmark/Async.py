@@ -0,0 +1,108 @@
+"""
+Native asyncio calls (AsyncSolution on an asyncpg pool) against the synchronous API offloaded with
+asyncio.to_thread, at 1, 10 and 100 concurrent callers. The id caches are disabled so every call hits the database.
+
+    python -m Benchmark.Async --disks 200 --photos 5000 --duration 5
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable
+
+import AsyncSolution
+import Cache
+import ConnectionPool
+import Solution
+from Benchmark.Concurrency import populate
+from Benchmark.Harness import printTable, summarize
+
+
+async def runConcurrentAsync(call: Callable[[int, int], Awaitable], concurrency: int, duration: float) -> dict:
+    """The asyncio counterpart of Harness.runConcurrent: `concurrency` tasks call call(task, iteration) in a loop."""
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int):
+        iteration = 0
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            try:
+                await call(index, iteration)
+            except Exception:
+                errors[index] += 1
+            latencies[index].append(time.perf_counter() - began)
+            iteration += 1
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - began
+    return summarize([latency for samples in latencies for latency in samples], elapsed, sum(errors))
+
+
+async def measure(args):
+    def photoID() -> int:
+        return random.randint(1, args.photos)
+
+    def diskID() -> int:
+        return random.randint(1, args.disks)
+
+    async def nativeGetPhoto(task: int, iteration: int):
+        await AsyncSolution.getPhotoByID(photoID())
+
+    async def threadGetPhoto(task: int, iteration: int):
+        await asyncio.to_thread(Solution.getPhotoByID, photoID())
+
+    async def nativeClosePhotos(task: int, iteration: int):
+        await AsyncSolution.getClosePhotos(photoID())
+
+    async def threadClosePhotos(task: int, iteration: int):
+        await asyncio.to_thread(Solution.getClosePhotos, photoID())
+
+    async def nativeCanBeAdded(task: int, iteration: int):
+        await AsyncSolution.getPhotosCanBeAddedToDiskAndRAM(diskID())
+
+    async def threadCanBeAdded(task: int, iteration: int):
+        await asyncio.to_thread(Solution.getPhotosCanBeAddedToDiskAndRAM, diskID())
+
+    for title, call in [("getPhotoByID, asyncpg", nativeGetPhoto), ("getPhotoByID, to_thread", threadGetPhoto),
+                        ("getClosePhotos, asyncpg", nativeClosePhotos),
+                        ("getClosePhotos, to_thread", threadClosePhotos),
+                        ("getPhotosCanBeAddedToDiskAndRAM, asyncpg", nativeCanBeAdded),
+                        ("getPhotosCanBeAddedToDiskAndRAM, to_thread", threadCanBeAdded)]:
+        rows = []
+        for concurrency in args.concurrency:
+            row = await runConcurrentAsync(call, concurrency, args.duration)
+            row["tasks"] = concurrency
+            rows.append(row)
+        printTable(title, rows, "tasks")
+        print()
+    await AsyncSolution.closePool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--disks", type=int, default=200)
+    parser.add_argument("--photos", type=int, default=5000)
+    parser.add_argument("--copies", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--pool-size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # both sides get the same number of server connections; to_thread is additionally capped by the executor
+    ConnectionPool.configurePool(minSize=1, maxSize=args.pool_size)
+    populate(args.disks, args.photos, args.copies, args.seed)
+    Cache.configureCaches(maxSize=0)
+
+    async def run():
+        await AsyncSolution.configurePool(minSize=1, maxSize=args.pool_size)
+        await measure(args)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
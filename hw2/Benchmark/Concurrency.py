@@ -0,0 +1,112 @@
+"""
+Throughput of getClosePhotos and removePhotoFromDisk as the number of parallel callers grows.
+The per-call-DDL versions the two functions used to run are measured next to them for comparison.
+
+    python -m Benchmark.Concurrency --disks 200 --photos 5000 --duration 5
+"""
+import argparse
+import random
+
+import ConnectionPool
+import Solution
+from Benchmark.Harness import makeDisk, makePhoto, printTable, runConcurrent
+
+LEGACY_CLOSE_PHOTOS = """
+    CREATE OR REPLACE VIEW "PhotoNotSavedOnSomeDisk" AS
+    SELECT NOT EXISTS (SELECT * FROM "PhotoInDisk" WHERE "PhotoInDisk".photo_id = {photo_id});
+    CREATE OR REPLACE VIEW "DisksPhotoSavedOn" AS
+    SELECT "PhotoInDisk".disk_id FROM "PhotoInDisk" WHERE "PhotoInDisk".photo_id = {photo_id};
+    (SELECT DISTINCT PID.photo_id FROM "PhotoInDisk" PID
+    WHERE PID.disk_id IN (SELECT * FROM "DisksPhotoSavedOn") AND PID.photo_id <> {photo_id}
+    GROUP BY PID.photo_id
+    HAVING COUNT(PID.photo_id) >= (SELECT COUNT(*) FROM "DisksPhotoSavedOn")  * 0.5
+    ORDER BY PID.photo_id ASC
+    LIMIT 10)
+    UNION ALL
+    (SELECT "Photo".id FROM "Photo" WHERE (SELECT * FROM "PhotoNotSavedOnSomeDisk") AND "Photo".id <> {photo_id}
+    ORDER BY "Photo".id ASC LIMIT 10);
+"""
+
+LEGACY_REMOVE_PHOTO_FROM_DISK = """
+    CREATE OR REPLACE VIEW "PhotoSize" AS
+    SELECT COALESCE(
+    (
+        SELECT "Photo".disk_size_needed
+        FROM "Photo"
+        INNER JOIN "PhotoInDisk"
+        ON "PhotoInDisk".disk_id = {disk_id} AND "Photo".id = "PhotoInDisk".photo_id AND "Photo".id = {photo_id}
+    ), 0);
+    UPDATE "Disk" set free_space=free_space + (SELECT * FROM "PhotoSize") where id = {disk_id};
+    DELETE FROM "PhotoInDisk" where Photo_id = {photo_id} and disk_id = {disk_id};
+"""
+
+
+def runLegacy(query: str):
+    conn = ConnectionPool.getConnection()
+    try:
+        conn.execute(query)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def populate(disks: int, photos: int, copies: int, seed: int):
+    generator = random.Random(seed)
+    Solution.dropTables()
+    Solution.createTables()
+    Solution.addDisks(makeDisk(disk_id, "company", generator.randint(1, 100), 10 ** 9, 1)
+                      for disk_id in range(1, disks + 1))
+    Solution.addPhotos(makePhoto(photo_id, "photo", generator.randint(1, 1000)) for photo_id in range(1, photos + 1))
+    placements = []
+    for photo_id in range(1, photos + 1):
+        photo = Solution.getPhotoByID(photo_id)
+        for disk_id in generator.sample(range(1, disks + 1), copies):
+            placements.append((photo, disk_id))
+    Solution.addPhotosToDisk(placements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--disks", type=int, default=200)
+    parser.add_argument("--photos", type=int, default=5000)
+    parser.add_argument("--copies", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ConnectionPool.configurePool(minSize=1, maxSize=max(args.threads))
+    populate(args.disks, args.photos, args.copies, args.seed)
+
+    def closePhotos(thread: int, iteration: int):
+        Solution.getClosePhotos(random.randint(1, args.photos))
+
+    def legacyClosePhotos(thread: int, iteration: int):
+        runLegacy(LEGACY_CLOSE_PHOTOS.format(photo_id=random.randint(1, args.photos)))
+
+    # threads work on disjoint photos, so the write runs measure catalog locking rather than row conflicts
+    def photoOf(thread: int, iteration: int) -> int:
+        return 1 + (thread + iteration * max(args.threads)) % args.photos
+
+    def removePhoto(thread: int, iteration: int):
+        photo_id = photoOf(thread, iteration)
+        Solution.removePhotoFromDisk(makePhoto(photo_id, "photo", 0), random.randint(1, args.disks))
+
+    def legacyRemovePhoto(thread: int, iteration: int):
+        runLegacy(LEGACY_REMOVE_PHOTO_FROM_DISK.format(photo_id=photoOf(thread, iteration),
+                                                       disk_id=random.randint(1, args.disks)))
+
+    for title, call in [("getClosePhotos", closePhotos), ("getClosePhotos, per-call views", legacyClosePhotos),
+                        ("removePhotoFromDisk", removePhoto),
+                        ("removePhotoFromDisk, per-call view", legacyRemovePhoto)]:
+        rows = []
+        for threads in args.threads:
+            row = runConcurrent(call, threads, args.duration)
+            row["threads"] = threads
+            rows.append(row)
+        printTable(title, rows, "threads")
+        print()
+
+
+if __name__ == "__main__":
+    main()
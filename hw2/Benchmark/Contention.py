@@ -0,0 +1,117 @@
+"""
+Stress test of concurrent placement: many threads add photos to a few hot disks, place photos on any disk with
+room, and remove photos again. Reports throughput and the result codes per operation, then checks that no disk's
+free_space went negative (sampled while the load runs) and that every disk's free_space still equals its capacity
+minus the sizes of the photos saved on it.
+
+    python -m Benchmark.Contention --disks 50 --hot 4 --photos 20000 --duration 10
+"""
+import argparse
+import random
+import threading
+from collections import Counter
+
+import ConnectionPool
+import Solution
+from Benchmark.Harness import makeDisk, makePhoto, printTable, runConcurrent
+
+DRIFT_QUERY = """
+    SELECT "Disk".id, "Disk".free_space, %(capacity)s - COALESCE(SUM("Photo".disk_size_needed), 0)
+    FROM "Disk"
+    LEFT JOIN "PhotoInDisk" ON "PhotoInDisk".disk_id = "Disk".id
+    LEFT JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
+    GROUP BY "Disk".id
+    HAVING "Disk".free_space <> %(capacity)s - COALESCE(SUM("Photo".disk_size_needed), 0)
+"""
+
+
+def query(text: str) -> list:
+    conn = ConnectionPool.getConnection()
+    try:
+        _, entries = conn.execute(text)
+        return entries.rows
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+class FreeSpaceMonitor(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.minimum = None
+        self.samples = 0
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            value = query('SELECT MIN(free_space) FROM "Disk"')[0][0]
+            self.minimum = value if self.minimum is None else min(self.minimum, value)
+            self.samples += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--disks", type=int, default=50)
+    parser.add_argument("--hot", type=int, default=4, help="disks addPhotoToDisk/removePhotoFromDisk aim at")
+    parser.add_argument("--capacity", type=int, default=100000)
+    parser.add_argument("--photos", type=int, default=20000)
+    parser.add_argument("--max-size", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ConnectionPool.configurePool(minSize=1, maxSize=max(args.threads) + 2)
+    generator = random.Random(args.seed)
+    Solution.dropTables()
+    Solution.createTables()
+    Solution.addDisks(makeDisk(disk_id, "company", 1, args.capacity, 1) for disk_id in range(1, args.disks + 1))
+    photos = [makePhoto(photo_id, "photo", generator.randint(0, args.max_size))
+              for photo_id in range(1, args.photos + 1)]
+    Solution.addPhotos(photos)
+
+    results = {"addPhotoToDisk": Counter(), "addPhotoToAnyDisk": Counter(), "removePhotoFromDisk": Counter()}
+    lock = threading.Lock()
+
+    def record(operation: str, result):
+        with lock:
+            results[operation][result.name] += 1
+
+    def mixed(thread: int, iteration: int):
+        photo = random.choice(photos)
+        choice = random.random()
+        if choice < 0.4:
+            record("addPhotoToDisk", Solution.addPhotoToDisk(photo, random.randint(1, args.hot)))
+        elif choice < 0.7:
+            record("addPhotoToAnyDisk", Solution.addPhotoToAnyDisk(photo)[0])
+        else:
+            record("removePhotoFromDisk", Solution.removePhotoFromDisk(photo, random.randint(1, args.hot)))
+
+    monitor = FreeSpaceMonitor(0.05)
+    monitor.start()
+    rows = []
+    for threads in args.threads:
+        row = runConcurrent(mixed, threads, args.duration)
+        row["threads"] = threads
+        rows.append(row)
+    monitor.stopped.set()
+    monitor.join()
+
+    printTable("mixed placement load", rows, "threads")
+    print()
+    for operation, counts in results.items():
+        print("{:<22} {}".format(operation, ", ".join("{} {}".format(name, n) for name, n in counts.most_common())))
+    print("retries: {retries}, retries exhausted: {exhausted}".format(**Solution.retryStats))
+    print("lowest free_space in {} samples: {}".format(monitor.samples, monitor.minimum))
+
+    drifted = query(DRIFT_QUERY % {"capacity": args.capacity})
+    for disk_id, free_space, expected in drifted:
+        print("disk {}: free_space {} but {} expected".format(disk_id, free_space, expected))
+    if drifted or (monitor.minimum is not None and monitor.minimum < 0):
+        raise SystemExit(1)
+    print("free_space consistent on all {} disks".format(args.disks))
+
+
+if __name__ == "__main__":
+    main()
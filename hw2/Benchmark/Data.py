@@ -0,0 +1,119 @@
+"""
+Seeded synthetic data for the benchmarks: disks, photos, RAMs, photo placements and RAM attachments.
+Descriptions and disk popularity follow a Zipf distribution and photo sizes a log-normal one, so a few descriptions
+and disks dominate, as in production, instead of the uniform data a naive generator produces.
+Everything is a function of the spec, so the same spec always loads the same database.
+"""
+import math
+import random
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Iterator, List, Tuple
+
+import Solution
+from Benchmark.Harness import makeDisk, makePhoto, makeRAM
+
+COMPANIES = ["Seagate", "Western Digital", "Toshiba", "Samsung", "Kingston", "Crucial"]
+
+
+class DataSpec:
+    """
+    photos is the scale; disks and RAMs default to one per 100 photos. Each photo is saved on `copies` disks on
+    average and disks are sized so that the placements fill about `fill` of their space.
+    """
+
+    def __init__(self, photos: int = 10000, disks: int = None, rams: int = None, descriptions: int = 1000,
+                 copies: float = 2.0, ramsPerDisk: float = 2.0, meanSize: int = 500, sizeSigma: float = 1.0,
+                 zipf: float = 1.1, fill: float = 0.7, seed: int = 0):
+        self.photos = photos
+        self.disks = disks if disks is not None else max(10, photos // 100)
+        self.rams = rams if rams is not None else max(10, photos // 100)
+        self.descriptions = descriptions
+        self.copies = copies
+        self.ramsPerDisk = ramsPerDisk
+        self.meanSize = meanSize
+        self.sizeSigma = sizeSigma
+        self.zipf = zipf
+        self.fill = fill
+        self.seed = seed
+
+    def rows(self) -> int:
+        return self.photos + self.disks + self.rams + int(self.photos * self.copies + self.disks * self.ramsPerDisk)
+
+    def asDict(self) -> dict:
+        return dict(vars(self))
+
+
+class ZipfSampler:
+    def __init__(self, n: int, exponent: float, generator: random.Random):
+        self.weights = list(accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+        self.generator = generator
+
+    def sample(self, generator: random.Random = None) -> int:
+        """A rank in 1..n, rank 1 being the most frequent; generator overrides the sampler's own."""
+        draw = (generator or self.generator).random()
+        return bisect_left(self.weights, draw * self.weights[-1]) + 1
+
+
+def photoSize(spec: DataSpec, generator: random.Random) -> int:
+    mu = math.log(spec.meanSize) - spec.sizeSigma ** 2 / 2
+    return max(0, min(2 ** 31 - 1, int(generator.lognormvariate(mu, spec.sizeSigma))))
+
+
+def generatePhotos(spec: DataSpec) -> Iterator[Tuple[int, str, int, List[int]]]:
+    """(photo_id, description, size, disk ids) per photo, disks drawn by popularity."""
+    generator = random.Random(spec.seed)
+    descriptions = ZipfSampler(spec.descriptions, spec.zipf, generator)
+    disks = ZipfSampler(spec.disks, spec.zipf, generator)
+    for photo_id in range(1, spec.photos + 1):
+        copies = min(spec.disks, int(spec.copies) + (generator.random() < spec.copies - int(spec.copies)))
+        diskIDs = set()
+        while len(diskIDs) < copies:
+            diskIDs.add(disks.sample())
+        yield photo_id, "description {}".format(descriptions.sample()), photoSize(spec, generator), sorted(diskIDs)
+
+
+def diskCapacities(spec: DataSpec) -> List[int]:
+    """Room per disk for everything generatePhotos places on it, plus 1 - fill of slack."""
+    used = [0] * (spec.disks + 1)
+    for _, _, size, diskIDs in generatePhotos(spec):
+        for disk_id in diskIDs:
+            used[disk_id] += size
+    return [min(2 ** 31 - 1, int(bytes / spec.fill) + spec.meanSize) for bytes in used]
+
+
+def load(spec: DataSpec, chunkSize: int = 10000, progress=None):
+    """Recreates the schema and loads the spec through the batch API."""
+    Solution.dropTables()
+    Solution.createTables()
+    generator = random.Random(spec.seed + 1)
+    capacities = diskCapacities(spec)
+    Solution.addDisks(makeDisk(disk_id, COMPANIES[disk_id % len(COMPANIES)], generator.randint(1, 1000),
+                               capacities[disk_id], generator.randint(1, 100)) for disk_id in range(1, spec.disks + 1))
+    Solution.addRAMs(makeRAM(ram_id, generator.choice(COMPANIES), generator.randint(1, spec.meanSize * 4))
+                     for ram_id in range(1, spec.rams + 1))
+    attachments = set()
+    for _ in range(int(spec.disks * spec.ramsPerDisk)):
+        attachments.add((generator.randint(1, spec.rams), generator.randint(1, spec.disks)))
+    for ram_id, disk_id in sorted(attachments):
+        Solution.addRAMToDisk(ram_id, disk_id)
+
+    chunk = []
+    loaded = 0
+    for row in generatePhotos(spec):
+        chunk.append(row)
+        if len(chunk) == chunkSize:
+            loadPhotos(chunk)
+            loaded += len(chunk)
+            chunk = []
+            if progress is not None:
+                progress(loaded, spec.photos)
+    if chunk:
+        loadPhotos(chunk)
+
+
+def loadPhotos(chunk: List[Tuple[int, str, int, List[int]]]):
+    photos = [makePhoto(photo_id, description, size) for photo_id, description, size, _ in chunk]
+    Solution.addPhotos(photos)
+    Solution.addPhotosToDisk((photo, disk_id) for photo, (_, _, _, diskIDs) in zip(photos, chunk)
+                             for disk_id in diskIDs)
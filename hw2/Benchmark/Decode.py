@@ -0,0 +1,109 @@
+"""
+Row decoding on the read path: objects decoded per second and peak traced memory for
+- the old path, a dict per row (entries[0].values()) and then the Business object setters
+- the row tuple straight into the setters (photoFromRow)
+- Views named tuples, no Business object at all
+on synthetic rows, and with --database also end to end: getPhotoByID per id against getPhotosByIDs, with and
+without views. The id caches are disabled for the database runs so every call reads the rows.
+
+    python -m Benchmark.Decode --rows 100000
+    python -m Benchmark.Decode --rows 100000 --database
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from typing import Callable, List
+
+import Cache
+import Solution
+import Views
+from Benchmark.Harness import makeDisk, makePhoto
+
+PHOTO_COLUMNS = ("id", "description", "disk_size_needed")
+DISK_COLUMNS = ("id", "manufacturing_company", "speed", "free_space", "cost_per_byte")
+
+
+def measure(name: str, decode: Callable[[], List], objects: int) -> dict:
+    """Runs decode once untraced for its speed and once under tracemalloc for its peak memory."""
+    began = time.perf_counter()
+    result = decode()
+    elapsed = time.perf_counter() - began
+    del result
+    tracemalloc.start()
+    result = decode()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"decoder": name, "objects": objects, "seconds": elapsed,
+            "objects_per_second": objects / elapsed if elapsed else 0.0, "peak_mb": peak / 2 ** 20}
+
+
+def printRows(title: str, rows: List[dict]):
+    print(title)
+    print("{:>28} {:>10} {:>10} {:>14} {:>10}".format("decoder", "objects", "seconds", "objects/s", "peak MB"))
+    for row in rows:
+        print("{:>28} {:>10} {:>10.3f} {:>14.0f} {:>10.2f}".format(
+            row["decoder"], row["objects"], row["seconds"], row["objects_per_second"], row["peak_mb"]))
+
+
+def syntheticRows(count: int, seed: int):
+    generator = random.Random(seed)
+    photos = [(photo_id, "description {}".format(generator.randint(1, 1000)), generator.randint(0, 10000))
+              for photo_id in range(1, count + 1)]
+    disks = [(disk_id, "company", generator.randint(1, 100), generator.randint(0, 10 ** 6), generator.randint(1, 20))
+             for disk_id in range(1, count + 1)]
+    return photos, disks
+
+
+def decodeSynthetic(args) -> List[dict]:
+    photos, disks = syntheticRows(args.rows, args.seed)
+    return [
+        measure("photo dict + setters",
+                lambda: [Solution.photoFromRow(tuple(dict(zip(PHOTO_COLUMNS, row)).values())) for row in photos],
+                len(photos)),
+        measure("photo tuple + setters", lambda: [Solution.photoFromRow(row) for row in photos], len(photos)),
+        measure("photo view", lambda: [Views.PhotoView._make(row) for row in photos], len(photos)),
+        measure("disk dict + setters",
+                lambda: [Solution.diskFromRow(tuple(dict(zip(DISK_COLUMNS, row)).values())) for row in disks],
+                len(disks)),
+        measure("disk tuple + setters", lambda: [Solution.diskFromRow(row) for row in disks], len(disks)),
+        measure("disk view", lambda: [Views.DiskView._make(row) for row in disks], len(disks)),
+    ]
+
+
+def decodeDatabase(args) -> List[dict]:
+    Solution.dropTables()
+    Solution.createTables()
+    Solution.addPhotos(makePhoto(photo_id, "photo", photo_id % 1000) for photo_id in range(1, args.rows + 1))
+    Solution.addDisks(makeDisk(disk_id, "company", 1, 1000, 1) for disk_id in range(1, args.rows // 100 + 2))
+    before = Cache.photos.maxSize, Cache.photos.ttl
+    Cache.configureCaches(maxSize=0)
+    photoIDs = list(range(1, args.rows + 1))
+    singles = photoIDs[:args.singles]
+    try:
+        return [
+            measure("getPhotoByID per id", lambda: [Solution.getPhotoByID(photo_id) for photo_id in singles],
+                    len(singles)),
+            measure("getPhotosByIDs", lambda: Solution.getPhotosByIDs(photoIDs), len(photoIDs)),
+            measure("getPhotosByIDs views", lambda: Solution.getPhotosByIDs(photoIDs, views=True), len(photoIDs)),
+        ]
+    finally:
+        Cache.configureCaches(*before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--singles", type=int, default=5000, help="ids read one call at a time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", action="store_true", help="also decode rows read from the database")
+    args = parser.parse_args()
+
+    printRows("decoding {} synthetic rows".format(args.rows), decodeSynthetic(args))
+    if args.database:
+        printRows("reading {} photos".format(args.rows), decodeDatabase(args))
+
+
+if __name__ == "__main__":
+    main()
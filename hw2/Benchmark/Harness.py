@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from Business.Disk import Disk
+from Business.Photo import Photo
+from Business.RAM import RAM
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> dict:
+    return {
+        "calls": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def runConcurrent(call: Callable[[int, int], object], threads: int, duration: float) -> dict:
+    """
+    Runs call(thread_index, iteration) from `threads` threads for `duration` seconds
+    and returns the call count, throughput and latency percentiles.
+    """
+    latencies = [[] for _ in range(threads)]
+    errors = [0] * threads
+    start = threading.Barrier(threads + 1)
+    stop = threading.Event()
+
+    def worker(index: int):
+        start.wait()
+        iteration = 0
+        while not stop.is_set():
+            began = time.perf_counter()
+            try:
+                call(index, iteration)
+            except Exception:
+                errors[index] += 1
+            latencies[index].append(time.perf_counter() - began)
+            iteration += 1
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    return summarize([latency for samples in latencies for latency in samples], elapsed, sum(errors))
+
+
+def runWeighted(operations: List[Tuple[str, float, Callable[[random.Random], object]]], threads: int,
+                duration: float, seed: int = 0) -> Dict[str, dict]:
+    """
+    Like runConcurrent, but each iteration picks one of the (name, weight, call(generator)) operations by weight.
+    Returns a summary per operation name plus "total" for the whole mix; every thread has its own seeded generator.
+    """
+    names = [name for name, _, _ in operations]
+    weights = [weight for _, weight, _ in operations]
+    calls = {name: call for name, _, call in operations}
+    latencies = [{name: [] for name in names} for _ in range(threads)]
+    errors = [{name: 0 for name in names} for _ in range(threads)]
+    start = threading.Barrier(threads + 1)
+    stop = threading.Event()
+
+    def worker(index: int):
+        generator = random.Random(seed * 1000 + index)
+        start.wait()
+        while not stop.is_set():
+            name = generator.choices(names, weights)[0]
+            began = time.perf_counter()
+            try:
+                calls[name](generator)
+            except Exception:
+                errors[index][name] += 1
+            latencies[index][name].append(time.perf_counter() - began)
+
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    result = {name: summarize([latency for samples in latencies for latency in samples[name]], elapsed,
+                              sum(counts[name] for counts in errors)) for name in names}
+    result["total"] = summarize([latency for samples in latencies for name in names for latency in samples[name]],
+                                elapsed, sum(sum(counts.values()) for counts in errors))
+    return result
+
+
+def printTable(title: str, rows: List[dict], key: str):
+    print(title)
+    print("{:>10} {:>10} {:>12} {:>10} {:>10} {:>10}".format(key, "calls", "calls/s", "p50 ms", "p95 ms", "p99 ms"))
+    for row in rows:
+        print("{:>10} {:>10} {:>12.1f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+            row[key], row["calls"], row["throughput"], row["p50_ms"], row["p95_ms"], row["p99_ms"]))
+
+
+def makePhoto(photoID: int, description: str, size: int) -> Photo:
+    photo = Photo.badPhoto()
+    photo.setPhotoID(photoID)
+    photo.setDescription(description)
+    photo.setSize(size)
+    return photo
+
+
+def makeDisk(diskID: int, company: str, speed: int, freeSpace: int, cost: int) -> Disk:
+    disk = Disk.badDisk()
+    disk.setDiskID(diskID)
+    disk.setCompany(company)
+    disk.setSpeed(speed)
+    disk.setFreeSpace(freeSpace)
+    disk.setCost(cost)
+    return disk
+
+
+def makeRAM(ramID: int, company: str, size: int) -> RAM:
+    ram = RAM.badRAM()
+    ram.setRamID(ramID)
+    ram.setCompany(company)
+    ram.setSize(size)
+    return ram
@@ -0,0 +1,97 @@
+"""
+placePhotos against the naive placement loop (try addPhotoToDisk on each disk in turn until one accepts the photo).
+Every run starts from the same freshly generated disks and photos and reports the placement rate and how well the
+disks were packed: photos and bytes placed, fill ratio, and the average cost_per_byte of the placed bytes.
+
+    python -m Benchmark.Packing --disks 200 --photos 20000
+"""
+import argparse
+import random
+import time
+
+import ConnectionPool
+import Placement
+import Solution
+from Benchmark.Harness import makeDisk, makePhoto, makeRAM
+from Utility.ReturnValue import ReturnValue
+
+
+def populate(args) -> dict:
+    generator = random.Random(args.seed)
+    Solution.dropTables()
+    Solution.createTables()
+    disks = [makeDisk(disk_id, "company", generator.randint(1, 100), generator.randint(0, args.capacity),
+                      generator.randint(1, 20)) for disk_id in range(1, args.disks + 1)]
+    Solution.addDisks(disks)
+    Solution.addRAMs(makeRAM(disk_id, "company", generator.randint(1, args.max_size))
+                     for disk_id in range(1, args.disks + 1))
+    for disk_id in range(1, args.disks + 1):
+        Solution.addRAMToDisk(disk_id, disk_id)
+    # skewed sizes: many small photos, a few large ones
+    sizes = {photo_id: min(args.max_size, int(generator.paretovariate(1.2))) for photo_id in range(1, args.photos + 1)}
+    Solution.addPhotos(makePhoto(photo_id, "photo", size) for photo_id, size in sizes.items())
+    return sizes
+
+
+def quality(sizes: dict, placement: dict, elapsed: float) -> dict:
+    conn = ConnectionPool.getConnection()
+    try:
+        _, entries = conn.execute('SELECT id, cost_per_byte FROM "Disk"')
+        costs = dict(entries.rows)
+        _, entries = conn.execute('SELECT SUM(free_space) FROM "Disk"')
+        free = entries.rows[0][0] or 0
+    finally:
+        conn.rollback()
+        conn.close()
+    placedBytes = sum(sizes[photo_id] for photo_id in placement)
+    cost = sum(sizes[photo_id] * costs[disk_id] for photo_id, disk_id in placement.items())
+    return {"photos": len(placement), "bytes": placedBytes, "seconds": elapsed,
+            "rate": len(placement) / elapsed if elapsed else 0.0,
+            "fill": placedBytes / (placedBytes + free) if placedBytes + free else 0.0,
+            "cost": cost / placedBytes if placedBytes else 0.0}
+
+
+def naive(args, sizes: dict) -> dict:
+    placement = {}
+    began = time.perf_counter()
+    for photo_id, size in sizes.items():
+        photo = makePhoto(photo_id, "photo", size)
+        for disk_id in range(1, args.disks + 1):
+            if Solution.addPhotoToDisk(photo, disk_id) == ReturnValue.OK:
+                placement[photo_id] = disk_id
+                break
+    return quality(sizes, placement, time.perf_counter() - began)
+
+
+def planned(args, sizes: dict, strategy: str, respectRAM: bool) -> dict:
+    began = time.perf_counter()
+    placement, _ = Solution.placePhotos(sizes.keys(), strategy, respectRAM)
+    return quality(sizes, placement, time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--disks", type=int, default=200)
+    parser.add_argument("--photos", type=int, default=20000)
+    parser.add_argument("--capacity", type=int, default=2000)
+    parser.add_argument("--max-size", type=int, default=1000)
+    parser.add_argument("--skip-naive", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    runs = [("placePhotos {}{}".format(strategy, ", RAM" if respectRAM else ""),
+             lambda sizes, strategy=strategy, respectRAM=respectRAM: planned(args, sizes, strategy, respectRAM))
+            for respectRAM in (False, True) for strategy in Placement.STRATEGIES]
+    if not args.skip_naive:
+        runs.insert(0, ("addPhotoToDisk loop", lambda sizes: naive(args, sizes)))
+
+    print("{:<40} {:>8} {:>12} {:>10} {:>12} {:>8} {:>10}".format(
+        "", "photos", "bytes", "seconds", "photos/s", "fill", "cost/byte"))
+    for title, run in runs:
+        row = run(populate(args))
+        print("{:<40} {:>8} {:>12} {:>10.2f} {:>12.1f} {:>8.3f} {:>10.2f}".format(
+            title, row["photos"], row["bytes"], row["seconds"], row["rate"], row["fill"], row["cost"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Latency and throughput of every API function at several data scales, alone and in the read/write profiles of
+Benchmark.Workloads. Each scale is generated by Benchmark.Data and loaded into the local database first.
+Results are saved as JSON; with --baseline, every p95 and throughput is compared against a stored run and
+the exit code is 1 when any of them regressed by more than --tolerance.
+
+    python -m Benchmark.Runner --scales 10000 100000 --output results.json
+    python -m Benchmark.Runner --scales 10000 100000 --baseline results.json --output current.json
+"""
+import argparse
+import json
+import platform
+import time
+from typing import Dict, List, Tuple
+
+from Benchmark import Data, Workloads
+from Benchmark.Harness import runWeighted
+
+
+def progress(loaded: int, total: int):
+    print("  loaded {}/{} photos".format(loaded, total), flush=True)
+
+
+def runScale(args, photos: int) -> dict:
+    spec = Data.DataSpec(photos=photos, descriptions=args.descriptions, copies=args.copies, zipf=args.zipf,
+                         seed=args.seed)
+    print("scale {} photos, {} rows".format(photos, spec.rows()), flush=True)
+    began = time.perf_counter()
+    Data.load(spec, progress=progress)
+    result = {"spec": spec.asDict(), "rows": spec.rows(), "load_seconds": time.perf_counter() - began,
+              "functions": {}, "profiles": {}}
+
+    workload = Workloads.Workload(spec)
+    for name, (_, call) in workload.operations().items():
+        if args.functions and name not in args.functions:
+            continue
+        result["functions"][name] = runWeighted([(name, 1.0, call)], args.threads, args.duration, args.seed)[name]
+    printRows("functions at {} photos".format(photos), result["functions"])
+
+    for profile in args.profiles:
+        result["profiles"][profile] = runWeighted(workload.mix(profile), args.threads, args.duration, args.seed)
+        printRows("{} profile at {} photos".format(profile, photos), result["profiles"][profile])
+    return result
+
+
+def printRows(title: str, rows: Dict[str, dict]):
+    print(title)
+    print("{:>36} {:>8} {:>7} {:>10} {:>9} {:>9} {:>9}".format("function", "calls", "errors", "calls/s",
+                                                              "p50 ms", "p95 ms", "p99 ms"))
+    for name, row in rows.items():
+        print("{:>36} {:>8} {:>7} {:>10.1f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            name, row["calls"], row["errors"], row["throughput"], row["p50_ms"], row["p95_ms"], row["p99_ms"]))
+
+
+def summaries(results: dict) -> Dict[str, dict]:
+    """Every summary in a saved run, keyed by scale/functions/name or scale/profile/name."""
+    flat = {}
+    for scale, run in results["scales"].items():
+        for name, row in run["functions"].items():
+            flat["{}/functions/{}".format(scale, name)] = row
+        for profile, rows in run["profiles"].items():
+            for name, row in rows.items():
+                flat["{}/{}/{}".format(scale, profile, name)] = row
+    return flat
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[Tuple[str, str, float, float]]:
+    """
+    (key, metric, baseline, current) for every p95 that grew or throughput that fell by more than tolerance.
+    Keys that only one of the runs has are skipped.
+    """
+    regressions = []
+    before = summaries(baseline)
+    for key, row in summaries(current).items():
+        if key not in before or not row["calls"] or not before[key]["calls"]:
+            continue
+        old = before[key]
+        if row["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append((key, "p95_ms", old["p95_ms"], row["p95_ms"]))
+        if row["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append((key, "throughput", old["throughput"], row["throughput"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000, 1000000, 10000000],
+                        help="photo counts; disks and RAMs are one per 100 photos")
+    parser.add_argument("--profiles", nargs="*", default=list(Workloads.PROFILES),
+                        choices=list(Workloads.PROFILES))
+    parser.add_argument("--functions", nargs="*", default=None, help="only these functions (default: all)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per function and per profile")
+    parser.add_argument("--descriptions", type=int, default=1000)
+    parser.add_argument("--copies", type=float, default=2.0)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    results = {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "threads": args.threads,
+        "duration": args.duration,
+        "scales": {str(photos): runScale(args, photos) for photos in args.scales},
+    }
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+    print("saved {}".format(args.output))
+
+    if args.baseline is not None:
+        with open(args.baseline) as stored:
+            baseline = json.load(stored)
+        regressions = compare(baseline, results, args.tolerance)
+        for key, metric, old, new in regressions:
+            print("regression {} {}: {:.2f} -> {:.2f}".format(key, metric, old, new))
+        if regressions:
+            raise SystemExit(1)
+        print("no regressions beyond {:.0%} against {}".format(args.tolerance, args.baseline))
+
+
+if __name__ == "__main__":
+    main()
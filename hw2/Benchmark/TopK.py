@@ -0,0 +1,109 @@
+"""
+getPhotosCanBeAddedToDisk and getPhotosCanBeAddedToDiskAndRAM against the join-and-sort queries they replaced, over
+disks whose free space lets a given fraction of the photos fit, from nearly full disks to empty ones. Each disk has
+one RAM of its free space, so both bounds are the same. Latencies are per call; the results of the two queries
+are compared on every disk and the exit code is 1 when they differ.
+
+    python -m Benchmark.TopK --photos 1000000 --ratios 0.0001 0.001 0.01 0.1 0.5 1 --k 5
+"""
+import argparse
+import random
+import time
+from typing import Callable, List
+
+import ConnectionPool
+import Solution
+import Statements
+from Benchmark import Data
+from Benchmark.Harness import makeDisk, makePhoto, makeRAM, summarize
+
+# the queries before the indexed top-k path, with the LIMIT 5 turned into the k parameter; not registered,
+# so they are prepared under their own names only by this benchmark
+JOIN_AND_SORT = Statements.Statement("photos_can_be_added_to_disk_join_and_sort", ["integer", "bigint"], """
+    SELECT "Photo".id FROM "Disk" INNER JOIN "Photo" ON "Photo".disk_size_needed <= "Disk".free_space
+    WHERE "Disk".id = $1 ORDER BY "Photo".id DESC LIMIT $2
+""")
+
+JOIN_AND_SORT_AND_RAM = Statements.Statement("photos_can_be_added_to_disk_and_ram_join_and_sort",
+                                             ["integer", "bigint"], """
+    SELECT "Photo".id FROM "Disk"
+    INNER JOIN "DiskRAMStats" ON "DiskRAMStats".disk_id = "Disk".id
+    INNER JOIN "Photo" ON "Photo".disk_size_needed <= "Disk".free_space
+    AND "Photo".disk_size_needed <= "DiskRAMStats".total_ram
+    WHERE "Disk".id = $1
+    ORDER BY "Photo".id ASC
+    LIMIT $2
+""")
+
+
+def joinAndSort(statement: Statements.Statement, diskID: int, k: int) -> List[int]:
+    conn = ConnectionPool.getConnection()
+    try:
+        _, entries = Statements.execute(conn, statement, diskID, k)
+        return [row[0] for row in entries.rows]
+    finally:
+        conn.close()
+
+
+def populate(args) -> List[int]:
+    """Loads the photos and one disk per ratio, disk i + 1 for ratios[i], and returns their free space."""
+    spec = Data.DataSpec(photos=args.photos, seed=args.seed)
+    generator = random.Random(args.seed)
+    sizes = [Data.photoSize(spec, generator) for _ in range(args.photos)]
+    Solution.dropTables()
+    Solution.createTables()
+    Solution.addPhotos(makePhoto(photo_id, "photo", size) for photo_id, size in enumerate(sizes, 1))
+    ordered = sorted(sizes)
+    freeSpace = [ordered[max(0, min(len(ordered), round(ratio * len(ordered))) - 1)] for ratio in args.ratios]
+    Solution.addDisks(makeDisk(disk_id, "company", 1, free, 1) for disk_id, free in enumerate(freeSpace, 1))
+    Solution.addRAMs(makeRAM(ram_id, "company", free) for ram_id, free in enumerate(freeSpace, 1))
+    for disk_id in range(1, len(freeSpace) + 1):
+        Solution.addRAMToDisk(disk_id, disk_id)
+    return freeSpace
+
+
+def timeCalls(call: Callable[[], List[int]], calls: int) -> dict:
+    latencies = []
+    began = time.perf_counter()
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=200000)
+    parser.add_argument("--ratios", type=float, nargs="+", default=[0.0001, 0.001, 0.01, 0.1, 0.5, 1.0],
+                        help="fractions of the photos that fit on each disk")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--calls", type=int, default=200, help="calls per disk and query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    freeSpace = populate(args)
+    queries = [
+        ("getPhotosCanBeAddedToDisk", lambda diskID: Solution.getPhotosCanBeAddedToDisk(diskID, args.k)),
+        ("join and sort", lambda diskID: joinAndSort(JOIN_AND_SORT, diskID, args.k)),
+        ("getPhotosCanBeAddedToDiskAndRAM", lambda diskID: Solution.getPhotosCanBeAddedToDiskAndRAM(diskID, args.k)),
+        ("join and sort, RAM", lambda diskID: joinAndSort(JOIN_AND_SORT_AND_RAM, diskID, args.k)),
+    ]
+    print("{:>8} {:>10} {:>34} {:>10} {:>10} {:>10}".format("ratio", "free", "query", "p50 ms", "p95 ms", "calls/s"))
+    mismatches = []
+    for diskID, (ratio, free) in enumerate(zip(args.ratios, freeSpace), 1):
+        results = [call(diskID) for _, call in queries]
+        if results[0] != results[1] or results[2] != results[3]:
+            mismatches.append((ratio, results))
+        for name, call in queries:
+            row = timeCalls(lambda: call(diskID), args.calls)
+            print("{:>8} {:>10} {:>34} {:>10.3f} {:>10.3f} {:>10.1f}".format(ratio, free, name, row["p50_ms"],
+                                                                            row["p95_ms"], row["throughput"]))
+    for ratio, results in mismatches:
+        print("ratio {}: results differ {}".format(ratio, results))
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Operations over a loaded DataSpec and the read/write mixes that combine them.
+Ids are drawn with the same Zipf skew the data was generated with, so hot disks and photos stay hot;
+new photos, disks and RAMs get ids above the generated ranges, so the loaded rows are never deleted by a run.
+"""
+import random
+from itertools import count
+from typing import Callable, Dict, List, Tuple
+
+import Solution
+from Benchmark.Data import COMPANIES, DataSpec, ZipfSampler
+from Benchmark.Harness import makeDisk, makePhoto, makeRAM
+from Business.Photo import Photo
+from Utility.ReturnValue import ReturnValue
+
+READ = "read"
+WRITE = "write"
+
+PROFILES = {
+    "read-heavy": {READ: 0.95, WRITE: 0.05},
+    "mixed": {READ: 0.5, WRITE: 0.5},
+    "write-heavy": {READ: 0.1, WRITE: 0.9},
+}
+
+
+class Workload:
+    def __init__(self, spec: DataSpec):
+        self.spec = spec
+        # the samplers only hold cumulative weights here; every call passes its thread's generator
+        self.disks = ZipfSampler(spec.disks, spec.zipf, None)
+        self.descriptions = ZipfSampler(spec.descriptions, spec.zipf, None)
+        self.newPhotoIDs = count(spec.photos + 1)
+        self.newDiskIDs = count(spec.disks + 1)
+        self.newRAMIDs = count(spec.rams + 1)
+        # photos created by the workload, placed on and removed from disks by the other writes
+        self.createdPhotos: List[Photo] = []
+
+    def diskID(self, generator: random.Random) -> int:
+        return self.disks.sample(generator)
+
+    def description(self, generator: random.Random) -> str:
+        return "description {}".format(self.descriptions.sample(generator))
+
+    def photoID(self, generator: random.Random) -> int:
+        return generator.randint(1, self.spec.photos)
+
+    def ramID(self, generator: random.Random) -> int:
+        return generator.randint(1, self.spec.rams)
+
+    def newPhoto(self, generator: random.Random) -> Photo:
+        return makePhoto(next(self.newPhotoIDs), self.description(generator), generator.randint(0, self.spec.meanSize))
+
+    def createdPhoto(self, generator: random.Random) -> Photo:
+        """A photo added by this workload, or a not yet added one before the first addPhoto."""
+        if not self.createdPhotos:
+            return self.newPhoto(generator)
+        return generator.choice(self.createdPhotos)
+
+    def addPhoto(self, generator: random.Random):
+        photo = self.newPhoto(generator)
+        if Solution.addPhoto(photo) == ReturnValue.OK:
+            self.createdPhotos.append(photo)
+
+    def addPhotoToDisk(self, generator: random.Random):
+        Solution.addPhotoToDisk(self.createdPhoto(generator), self.diskID(generator))
+
+    def removePhotoFromDisk(self, generator: random.Random):
+        Solution.removePhotoFromDisk(self.createdPhoto(generator), self.diskID(generator))
+
+    def addDisk(self, generator: random.Random):
+        Solution.addDisk(makeDisk(next(self.newDiskIDs), generator.choice(COMPANIES), generator.randint(1, 1000),
+                                  generator.randint(0, self.spec.meanSize * 100), generator.randint(1, 100)))
+
+    def addRAM(self, generator: random.Random):
+        Solution.addRAM(makeRAM(next(self.newRAMIDs), generator.choice(COMPANIES),
+                                generator.randint(1, self.spec.meanSize * 4)))
+
+    def operations(self) -> Dict[str, Tuple[str, Callable[[random.Random], object]]]:
+        """Every benchmarked API function as name -> (READ or WRITE, call(generator))."""
+        return {
+            "getPhotoByID": (READ, lambda generator: Solution.getPhotoByID(self.photoID(generator))),
+            "getDiskByID": (READ, lambda generator: Solution.getDiskByID(self.diskID(generator))),
+            "getRAMByID": (READ, lambda generator: Solution.getRAMByID(self.ramID(generator))),
+            "averagePhotosSizeOnDisk":
+                (READ, lambda generator: Solution.averagePhotosSizeOnDisk(self.diskID(generator))),
+            "getTotalRamOnDisk": (READ, lambda generator: Solution.getTotalRamOnDisk(self.diskID(generator))),
+            "getCostForDescription":
+                (READ, lambda generator: Solution.getCostForDescription(self.description(generator))),
+            "getPhotosCanBeAddedToDisk":
+                (READ, lambda generator: Solution.getPhotosCanBeAddedToDisk(self.diskID(generator))),
+            "getPhotosCanBeAddedToDiskAndRAM":
+                (READ, lambda generator: Solution.getPhotosCanBeAddedToDiskAndRAM(self.diskID(generator))),
+            "isCompanyExclusive": (READ, lambda generator: Solution.isCompanyExclusive(self.diskID(generator))),
+            "isDiskContainingAtLeastNumExists":
+                (READ, lambda generator: Solution.isDiskContainingAtLeastNumExists(self.description(generator),
+                                                                                  generator.randint(1, 20))),
+            "getDisksContainingTheMostData": (READ, lambda generator: Solution.getDisksContainingTheMostData()),
+            "getConflictingDisks": (READ, lambda generator: Solution.getConflictingDisks()),
+            "mostAvailableDisks": (READ, lambda generator: Solution.mostAvailableDisks()),
+            "getClosePhotos": (READ, lambda generator: Solution.getClosePhotos(self.photoID(generator))),
+            "addPhoto": (WRITE, self.addPhoto),
+            "addPhotoToDisk": (WRITE, self.addPhotoToDisk),
+            "removePhotoFromDisk": (WRITE, self.removePhotoFromDisk),
+            "addDisk": (WRITE, self.addDisk),
+            "addRAM": (WRITE, self.addRAM),
+            "addRAMToDisk":
+                (WRITE, lambda generator: Solution.addRAMToDisk(self.ramID(generator), self.diskID(generator))),
+            "removeRAMFromDisk":
+                (WRITE, lambda generator: Solution.removeRAMFromDisk(self.ramID(generator), self.diskID(generator))),
+        }
+
+    def mix(self, profile: str) -> List[Tuple[str, float, Callable[[random.Random], object]]]:
+        """The profile's read and write shares, each split evenly over the functions of that kind."""
+        operations = self.operations()
+        shares = PROFILES[profile]
+        kinds = {kind: sum(1 for operationKind, _ in operations.values() if operationKind == kind) for kind in shares}
+        return [(name, shares[kind] / kinds[kind], call) for name, (kind, call) in operations.items()]
+
@@ -0,0 +1,228 @@
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import ConnectionPool
+import Migrations
+import Utility.DBConnector as Connector
+from psycopg2 import sql
+
+MISSING = object()
+
+# also named in Migrations.CACHE_NOTIFY
+CHANNEL = "solution_cache"
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU map with an optional time-to-live.
+    Values are rows (or None for an id known not to exist), never Business objects, so callers cannot mutate
+    what other callers will read.
+    A reader takes version() before going to the database and passes it to put(); if anything was invalidated
+    in between, the possibly stale row is not stored.
+    """
+
+    def __init__(self, maxSize: int = 10000, ttl: Optional[float] = None):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, storedAt = entry
+            if self.ttl is not None and time.monotonic() - storedAt > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version: int):
+        with self._lock:
+            if version != self._version or self.maxSize <= 0:
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys: Iterable):
+        with self._lock:
+            self._version += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries), "maxSize": self.maxSize, "hits": self.hits, "misses": self.misses,
+                    "hitRate": self.hits / lookups if lookups else 0.0, "evictions": self.evictions,
+                    "expirations": self.expirations, "invalidations": self.invalidations}
+
+
+# off until configureCaches, see there
+photos = LRUCache(maxSize=0)
+disks = LRUCache(maxSize=0)
+rams = LRUCache(maxSize=0)
+
+CACHES = {"photo": photos, "disk": disks, "ram": rams}
+
+_listener = None
+notify = False
+
+
+def configureCaches(maxSize: int = 10000, ttl: Optional[float] = None):
+    """
+    Turns the row caches on with room for maxSize rows each, maxSize=0 turns them off again; they start off.
+    Writes through this module invalidate this process' caches, but a write by any other process or connection
+    leaves the cached row stale: until the ttl runs out, or for good without one. So without a ttl the caches are
+    only coherent while every writer goes through this module in this process, or after enableNotifications.
+    """
+    for cache in CACHES.values():
+        with cache._lock:
+            cache.maxSize = maxSize
+            cache.ttl = ttl
+        cache.clear()
+
+
+def stats() -> dict:
+    return {kind: cache.stats() for kind, cache in CACHES.items()}
+
+
+def invalidateLocal(kind: str, ids: Iterable):
+    CACHES[kind].invalidate(ids)
+
+
+def publishWrites(conn):
+    """
+    Enables the triggers that NOTIFY every write to Photo, Disk and RAM from the writing transaction, see
+    Migrations.CACHE_NOTIFY, and commits. They hold for every process on the database until the tables are dropped.
+    """
+    _, entries = conn.execute(Migrations.CACHE_TRIGGERS_DISABLED)
+    if entries.rows[0][0]:
+        conn.execute(Migrations.ENABLE_CACHE_TRIGGERS)
+    conn.commit()
+
+
+_collected = threading.local()
+
+
+def collectInvalidations() -> list:
+    """
+    Starts recording the invalidations made on this thread into the returned list, as (kind, ids), until
+    stopCollecting(). Used when the writes behind them only become visible at a later commit.
+    """
+    _collected.invalidations = []
+    return _collected.invalidations
+
+
+def stopCollecting():
+    _collected.invalidations = None
+
+
+def invalidate(kind: str, ids: Iterable):
+    ids = [key for key in ids if key is not None]
+    invalidateLocal(kind, ids)
+    collected = getattr(_collected, "invalidations", None)
+    if collected is not None:
+        collected.append((kind, ids))
+
+
+def clearAll():
+    for cache in CACHES.values():
+        cache.clear()
+
+
+def handle(payload: str):
+    kind, _, ids = payload.partition(":")
+    if kind == "all":
+        for cache in CACHES.values():
+            cache.clear()
+    elif kind in CACHES:
+        invalidateLocal(kind, [int(key) for key in ids.split(",") if key])
+
+
+class Listener(threading.Thread):
+    """
+    Background LISTEN on the cache channel, so invalidations published by other processes
+    reach this process' caches. Uses a dedicated session outside the pool, in autocommit mode.
+    """
+
+    def __init__(self, pollInterval: float = 1.0):
+        super().__init__(daemon=True)
+        self.pollInterval = pollInterval
+        self.stopped = threading.Event()
+        self.connector = Connector.DBConnector()
+        self.connection = self.connector.connection
+        self.connection.autocommit = True
+        self.connection.cursor().execute(sql.SQL("LISTEN {}").format(sql.Identifier(CHANNEL)))
+
+    def run(self):
+        while not self.stopped.is_set():
+            if select.select([self.connection], [], [], self.pollInterval) == ([], [], []):
+                continue
+            self.connection.poll()
+            while self.connection.notifies:
+                handle(self.connection.notifies.pop(0).payload)
+        self.connector.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def enableNotifications(pollInterval: float = 1.0):
+    """
+    Has every write to the cached tables NOTIFY the ids it changed, whichever process makes it, and applies the
+    notifications to this process' caches. createTables enables the triggers again while this is on.
+    """
+    global _listener, notify
+    conn = None
+    try:
+        conn = ConnectionPool.getConnection()
+        publishWrites(conn)
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        raise
+    finally:
+        if conn is not None:
+            conn.close()
+    if _listener is None:
+        _listener = Listener(pollInterval)
+        _listener.start()
+    notify = True
+
+
+def disableNotifications():
+    """Stops applying notifications here; the triggers keep publishing for the other processes on the database."""
+    global _listener, notify
+    notify = False
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,262 @@
+import threading
+import time
+from typing import Callable, Iterator, List, Optional
+
+import Instrumentation
+import psycopg2
+import Utility.DBConnector as Connector
+from Utility.Exceptions import DatabaseException
+
+
+def sqlState(error: BaseException) -> Optional[str]:
+    """DBConnector re-raises psycopg2 errors as DatabaseException, the SQLSTATE stays on the chained original."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        code = getattr(error, "pgcode", None)
+        if code:
+            return code
+        error = error.__cause__ or error.__context__
+    return None
+
+
+class DSNConnector(Connector.DBConnector):
+    """
+    A DBConnector for the server named by a libpq connection string instead of database.ini,
+    e.g. "host=localhost port=5433 dbname=hw2 user=postgres", for pools over several servers (see Sharding).
+    DBConnector is built the usual way and its session is then swapped for one on dsn, so execute/commit/rollback
+    and their DatabaseException mapping stay DBConnector's. That costs one extra handshake with the database.ini
+    server per session opened, which the pools pay once per session, not per call.
+    """
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        try:
+            connection = psycopg2.connect(dsn)
+        finally:
+            super().close()
+        try:
+            connection.autocommit = False
+            cursor = connection.cursor()
+        except Exception:
+            connection.close()
+            raise
+        self.dsn = dsn
+        self.connection = connection
+        self.cursor = cursor
+
+
+class PooledConnection:
+    """
+    Wraps a DBConnector borrowed from a ConnectionPool.
+    execute/commit/rollback are forwarded to the connector, close() gives it back to the pool
+    instead of tearing down the session, so the code in Solution.py can keep its
+    conn = ... / conn.close() shape.
+    """
+
+    def __init__(self, pool, connector):
+        self.pool = pool
+        self.connector = connector
+        self.lastUsed = time.monotonic()
+        self.borrowed = False
+        # names of the statements PREPAREd on this session, see Statements.StatementRegistry
+        self.prepared = set()
+
+    def execute(self, query):
+        return Instrumentation.execute(self, query)
+
+    def commit(self):
+        Instrumentation.call(self, self.connector.commit)
+
+    def rollback(self):
+        Instrumentation.call(self, self.connector.rollback)
+
+    def close(self):
+        if self.borrowed:
+            self.pool.release(self)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DBConnector sessions.
+    minSize sessions are opened eagerly, up to maxSize are opened on demand.
+    A session that sat idle for more than healthCheckAfter seconds is pinged before it is handed out,
+    and every session is rolled back and has its settings reset when it is returned.
+    """
+
+    def __init__(self, factory: Callable = Connector.DBConnector, minSize: int = 1, maxSize: int = 10,
+                 timeout: float = 30.0, healthCheckAfter: float = 1.0, resetQuery: str = "RESET ALL"):
+        if minSize < 0 or maxSize < 1 or minSize > maxSize:
+            raise ValueError("pool sizes must satisfy 0 <= minSize <= maxSize and maxSize >= 1")
+        self.factory = factory
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.timeout = timeout
+        self.healthCheckAfter = healthCheckAfter
+        self.resetQuery = resetQuery
+        self._idle: List[PooledConnection] = []
+        self._size = 0
+        self._closed = False
+        self._lock = threading.Condition()
+        for _ in range(minSize):
+            self._idle.append(self._open())
+
+    def _open(self) -> PooledConnection:
+        conn = PooledConnection(self, self.factory())
+        self._size += 1
+        return conn
+
+    def _discard(self, conn: PooledConnection):
+        try:
+            conn.connector.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def _isHealthy(self, conn: PooledConnection) -> bool:
+        if time.monotonic() - conn.lastUsed < self.healthCheckAfter:
+            return True
+        try:
+            conn.connector.execute("SELECT 1")
+            conn.connector.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getConnection(self) -> PooledConnection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise DatabaseException.ConnectionInvalid("connection pool is closed")
+                    if self._idle:
+                        conn = self._idle.pop()
+                        break
+                    if self._size < self.maxSize:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._lock.wait(remaining):
+                        raise DatabaseException.ConnectionInvalid("timed out waiting for a pooled connection")
+            if conn is None:
+                # the slot was reserved above, the handshake itself happens outside the lock
+                try:
+                    conn = PooledConnection(self, self.factory())
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._isHealthy(conn):
+                self._discard(conn)
+                continue
+            conn.borrowed = True
+            return conn
+
+    def release(self, conn: PooledConnection):
+        conn.borrowed = False
+        try:
+            conn.connector.rollback()
+            if self.resetQuery:
+                conn.connector.execute(self.resetQuery)
+                conn.connector.commit()
+        except Exception:
+            self._discard(conn)
+            return
+        conn.lastUsed = time.monotonic()
+        with self._lock:
+            if self._closed:
+                closing = True
+            else:
+                closing = False
+                self._idle.append(conn)
+                self._lock.notify()
+        if closing:
+            self._discard(conn)
+
+    def closeAll(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self._size, "idle": len(self._idle), "minSize": self.minSize, "maxSize": self.maxSize}
+
+
+_pool: Optional[ConnectionPool] = None
+_poolLock = threading.Lock()
+
+
+def configurePool(minSize: int = 1, maxSize: int = 10, timeout: float = 30.0, healthCheckAfter: float = 1.0,
+                  factory: Callable = Connector.DBConnector) -> ConnectionPool:
+    global _pool
+    with _poolLock:
+        old, _pool = _pool, ConnectionPool(factory=factory, minSize=minSize, maxSize=maxSize, timeout=timeout,
+                                           healthCheckAfter=healthCheckAfter)
+    if old is not None:
+        old.closeAll()
+    return _pool
+
+
+def getPool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _poolLock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+_bound = threading.local()
+
+
+def bindThread(provider: Optional[Callable[[], object]]) -> Optional[Callable[[], object]]:
+    """
+    While a provider is bound, getConnection() on this thread returns provider() instead of borrowing from the pool,
+    e.g. UnitOfWork.Session hands out savepoints on its own connection. None unbinds it.
+    Returns the provider bound before, so a caller can put it back when it is done.
+    """
+    previous = getattr(_bound, "provider", None)
+    _bound.provider = provider
+    return previous
+
+
+def boundProvider() -> Optional[Callable[[], object]]:
+    return getattr(_bound, "provider", None)
+
+
+_END = object()
+
+
+def bindStream(provider: Callable[[], object], stream: Iterator) -> Iterator:
+    """
+    The items of a stream from the Solution API with provider bound while each of them is produced,
+    since the stream only asks for its connection when the first item is.
+    """
+    try:
+        while True:
+            previous = bindThread(provider)
+            try:
+                item = next(stream, _END)
+            finally:
+                bindThread(previous)
+            if item is _END:
+                return
+            yield item
+    finally:
+        stream.close()
+
+
+def getConnection() -> PooledConnection:
+    began = time.perf_counter()
+    provider = getattr(_bound, "provider", None)
+    conn = provider() if provider is not None else getPool().getConnection()
+    Instrumentation.observeAcquire(time.perf_counter() - began)
+    return conn
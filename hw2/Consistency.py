@@ -0,0 +1,88 @@
+from typing import Dict, List
+
+import ConnectionPool
+
+# each check returns the keys whose maintained values differ from a full recomputation over the base tables,
+# as (key, maintained values, recomputed values)
+CHECKS = {
+    "DiskUsage": """
+        SELECT "Disk".id, ROW(maintained.used_bytes, maintained.photo_count)::text,
+               ROW(expected.used_bytes, expected.photo_count)::text
+        FROM "Disk"
+        LEFT JOIN "DiskUsage" AS maintained ON maintained.disk_id = "Disk".id
+        LEFT JOIN (
+            SELECT "PhotoInDisk".disk_id, SUM("Photo".disk_size_needed)::bigint AS used_bytes,
+                   COUNT(*)::integer AS photo_count
+            FROM "PhotoInDisk" INNER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
+            GROUP BY "PhotoInDisk".disk_id
+        ) AS expected ON expected.disk_id = "Disk".id
+        WHERE maintained.disk_id IS NULL
+        OR (maintained.used_bytes, maintained.photo_count)
+            <> (COALESCE(expected.used_bytes, 0), COALESCE(expected.photo_count, 0))
+    """,
+    "DescriptionCost": """
+        SELECT COALESCE(costs.description, expected.description), costs.total_cost::text, expected.total_cost::text
+        FROM "DescriptionCost" AS costs
+        FULL OUTER JOIN (
+            SELECT "Photo".description, SUM("Disk".cost_per_byte::bigint * "Photo".disk_size_needed) AS total_cost
+            FROM "PhotoInDisk"
+            INNER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
+            INNER JOIN "Disk" ON "Disk".id = "PhotoInDisk".disk_id
+            GROUP BY "Photo".description
+        ) AS expected ON expected.description = costs.description
+        WHERE COALESCE(costs.total_cost, 0) <> COALESCE(expected.total_cost, 0)
+    """,
+    "PhotoSizeCounts": """
+        SELECT COALESCE(counts.disk_size_needed, expected.disk_size_needed), counts.photo_count::text,
+               expected.photo_count::text
+        FROM "PhotoSizeCounts" AS counts
+        FULL OUTER JOIN (
+            SELECT disk_size_needed, COUNT(*) AS photo_count FROM "Photo" GROUP BY disk_size_needed
+        ) AS expected ON expected.disk_size_needed = counts.disk_size_needed
+        WHERE counts.photo_count IS DISTINCT FROM expected.photo_count
+    """,
+    # emptied blocks are kept at 0
+    "PhotoSizeBlocks": """
+        SELECT ROW(COALESCE(blocks.level, expected.level), COALESCE(blocks.block, expected.block))::text,
+               blocks.photo_count::text, expected.photo_count::text
+        FROM "PhotoSizeBlocks" AS blocks
+        FULL OUTER JOIN (
+            SELECT levels.level, "Photo".disk_size_needed >> levels.level AS block, COUNT(*) AS photo_count
+            FROM "Photo" CROSS JOIN generate_series(1, 31) AS levels (level)
+            GROUP BY levels.level, "Photo".disk_size_needed >> levels.level
+        ) AS expected ON expected.level = blocks.level AND expected.block = blocks.block
+        WHERE COALESCE(blocks.photo_count, 0) <> COALESCE(expected.photo_count, 0)
+    """,
+}
+
+
+def checkAggregates(tables: List[str] = None) -> Dict[str, list]:
+    """
+    Recomputes the maintained aggregate tables from PhotoInDisk, Photo and Disk in one snapshot and returns,
+    per table, the rows that disagree. Empty lists everywhere mean the triggers kept them exact.
+    """
+    if tables is None:
+        tables = list(CHECKS)
+    conn = None
+    result = {}
+    try:
+        conn = ConnectionPool.getConnection()
+        conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        for table in tables:
+            _, entries = conn.execute(CHECKS[table])
+            result[table] = [tuple(row) for row in entries.rows]
+    finally:
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+    return result
+
+
+if __name__ == "__main__":
+    mismatches = {table: rows for table, rows in checkAggregates().items() if rows}
+    for table, rows in sorted(mismatches.items()):
+        for key, maintained, recomputed in rows:
+            print("{} {}: maintained {}, recomputed {}".format(table, key, maintained, recomputed))
+    if mismatches:
+        raise SystemExit(1)
+    print("maintained aggregates match a full recomputation")
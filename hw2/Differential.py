@@ -0,0 +1,194 @@
+"""
+Differential check of MemorySolution against Solution: random operation sequences are applied to both backends
+and every result is compared. Ids come from small ranges so the sequences keep hitting duplicates, missing rows,
+full disks and cascades. With --shards the PostgreSQL side is Sharding over the given databases instead, e.g. over
+several local servers.
+
+    python -m Differential --runs 20 --operations 500 --seed 0
+    python -m Differential --shards "port=5433 dbname=hw2" "port=5434 dbname=hw2" "port=5435 dbname=hw2"
+"""
+import argparse
+import random
+from decimal import Decimal
+from typing import Callable, List, Tuple
+
+import MemorySolution
+import Placement
+import Solution
+from Benchmark.Harness import makeDisk, makePhoto, makeRAM
+from Business.Disk import Disk
+from Business.Photo import Photo
+from Business.RAM import RAM
+
+DESCRIPTIONS = ["landscape", "portrait", "macro"]
+COMPANIES = ["alpha", "beta"]
+
+
+def normalize(value):
+    """Business objects become tuples, AVG's Decimal becomes a rounded float, iterators become lists."""
+    if isinstance(value, Photo):
+        return "Photo", value.getPhotoID(), value.getDescription(), value.getSize()
+    if isinstance(value, Disk):
+        return "Disk", value.getDiskID(), value.getCompany(), value.getSpeed(), value.getFreeSpace(), value.getCost()
+    if isinstance(value, RAM):
+        return "RAM", value.getRamID(), value.getCompany(), value.getSize()
+    if isinstance(value, (float, Decimal)):
+        return round(float(value), 6)
+    if isinstance(value, dict):
+        return sorted((normalize(key), normalize(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if hasattr(value, "__next__"):
+        return [normalize(item) for item in value]
+    return value
+
+
+class Generator:
+    def __init__(self, seed: int, photos: int = 30, disks: int = 8, rams: int = 8):
+        self.random = random.Random(seed)
+        self.photos = photos
+        self.disks = disks
+        self.rams = rams
+
+    def photoID(self) -> int:
+        return self.random.randint(0 if self.random.random() < 0.05 else 1, self.photos)
+
+    def diskID(self) -> int:
+        return self.random.randint(0 if self.random.random() < 0.05 else 1, self.disks)
+
+    def ramID(self) -> int:
+        return self.random.randint(0 if self.random.random() < 0.05 else 1, self.rams)
+
+    def photo(self) -> Photo:
+        # deterministic attributes per id, so most photos passed around match the stored row
+        photo_id = self.photoID()
+        size = (photo_id * 7) % 40 if self.random.random() < 0.9 else self.random.randint(-1, 40)
+        description = DESCRIPTIONS[photo_id % len(DESCRIPTIONS)]
+        return makePhoto(photo_id, description if self.random.random() < 0.95 else None, size)
+
+    def placement(self) -> Tuple[Photo, int]:
+        # now and then an id outside int4, which has to fail only its own pair of a batch
+        if self.random.random() < 0.05:
+            if self.random.random() < 0.5:
+                return makePhoto(2 ** 31, DESCRIPTIONS[0], 1), self.diskID()
+            return self.photo(), 2 ** 31
+        return self.photo(), self.diskID()
+
+    def disk(self) -> Disk:
+        return makeDisk(self.diskID(), self.random.choice(COMPANIES), self.random.randint(0, 5),
+                        self.random.randint(-1, 150), self.random.randint(0, 5))
+
+    def ram(self) -> RAM:
+        return makeRAM(self.ramID(), self.random.choice(COMPANIES), self.random.randint(0, 60))
+
+    def operation(self) -> Tuple[str, tuple]:
+        choice = self.random.random()
+        if choice < 0.12:
+            return "addPhoto", (self.photo(),)
+        if choice < 0.18:
+            return "addDisk", (self.disk(),)
+        if choice < 0.22:
+            return "addRAM", (self.ram(),)
+        if choice < 0.24:
+            return "addDiskAndPhoto", (self.disk(), self.photo())
+        if choice < 0.36:
+            return "addPhotoToDisk", (self.photo(), self.diskID())
+        if choice < 0.40:
+            return "addPhotoToAnyDisk", (self.photo(),)
+        if choice < 0.46:
+            return "removePhotoFromDisk", (self.photo(), self.diskID())
+        if choice < 0.51:
+            return "addRAMToDisk", (self.ramID(), self.diskID())
+        if choice < 0.54:
+            return "removeRAMFromDisk", (self.ramID(), self.diskID())
+        if choice < 0.56:
+            return "deletePhoto", (self.photo(),)
+        if choice < 0.58:
+            return "deleteDisk", (self.diskID(),)
+        if choice < 0.60:
+            return "deleteRAM", (self.ramID(),)
+        if choice < 0.62:
+            return "addPhotosToDisk", ([self.placement() for _ in range(self.random.randint(0, 5))],)
+        if choice < 0.63:
+            return "placePhotos", ([self.photoID() for _ in range(self.random.randint(0, 6))],
+                                   self.random.choice(Placement.STRATEGIES), self.random.random() < 0.5)
+        queries: List[Tuple[str, Callable[[], tuple]]] = [
+            ("getPhotoByID", lambda: (self.photoID(),)),
+            ("getDiskByID", lambda: (self.diskID(),)),
+            ("getRAMByID", lambda: (self.ramID(),)),
+            ("getPhotosByIDs", lambda: ([self.photoID() for _ in range(3)], self.random.random() < 0.5)),
+            ("getDisksByIDs", lambda: ([self.diskID() for _ in range(3)], self.random.random() < 0.5)),
+            ("getRAMsByIDs", lambda: ([self.ramID() for _ in range(3)], self.random.random() < 0.5)),
+            ("averagePhotosSizeOnDisk", lambda: (self.diskID(),)),
+            ("getTotalRamOnDisk", lambda: (self.diskID(),)),
+            ("getCostForDescription", lambda: (self.random.choice(DESCRIPTIONS),)),
+            ("getPhotosCanBeAddedToDisk", lambda: (self.diskID(), self.random.randint(0, 8))),
+            ("getPhotosCanBeAddedToDiskAndRAM", lambda: (self.diskID(), self.random.randint(0, 8))),
+            ("isCompanyExclusive", lambda: (self.diskID(),)),
+            ("isDiskContainingAtLeastNumExists", lambda: (self.random.choice(DESCRIPTIONS), self.random.randint(0, 4))),
+            ("getDisksContainingTheMostData", lambda: ()),
+            ("getConflictingDisks", lambda: ()),
+            ("mostAvailableDisks", lambda: ()),
+            ("getClosePhotos", lambda: (self.photoID(),)),
+            ("getConflictingDisksPage", lambda: (self.diskID(), self.random.randint(0, 4))),
+            ("getPhotosCanBeAddedToDiskPage", lambda: (self.diskID(), self.photoID(), self.random.randint(0, 4))),
+            ("getPhotosCanBeAddedToDiskAndRAMPage",
+             lambda: (self.diskID(), self.photoID(), self.random.randint(0, 4))),
+            ("getDisksContainingTheMostDataPage", lambda: (self.diskID(), self.random.randint(0, 4))),
+            ("getClosePhotosPage", lambda: (self.photoID(), self.photoID(), self.random.randint(0, 4))),
+            ("streamClosePhotos", lambda: (self.photoID(),)),
+            ("streamDisksContainingTheMostData", lambda: ()),
+        ]
+        name, arguments = self.random.choice(queries)
+        return name, arguments()
+
+
+def run(seed: int, operations: int, memory: MemorySolution.MemoryEngine = None, database=Solution) -> List[tuple]:
+    """
+    Returns the first disagreement as [(step, operation, arguments, PostgreSQL result, in-memory result)], or [].
+    The run stops there, since every later step would start from diverged states.
+    """
+    memory = memory or MemorySolution.MemoryEngine()
+    database.clearTables()
+    memory.clearTables()
+    generator = Generator(seed)
+    mismatches = []
+    for step in range(operations):
+        name, arguments = generator.operation()
+        expected = normalize(getattr(database, name)(*arguments))
+        actual = normalize(getattr(memory, name)(*arguments))
+        if expected != actual:
+            mismatches.append((step, name, normalize(arguments), expected, actual))
+            break
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--operations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shards", nargs="*", default=None, help="check Sharding over these connection strings")
+    args = parser.parse_args()
+
+    database = Solution
+    if args.shards:
+        import Sharding
+        Sharding.configureShards(args.shards)
+        database = Sharding
+    database.dropTables()
+    database.createTables()
+    failed = False
+    for seed in range(args.seed, args.seed + args.runs):
+        mismatches = run(seed, args.operations, database=database)
+        for step, name, arguments, expected, actual in mismatches:
+            print("seed {} step {}: {}{} postgres {!r}, memory {!r}".format(seed, step, name, tuple(arguments),
+                                                                         expected, actual))
+        failed = failed or bool(mismatches)
+    if failed:
+        raise SystemExit(1)
+    print("{} runs of {} operations agree".format(args.runs, args.operations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+Per-call instrumentation of the Solution API. Every instrumented call gets a CallRecord with its wall time,
+the time spent in the database and waiting for a pooled connection, the number of round trips, the rows returned
+and affected, and the class of the last error it saw, even when the function swallowed that error and turned it
+into a ReturnValue. Finished records are published to the configured sinks:
+
+    histograms = Instrumentation.HistogramSink()
+    Instrumentation.configureInstrumentation([Instrumentation.LogSink(), histograms,
+                                              Instrumentation.PrometheusFileSink("solution.prom")],
+                                             explainThreshold=0.1, explainSampleRate=0.1)
+
+With explainThreshold set, a sampled query that ran longer than that many seconds is run again under
+EXPLAIN (ANALYZE, BUFFERS) inside a savepoint that is rolled back, and the plan is attached to the record.
+Nothing is recorded while no sink is configured, which is the default.
+"""
+import functools
+import inspect
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from psycopg2 import sql
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "EXECUTE", "VALUES", "TABLE")
+
+# upper bounds in seconds, shared by every histogram so they can be merged and exported as is
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class CallRecord:
+    __slots__ = ("function", "wall_seconds", "db_seconds", "acquire_seconds", "round_trips", "rows_returned",
+                 "rows_affected", "error", "plans", "route")
+
+    def __init__(self, function: str):
+        self.function = function
+        self.wall_seconds = 0.0
+        self.db_seconds = 0.0
+        self.acquire_seconds = 0.0
+        self.round_trips = 0
+        self.rows_returned = 0
+        self.rows_affected = 0
+        self.error: Optional[str] = None
+        # (query, seconds, plan) for the sampled slow queries
+        self.plans: List[Tuple[str, float, str]] = []
+        # where Replicas ran the call, None when no replicas are configured
+        self.route: Optional[str] = None
+
+
+_sinks: list = []
+_explainThreshold: Optional[float] = None
+_explainSampleRate = 1.0
+_local = threading.local()
+
+
+def configureInstrumentation(sinks: list = None, explainThreshold: Optional[float] = None,
+                             explainSampleRate: float = 1.0):
+    """sinks are objects with a record(CallRecord) method; an empty list turns instrumentation off."""
+    global _sinks, _explainThreshold, _explainSampleRate
+    _sinks = list(sinks or [])
+    _explainThreshold = explainThreshold
+    _explainSampleRate = explainSampleRate
+
+
+def current() -> Optional[CallRecord]:
+    return getattr(_local, "record", None)
+
+
+def publish(record: CallRecord):
+    for sink in _sinks:
+        try:
+            sink.record(record)
+        except Exception:
+            logging.getLogger(__name__).exception("instrumentation sink %r failed", sink)
+
+
+def instrumented(function: Callable) -> Callable:
+    """
+    Records every call of function that is not already part of another instrumented call on the same thread,
+    so e.g. addPhoto is recorded once and its addTuple round trips count towards it.
+    A generator returned by function is recorded from the call until it is exhausted or closed.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _sinks or current() is not None:
+            return function(*args, **kwargs)
+        record = CallRecord(name)
+        began = time.perf_counter()
+        _local.record = record
+        streaming = False
+        try:
+            result = function(*args, **kwargs)
+            if inspect.isgenerator(result):
+                streaming = True
+                return stream(record, began, result)
+            return result
+        except BaseException as error:
+            record.error = type(error).__name__
+            raise
+        finally:
+            _local.record = None
+            if not streaming:
+                record.wall_seconds = time.perf_counter() - began
+                publish(record)
+
+    return wrapper
+
+
+def stream(record: CallRecord, began: float, generator):
+    try:
+        while True:
+            outer = current()
+            _local.record = record
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            except BaseException as error:
+                record.error = type(error).__name__
+                raise
+            finally:
+                _local.record = outer
+            yield item
+    finally:
+        generator.close()
+        record.wall_seconds = time.perf_counter() - began
+        publish(record)
+
+
+def instrumentModule(namespace: dict, names: List[str]):
+    """Replaces the named functions of a module, given as its globals(), with their instrumented versions."""
+    for name in names:
+        namespace[name] = instrumented(namespace[name])
+
+
+def noteError(error: BaseException):
+    """For errors a function handles itself without a database round trip failing, e.g. a bad argument."""
+    record = current()
+    if record is not None:
+        record.error = type(error).__name__
+
+
+def observeAcquire(seconds: float):
+    record = current()
+    if record is not None:
+        record.acquire_seconds += seconds
+
+
+def execute(conn, query):
+    """PooledConnection.execute: runs query on conn's connector and accounts for it in the current record."""
+    record = current()
+    if record is None:
+        return conn.connector.execute(query)
+    began = time.perf_counter()
+    try:
+        rows_effected, entries = conn.connector.execute(query)
+    except Exception as error:
+        record.db_seconds += time.perf_counter() - began
+        record.round_trips += 1
+        record.error = type(error).__name__
+        raise
+    seconds = time.perf_counter() - began
+    record.db_seconds += seconds
+    record.round_trips += 1
+    returned = len(getattr(entries, "rows", None) or ())
+    record.rows_returned += returned
+    if not returned and rows_effected is not None and rows_effected > 0:
+        record.rows_affected += rows_effected
+    if _explainThreshold is not None and seconds >= _explainThreshold and random.random() < _explainSampleRate:
+        plan = explain(conn, query)
+        if plan is not None:
+            record.plans.append((plan[0], seconds, plan[1]))
+    return rows_effected, entries
+
+
+def call(conn, method: Callable):
+    """PooledConnection.commit and rollback: a round trip without rows."""
+    record = current()
+    if record is None:
+        return method()
+    began = time.perf_counter()
+    try:
+        return method()
+    finally:
+        record.db_seconds += time.perf_counter() - began
+        record.round_trips += 1
+
+
+# what a sampled query records instead of a plan when it is several statements and the last cannot be explained
+SKIPPED_MULTI_STATEMENT = "skipped: multi-statement, the last statement cannot be explained"
+
+
+def splitStatements(text: str) -> List[str]:
+    """The statements of a query text, split on the semicolons outside quotes, quoted names and $tag$ bodies."""
+    statements = []
+    start = 0
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char in "'\"":
+            # a doubled quote inside is an escaped one, scanning on from it finds the real end
+            end = text.find(char, index + 1)
+            index = len(text) if end < 0 else end + 1
+            continue
+        if char == "$":
+            end = text.find("$", index + 1)
+            tag = text[index:end + 1] if end > 0 else ""
+            if tag and (tag == "$$" or tag[1:-1].isidentifier()):
+                close = text.find(tag, end + 1)
+                index = len(text) if close < 0 else close + len(tag)
+                continue
+        if char == ";":
+            statements.append(text[start:index])
+            start = index + 1
+        index += 1
+    statements.append(text[start:])
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def explain(conn, query) -> Optional[Tuple[str, str]]:
+    """
+    (query text, plan) for a query whose last statement PostgreSQL can EXPLAIN, or None. The statements before it,
+    e.g. the SAVEPOINT a UnitOfWork session puts in front of every call, already ran in the transaction and are
+    not explained; when the last statement of several cannot be, the plan is SKIPPED_MULTI_STATEMENT.
+    ANALYZE runs the statement again, so it runs inside a savepoint that is always rolled back.
+    """
+    try:
+        text = query if isinstance(query, str) else query.as_string(conn.connector.connection)
+    except Exception:
+        return None
+    statements = splitStatements(text)
+    if not statements:
+        return None
+    last = statements[-1]
+    if last.split(None, 1)[0].upper() not in EXPLAINABLE:
+        return (text.strip(), SKIPPED_MULTI_STATEMENT) if len(statements) > 1 else None
+    try:
+        conn.connector.execute("SAVEPOINT instrumentation_explain")
+    except Exception:
+        return None
+    plan = None
+    try:
+        _, entries = conn.connector.execute(sql.SQL("EXPLAIN (ANALYZE, BUFFERS) {}").format(sql.SQL(last)))
+        plan = "\n".join(row[0] for row in entries.rows)
+    except Exception:
+        pass
+    try:
+        conn.connector.execute("ROLLBACK TO SAVEPOINT instrumentation_explain")
+        conn.connector.execute("RELEASE SAVEPOINT instrumentation_explain")
+    except Exception:
+        return None
+    return (last, plan) if plan is not None else None
+
+
+class LogSink:
+    """One log line per call, plus one per captured plan."""
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("Solution")
+        self.level = level
+
+    def record(self, record: CallRecord):
+        self.logger.log(self.level, "%s wall=%.3fms db=%.3fms acquire=%.3fms round_trips=%d rows_returned=%d "
+                                    "rows_affected=%d error=%s route=%s", record.function, record.wall_seconds * 1000,
+                        record.db_seconds * 1000, record.acquire_seconds * 1000, record.round_trips,
+                        record.rows_returned, record.rows_affected, record.error or "-", record.route or "-")
+        for query, seconds, plan in record.plans:
+            self.logger.log(self.level, "%s slow query (%.3fms): %s\n%s", record.function, seconds * 1000, query, plan)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, fraction: float) -> float:
+        """The upper bound of the bucket holding the fraction-th observation, inf past the last bucket."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[index] if index < len(BUCKETS) else float("inf")
+        return 0.0
+
+
+class HistogramSink:
+    """In-memory registry: wall, database and acquire time histograms and row, round trip and error counters."""
+
+    TIMINGS = ("wall_seconds", "db_seconds", "acquire_seconds")
+    COUNTERS = ("round_trips", "rows_returned", "rows_affected")
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str], int] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: CallRecord):
+        with self._lock:
+            for timing in self.TIMINGS:
+                key = (record.function, timing)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].observe(getattr(record, timing))
+            for counter in self.COUNTERS:
+                key = (record.function, counter)
+                self.counters[key] = self.counters.get(key, 0) + getattr(record, counter)
+            if record.error is not None:
+                key = (record.function, record.error)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Per function: calls, p50/p95/p99 bucket bounds of each timing, the counters and errors by class."""
+        with self._lock:
+            result = {}
+            for (function, timing), histogram in self.histograms.items():
+                entry = result.setdefault(function, {"calls": histogram.count, "errors": {}})
+                entry[timing] = {"sum": histogram.sum, "p50": histogram.percentile(0.50),
+                                 "p95": histogram.percentile(0.95), "p99": histogram.percentile(0.99)}
+            for (function, counter), value in self.counters.items():
+                result[function][counter] = value
+            for (function, error), value in self.errors.items():
+                result[function]["errors"][error] = value
+            return result
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.errors.clear()
+
+    def prometheusText(self, prefix: str = "solution") -> str:
+        names = {"wall_seconds": "call_seconds", "db_seconds": "db_seconds", "acquire_seconds": "acquire_seconds"}
+        lines = []
+        with self._lock:
+            for timing in self.TIMINGS:
+                metric = "{}_{}".format(prefix, names[timing])
+                lines.append("# TYPE {} histogram".format(metric))
+                for (function, name), histogram in sorted(self.histograms.items()):
+                    if name != timing:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{{function="{}",le="{}"}} {}'.format(metric, function, bound,
+                                                                                    cumulative))
+                    lines.append('{}_sum{{function="{}"}} {}'.format(metric, function, histogram.sum))
+                    lines.append('{}_count{{function="{}"}} {}'.format(metric, function, histogram.count))
+            for counter in self.COUNTERS:
+                metric = "{}_{}_total".format(prefix, counter)
+                lines.append("# TYPE {} counter".format(metric))
+                for (function, name), value in sorted(self.counters.items()):
+                    if name == counter:
+                        lines.append('{}{{function="{}"}} {}'.format(metric, function, value))
+            metric = "{}_errors_total".format(prefix)
+            lines.append("# TYPE {} counter".format(metric))
+            for (function, error), value in sorted(self.errors.items()):
+                lines.append('{}{{function="{}",error="{}"}} {}'.format(metric, function, error, value))
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusFileSink(HistogramSink):
+    """
+    A HistogramSink that also writes its metrics in the Prometheus text format to path, e.g. for the node
+    exporter's textfile collector. The file is replaced atomically at most every interval seconds, and by write().
+    """
+
+    def __init__(self, path: str, interval: float = 10.0, prefix: str = "solution"):
+        super().__init__()
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self.written = 0.0
+
+    def record(self, record: CallRecord):
+        super().record(record)
+        if time.monotonic() - self.written >= self.interval:
+            self.write()
+
+    def write(self):
+        self.written = time.monotonic()
+        temporary = "{}.{}.tmp".format(self.path, threading.get_ident())
+        with open(temporary, "w") as output:
+            output.write(self.prometheusText(self.prefix))
+        os.replace(temporary, self.path)
@@ -0,0 +1,514 @@
+"""
+In-memory engine with the API and the semantics of Solution.py: the same functions, the same ReturnValue codes,
+the same cascades and free_space accounting, with no database behind it. Select it with
+Backend.configureBackend("memory"); Differential.py checks it against PostgreSQL, test_MemorySolution.py against
+hand-written results.
+Rows are __slots__ objects in hash maps; placements and attached RAMs are indexed from both sides, photo ids and
+sizes are kept sorted, and the aggregates the SQL schema maintains with triggers (used bytes per disk, cost per
+description, RAM per disk) are maintained by the mutators.
+"""
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import Placement
+import Views
+from Business.Disk import Disk
+from Business.Photo import Photo
+from Business.RAM import RAM
+from Utility.ReturnValue import ReturnValue
+
+CLOSE_PHOTOS_QUERY = "query"
+CLOSE_PHOTOS_PRECOMPUTED = "precomputed"
+
+# PostgreSQL integer columns; values outside reject the whole statement with an error, not a constraint violation
+INT_MIN = -2147483648
+INT_MAX = 2147483647
+
+
+def inRange(*values) -> bool:
+    return all(value is None or (isinstance(value, int) and INT_MIN <= value <= INT_MAX) for value in values)
+
+
+def remove(ordered: list, value):
+    del ordered[bisect_left(ordered, value)]
+
+
+def page(ids: Iterable[int], limit: Optional[int]) -> List[int]:
+    if limit is None:
+        return list(ids)
+    if limit < 0:
+        return []
+    result = []
+    for id in ids:
+        if len(result) >= limit:
+            break
+        result.append(id)
+    return result
+
+
+class PhotoRow:
+    __slots__ = ("id", "description", "size")
+
+    def __init__(self, id: int, description: str, size: int):
+        self.id = id
+        self.description = description
+        self.size = size
+
+
+class DiskRow:
+    __slots__ = ("id", "company", "speed", "free_space", "cost")
+
+    def __init__(self, id: int, company: str, speed: int, free_space: int, cost: int):
+        self.id = id
+        self.company = company
+        self.speed = speed
+        self.free_space = free_space
+        self.cost = cost
+
+
+class RAMRow:
+    __slots__ = ("id", "size", "company")
+
+    def __init__(self, id: int, size: int, company: str):
+        self.id = id
+        self.size = size
+        self.company = company
+
+
+class MemoryEngine:
+    def __init__(self):
+        self.closePhotosStrategy = CLOSE_PHOTOS_QUERY
+        self.clearTables()
+
+    # schema
+
+    def createTables(self):
+        pass
+
+    def clearTables(self):
+        self.photos: Dict[int, PhotoRow] = {}
+        self.disks: Dict[int, DiskRow] = {}
+        self.rams: Dict[int, RAMRow] = {}
+        self.photoIDs: List[int] = []
+        self.photoSizes: List[int] = []
+        self.photosByDescription: Dict[str, Set[int]] = {}
+        self.photosOnDisk: Dict[int, Set[int]] = {}
+        self.disksOfPhoto: Dict[int, Set[int]] = {}
+        self.ramsOnDisk: Dict[int, Set[int]] = {}
+        self.disksOfRAM: Dict[int, Set[int]] = {}
+        self.usedBytes: Dict[int, int] = {}
+        self.totalRAM: Dict[int, int] = {}
+        self.descriptionCost: Dict[str, int] = {}
+
+    def dropTables(self):
+        # the database's strategy is the state of its triggers, which createTables recreates disabled
+        self.closePhotosStrategy = CLOSE_PHOTOS_QUERY
+        self.clearTables()
+
+    # photos, disks and RAMs
+
+    def photoError(self, photo: Photo) -> Optional[ReturnValue]:
+        photo_id, description, size = photo.getPhotoID(), photo.getDescription(), photo.getSize()
+        if not inRange(photo_id, size):
+            return ReturnValue.ERROR
+        if photo_id is None or description is None or size is None or photo_id <= 0 or size < 0:
+            return ReturnValue.BAD_PARAMS
+        if photo_id in self.photos:
+            return ReturnValue.ALREADY_EXISTS
+        return None
+
+    def diskError(self, disk: Disk) -> Optional[ReturnValue]:
+        values = disk.getDiskID(), disk.getCompany(), disk.getSpeed(), disk.getFreeSpace(), disk.getCost()
+        disk_id, company, speed, free_space, cost = values
+        if not inRange(disk_id, speed, free_space, cost):
+            return ReturnValue.ERROR
+        if any(value is None for value in values) or disk_id <= 0 or speed <= 0 or free_space < 0 or cost <= 0:
+            return ReturnValue.BAD_PARAMS
+        if disk_id in self.disks:
+            return ReturnValue.ALREADY_EXISTS
+        return None
+
+    def insertPhoto(self, photo: Photo):
+        row = PhotoRow(photo.getPhotoID(), photo.getDescription(), photo.getSize())
+        self.photos[row.id] = row
+        insort(self.photoIDs, row.id)
+        insort(self.photoSizes, row.size)
+        self.photosByDescription.setdefault(row.description, set()).add(row.id)
+        self.disksOfPhoto[row.id] = set()
+
+    def insertDisk(self, disk: Disk):
+        row = DiskRow(disk.getDiskID(), disk.getCompany(), disk.getSpeed(), disk.getFreeSpace(), disk.getCost())
+        self.disks[row.id] = row
+        self.photosOnDisk[row.id] = set()
+        self.ramsOnDisk[row.id] = set()
+        self.usedBytes[row.id] = 0
+        self.totalRAM[row.id] = 0
+
+    def addPhoto(self, photo: Photo) -> ReturnValue:
+        error = self.photoError(photo)
+        if error is not None:
+            return error
+        self.insertPhoto(photo)
+        return ReturnValue.OK
+
+    def getPhotoByID(self, photoID: int) -> Photo:
+        result = Photo.badPhoto()
+        row = self.photos.get(photoID)
+        if row is not None:
+            result.setPhotoID(row.id)
+            result.setDescription(row.description)
+            result.setSize(row.size)
+        return result
+
+    def matchingPhoto(self, photo: Photo) -> Optional[PhotoRow]:
+        row = self.photos.get(photo.getPhotoID())
+        if row is None or (row.description, row.size) != (photo.getDescription(), photo.getSize()):
+            return None
+        return row
+
+    def deletePhoto(self, photo: Photo) -> ReturnValue:
+        if not inRange(photo.getPhotoID(), photo.getSize()):
+            return ReturnValue.ERROR
+        row = self.matchingPhoto(photo)
+        if row is None:
+            return ReturnValue.OK
+        for disk_id in self.disksOfPhoto.pop(row.id):
+            disk = self.disks[disk_id]
+            disk.free_space += row.size
+            self.usedBytes[disk_id] -= row.size
+            self.descriptionCost[row.description] -= disk.cost * row.size
+            self.photosOnDisk[disk_id].discard(row.id)
+        del self.photos[row.id]
+        remove(self.photoIDs, row.id)
+        remove(self.photoSizes, row.size)
+        self.photosByDescription[row.description].discard(row.id)
+        return ReturnValue.OK
+
+    def addDisk(self, disk: Disk) -> ReturnValue:
+        error = self.diskError(disk)
+        if error is not None:
+            return error
+        self.insertDisk(disk)
+        return ReturnValue.OK
+
+    def getDiskByID(self, diskID: int) -> Disk:
+        result = Disk.badDisk()
+        row = self.disks.get(diskID)
+        if row is not None:
+            result.setDiskID(row.id)
+            result.setCompany(row.company)
+            result.setSpeed(row.speed)
+            result.setFreeSpace(row.free_space)
+            result.setCost(row.cost)
+        return result
+
+    def deleteDisk(self, diskID: int) -> ReturnValue:
+        if not inRange(diskID):
+            return ReturnValue.ERROR
+        disk = self.disks.pop(diskID, None)
+        if disk is None:
+            return ReturnValue.NOT_EXISTS
+        for photo_id in self.photosOnDisk.pop(diskID):
+            photo = self.photos[photo_id]
+            self.descriptionCost[photo.description] -= disk.cost * photo.size
+            self.disksOfPhoto[photo_id].discard(diskID)
+        for ram_id in self.ramsOnDisk.pop(diskID):
+            self.disksOfRAM[ram_id].discard(diskID)
+        del self.usedBytes[diskID]
+        del self.totalRAM[diskID]
+        return ReturnValue.OK
+
+    def addRAM(self, ram: RAM) -> ReturnValue:
+        ram_id, size, company = ram.getRamID(), ram.getSize(), ram.getCompany()
+        if not inRange(ram_id, size):
+            return ReturnValue.ERROR
+        if ram_id is None or size is None or company is None or ram_id <= 0 or size <= 0:
+            return ReturnValue.BAD_PARAMS
+        if ram_id in self.rams:
+            return ReturnValue.ALREADY_EXISTS
+        self.rams[ram_id] = RAMRow(ram_id, size, company)
+        self.disksOfRAM[ram_id] = set()
+        return ReturnValue.OK
+
+    def getRAMByID(self, ramID: int) -> RAM:
+        result = RAM.badRAM()
+        row = self.rams.get(ramID)
+        if row is not None:
+            result.setRamID(row.id)
+            result.setCompany(row.company)
+            result.setSize(row.size)
+        return result
+
+    def deleteRAM(self, ramID: int) -> ReturnValue:
+        if not inRange(ramID):
+            return ReturnValue.ERROR
+        ram = self.rams.pop(ramID, None)
+        if ram is None:
+            return ReturnValue.NOT_EXISTS
+        for disk_id in self.disksOfRAM.pop(ramID):
+            self.totalRAM[disk_id] -= ram.size
+            self.ramsOnDisk[disk_id].discard(ramID)
+        return ReturnValue.OK
+
+    def getPhotosByIDs(self, photoIDs: Iterable[int], views: bool = False) -> List[Photo]:
+        if not views:
+            return [self.getPhotoByID(photo_id) for photo_id in photoIDs]
+        rows = [self.photos.get(photo_id) for photo_id in photoIDs]
+        return [Views.PhotoView(row.id, row.description, row.size) if row is not None else Views.BAD_PHOTO
+                for row in rows]
+
+    def getDisksByIDs(self, diskIDs: Iterable[int], views: bool = False) -> List[Disk]:
+        if not views:
+            return [self.getDiskByID(disk_id) for disk_id in diskIDs]
+        rows = [self.disks.get(disk_id) for disk_id in diskIDs]
+        return [Views.DiskView(row.id, row.company, row.speed, row.free_space, row.cost) if row is not None
+                else Views.BAD_DISK for row in rows]
+
+    def getRAMsByIDs(self, ramIDs: Iterable[int], views: bool = False) -> List[RAM]:
+        if not views:
+            return [self.getRAMByID(ram_id) for ram_id in ramIDs]
+        rows = [self.rams.get(ram_id) for ram_id in ramIDs]
+        return [Views.RAMView(row.id, row.size, row.company) if row is not None else Views.BAD_RAM for row in rows]
+
+    def addDiskAndPhoto(self, disk: Disk, photo: Photo) -> ReturnValue:
+        error = self.diskError(disk)
+        if error is None:
+            error = self.photoError(photo)
+        if error is not None:
+            return error
+        self.insertDisk(disk)
+        self.insertPhoto(photo)
+        return ReturnValue.OK
+
+    # placements
+
+    def place(self, photo: PhotoRow, disk: DiskRow):
+        disk.free_space -= photo.size
+        self.usedBytes[disk.id] += photo.size
+        self.descriptionCost[photo.description] = self.descriptionCost.get(photo.description, 0) + disk.cost * photo.size
+        self.photosOnDisk[disk.id].add(photo.id)
+        self.disksOfPhoto[photo.id].add(disk.id)
+
+    def addPhotoToDisk(self, photo: Photo, diskID: int) -> ReturnValue:
+        if not inRange(photo.getPhotoID(), photo.getSize(), diskID):
+            return ReturnValue.ERROR
+        row = self.matchingPhoto(photo)
+        disk = self.disks.get(diskID)
+        if row is None or disk is None:
+            return ReturnValue.NOT_EXISTS
+        if diskID in self.disksOfPhoto[row.id]:
+            return ReturnValue.ALREADY_EXISTS
+        if disk.free_space < row.size:
+            return ReturnValue.BAD_PARAMS
+        self.place(row, disk)
+        return ReturnValue.OK
+
+    def addPhotoToAnyDisk(self, photo: Photo) -> Tuple[ReturnValue, Optional[int]]:
+        if not inRange(photo.getPhotoID(), photo.getSize()):
+            return ReturnValue.ERROR, None
+        row = self.matchingPhoto(photo)
+        if row is None:
+            return ReturnValue.NOT_EXISTS, None
+        for disk_id in sorted(self.disks):
+            disk = self.disks[disk_id]
+            if disk.free_space >= row.size and disk_id not in self.disksOfPhoto[row.id]:
+                self.place(row, disk)
+                return ReturnValue.OK, disk_id
+        return ReturnValue.BAD_PARAMS, None
+
+    def removePhotoFromDisk(self, photo: Photo, diskID: int) -> ReturnValue:
+        photo_id = photo.getPhotoID()
+        if not inRange(photo_id, diskID):
+            return ReturnValue.ERROR
+        if diskID not in self.disksOfPhoto.get(photo_id, ()):
+            return ReturnValue.OK
+        row, disk = self.photos[photo_id], self.disks[diskID]
+        disk.free_space += row.size
+        self.usedBytes[diskID] -= row.size
+        self.descriptionCost[row.description] -= disk.cost * row.size
+        self.photosOnDisk[diskID].discard(photo_id)
+        self.disksOfPhoto[photo_id].discard(diskID)
+        return ReturnValue.OK
+
+    def addRAMToDisk(self, ramID: int, diskID: int) -> ReturnValue:
+        if not inRange(ramID, diskID):
+            return ReturnValue.ERROR
+        if ramID is None or diskID is None:
+            return ReturnValue.BAD_PARAMS
+        if diskID in self.disksOfRAM.get(ramID, ()):
+            return ReturnValue.ALREADY_EXISTS
+        if ramID not in self.rams or diskID not in self.disks:
+            return ReturnValue.NOT_EXISTS
+        self.disksOfRAM[ramID].add(diskID)
+        self.ramsOnDisk[diskID].add(ramID)
+        self.totalRAM[diskID] += self.rams[ramID].size
+        return ReturnValue.OK
+
+    def removeRAMFromDisk(self, ramID: int, diskID: int) -> ReturnValue:
+        if not inRange(ramID, diskID):
+            return ReturnValue.ERROR
+        if diskID not in self.disksOfRAM.get(ramID, ()):
+            return ReturnValue.NOT_EXISTS
+        self.disksOfRAM[ramID].discard(diskID)
+        self.ramsOnDisk[diskID].discard(ramID)
+        self.totalRAM[diskID] -= self.rams[ramID].size
+        return ReturnValue.OK
+
+    # batches, with the per-row results of the single-row functions applied in order
+
+    def addPhotos(self, photos: Iterable[Photo], chunkSize: int = None) -> List[ReturnValue]:
+        return [self.addPhoto(photo) for photo in photos]
+
+    def addDisks(self, disks: Iterable[Disk], chunkSize: int = None) -> List[ReturnValue]:
+        return [self.addDisk(disk) for disk in disks]
+
+    def addRAMs(self, rams: Iterable[RAM], chunkSize: int = None) -> List[ReturnValue]:
+        return [self.addRAM(ram) for ram in rams]
+
+    def addPhotosToDisk(self, placements: Iterable[Tuple[Photo, int]], chunkSize: int = None) -> List[ReturnValue]:
+        return [self.addPhotoToDisk(photo, diskID) for photo, diskID in placements]
+
+    def placePhotos(self, photoIDs: Iterable[int], strategy: str = Placement.FIRST_FIT_DECREASING,
+                    respectRAM: bool = False) -> Tuple[Dict[int, int], List[int]]:
+        photoIDs = sorted(set(photoIDs))
+        if strategy not in Placement.STRATEGIES:
+            return {}, photoIDs
+        sizes = {photo_id: self.photos[photo_id].size for photo_id in photoIDs if photo_id in self.photos}
+        candidates = [Placement.DiskCandidate(disk.id, disk.free_space, disk.speed, disk.cost, self.totalRAM[disk.id])
+                      for disk in self.disks.values()]
+        placed = {(photo_id, disk_id) for photo_id in sizes for disk_id in self.disksOfPhoto[photo_id]}
+        placement, unplaced = Placement.plan(sizes.items(), candidates, placed, strategy, respectRAM)
+        for photo_id, disk_id in placement.items():
+            self.place(self.photos[photo_id], self.disks[disk_id])
+        return placement, sorted(unplaced + [photo_id for photo_id in photoIDs if photo_id not in sizes])
+
+    # queries
+
+    def averagePhotosSizeOnDisk(self, diskID: int) -> float:
+        if not inRange(diskID):
+            return -1
+        photo_ids = self.photosOnDisk.get(diskID)
+        if not photo_ids:
+            return 0
+        return self.usedBytes[diskID] / len(photo_ids)
+
+    def getTotalRamOnDisk(self, diskID: int) -> int:
+        if not inRange(diskID):
+            return -1
+        return self.totalRAM.get(diskID, 0)
+
+    def getCostForDescription(self, description: str) -> int:
+        return self.descriptionCost.get(description, 0)
+
+    def fittingPhotos(self, diskID: int, respectRAM: bool, descending: bool, after_id: Optional[int]) -> Iterator[int]:
+        disk = self.disks.get(diskID)
+        if disk is None:
+            return
+        bound = min(disk.free_space, self.totalRAM[diskID]) if respectRAM else disk.free_space
+        if descending:
+            end = bisect_left(self.photoIDs, INT_MAX + 1 if after_id is None else after_id)
+            ids = (self.photoIDs[index] for index in range(end - 1, -1, -1))
+        else:
+            start = bisect_right(self.photoIDs, 0 if after_id is None else after_id)
+            ids = (self.photoIDs[index] for index in range(start, len(self.photoIDs)))
+        for photo_id in ids:
+            if self.photos[photo_id].size <= bound:
+                yield photo_id
+
+    def getPhotosCanBeAddedToDisk(self, diskID: int, k: int = 5) -> List[int]:
+        return self.getPhotosCanBeAddedToDiskPage(diskID, None, k)
+
+    def getPhotosCanBeAddedToDiskAndRAM(self, diskID: int, k: int = 5) -> List[int]:
+        return self.getPhotosCanBeAddedToDiskAndRAMPage(diskID, None, k)
+
+    def isCompanyExclusive(self, diskID: int) -> bool:
+        disk = self.disks.get(diskID)
+        if disk is None:
+            return False
+        return all(self.rams[ram_id].company == disk.company for ram_id in self.ramsOnDisk[diskID])
+
+    def isDiskContainingAtLeastNumExists(self, description: str, num: int) -> bool:
+        if num is None:
+            return False
+        counts = Counter(disk_id for photo_id in self.photosByDescription.get(description, ())
+                         for disk_id in self.disksOfPhoto[photo_id])
+        return any(count >= num for count in counts.values())
+
+    def getDisksContainingTheMostData(self) -> List[int]:
+        return self.getDisksContainingTheMostDataPage(None, 5)
+
+    def getConflictingDisks(self) -> List[int]:
+        return self.getConflictingDisksPage(None, None)
+
+    def mostAvailableDisks(self) -> List[int]:
+        ranked = sorted(self.disks.values(), key=lambda disk: (
+            -bisect_right(self.photoSizes, disk.free_space), -disk.speed, disk.id))
+        return [disk.id for disk in ranked[:5]]
+
+    def rebuildPhotoCoOccurrence(self, conn=None) -> ReturnValue:
+        return ReturnValue.OK
+
+    def setClosePhotosStrategy(self, strategy: str) -> ReturnValue:
+        if strategy not in (CLOSE_PHOTOS_QUERY, CLOSE_PHOTOS_PRECOMPUTED):
+            return ReturnValue.BAD_PARAMS
+        self.closePhotosStrategy = strategy
+        return ReturnValue.OK
+
+    def closePhotos(self, photoID: int, after_id: Optional[int]) -> List[int]:
+        after = 0 if after_id is None else after_id
+        saved_on = self.disksOfPhoto.get(photoID)
+        if not saved_on:
+            start = bisect_right(self.photoIDs, after)
+            return [photo_id for photo_id in self.photoIDs[start:] if photo_id != photoID]
+        shared = Counter(other for disk_id in saved_on for other in self.photosOnDisk[disk_id]
+                         if other != photoID and other > after)
+        return sorted(other for other, count in shared.items() if count >= len(saved_on) * 0.5)
+
+    def getClosePhotos(self, photoID: int) -> List[int]:
+        return self.getClosePhotosPage(photoID, None, 10)
+
+    # keyset pages and streams, see Statements' *_PAGE statements
+
+    def getConflictingDisksPage(self, after_id: Optional[int] = None, limit: Optional[int] = 100) -> List[int]:
+        after = 0 if after_id is None else after_id
+        conflicting = {disk_id for disk_ids in self.disksOfPhoto.values() if len(disk_ids) > 1
+                       for disk_id in disk_ids if disk_id > after}
+        return page(sorted(conflicting), limit)
+
+    def getPhotosCanBeAddedToDiskPage(self, diskID: int, after_id: Optional[int] = None,
+                                      limit: Optional[int] = 100) -> List[int]:
+        return page(self.fittingPhotos(diskID, False, True, after_id), limit)
+
+    def getPhotosCanBeAddedToDiskAndRAMPage(self, diskID: int, after_id: Optional[int] = None,
+                                            limit: Optional[int] = 100) -> List[int]:
+        return page(self.fittingPhotos(diskID, True, False, after_id), limit)
+
+    def getDisksContainingTheMostDataPage(self, after_id: Optional[int] = None,
+                                          limit: Optional[int] = 100) -> List[int]:
+        ranked = sorted((-self.usedBytes[disk_id], disk_id) for disk_id, photo_ids in self.photosOnDisk.items()
+                        if photo_ids)
+        if after_id is not None:
+            if after_id not in self.usedBytes:
+                return []
+            ranked = ranked[bisect_right(ranked, (-self.usedBytes[after_id], after_id)):]
+        return page((disk_id for _, disk_id in ranked), limit)
+
+    def getClosePhotosPage(self, photoID: int, after_id: Optional[int] = None,
+                           limit: Optional[int] = 100) -> List[int]:
+        return page(self.closePhotos(photoID, after_id), limit)
+
+    def streamConflictingDisks(self, fetchSize: Optional[int] = None) -> Iterator[int]:
+        return iter(self.getConflictingDisksPage(None, None))
+
+    def streamPhotosCanBeAddedToDisk(self, diskID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+        return iter(self.getPhotosCanBeAddedToDiskPage(diskID, None, None))
+
+    def streamPhotosCanBeAddedToDiskAndRAM(self, diskID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+        return iter(self.getPhotosCanBeAddedToDiskAndRAMPage(diskID, None, None))
+
+    def streamDisksContainingTheMostData(self, fetchSize: Optional[int] = None) -> Iterator[int]:
+        return iter(self.getDisksContainingTheMostDataPage(None, None))
+
+    def streamClosePhotos(self, photoID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+        return iter(self.getClosePhotosPage(photoID, None, None))
@@ -0,0 +1,703 @@
+"""
+Ordered schema migrations. "SchemaVersion" records every migration applied to a database; migrate() costs one query
+when the database is already at LATEST and otherwise applies the missing migrations in one transaction under an
+advisory lock, so processes starting together neither race on the DDL nor run it twice.
+Migration 1 is the schema createTables used to build on every call. Its statements are idempotent, so it also
+upgrades databases created before SchemaVersion existed. New schema changes go into new migrations at the end,
+never into existing ones.
+"""
+from typing import List, Optional, Tuple
+
+from psycopg2 import sql
+
+# transaction-level advisory lock held while migrating
+LOCK_KEY = 236363
+
+TABLES = ["Photo", "Disk", "RAM", "PhotoInDisk", "RAMInDisk"]
+
+# maintained by triggers from TABLES, so cleared together with them
+MAINTAINED_TABLES = ["DiskRAMStats", "PhotoSizeCounts", "PhotoSizeBlocks", "PhotoCoOccurrence", "PhotoDiskCount",
+                     "DiskUsage", "DescriptionCost"]
+
+VIEWS = ["TotalRAMInDisk", "DiskPhotoCounts"]
+
+FUNCTIONS = ["DiskRAMStats_disk_added", "DiskRAMStats_disk_changed", "DiskRAMStats_ram_attached",
+             "DiskRAMStats_ram_detached", "DiskRAMStats_ram_changed", "DiskRAMStats_ram_deleted",
+             "PhotoSizeCounts_photo_added", "PhotoSizeCounts_photo_removed", "PhotoSizeCounts_photos_added",
+             "PhotoSizeCounts_photos_removed", "PhotoSizeCounts_photos_changed", "PhotoSizeCounts_apply",
+             "PhotoSizesAtMost", "Cache_notify",
+             "PhotoCoOccurrence_placed", "PhotoCoOccurrence_removed",
+             "DiskUsage_disk_added", "PlacementTotals_placed", "PlacementTotals_removed",
+             "PlacementTotals_photo_deleted", "PlacementTotals_disk_deleted", "PlacementTotals_photo_changed",
+             "PlacementTotals_disk_changed"]
+
+BASELINE = """
+        CREATE TABLE IF NOT EXISTS "Photo"
+            (
+                id integer NOT NULL PRIMARY KEY CHECK (id > 0),
+                description TEXT NOT NULL,
+                disk_size_needed integer NOT NULL CHECK (disk_size_needed >= 0)
+            );
+        CREATE TABLE IF NOT EXISTS "Disk"
+            (
+                id integer NOT NULL PRIMARY KEY CHECK (id > 0),
+                manufacturing_company TEXT NOT NULL,
+                speed integer NOT NULL CHECK (speed > 0),
+                free_space integer NOT NULL CHECK (free_space >= 0),
+                cost_per_byte integer NOT NULL CHECK (cost_per_byte > 0)
+            );
+         CREATE TABLE IF NOT EXISTS "RAM"
+            (
+                id integer NOT NULL PRIMARY KEY CHECK (id > 0),
+                size integer NOT NULL CHECK (size > 0),
+                company TEXT NOT NULL
+            );
+
+        CREATE TABLE IF NOT EXISTS "PhotoInDisk"
+            (
+                photo_id integer NOT NULL,
+                disk_id integer NOT NULL,
+                PRIMARY KEY (photo_id, disk_id),
+                FOREIGN KEY (photo_id) REFERENCES "Photo" (id) ON DELETE CASCADE,
+                FOREIGN KEY (disk_id) REFERENCES "Disk" (id) ON DELETE CASCADE
+            );
+
+        CREATE TABLE IF NOT EXISTS "RAMInDisk"
+    		(
+    			ram_id integer NOT NULL,
+    			disk_id integer NOT NULL,
+    			PRIMARY KEY (ram_id, disk_id),
+    			FOREIGN KEY (ram_id) REFERENCES "RAM" (id) ON DELETE CASCADE,
+    			FOREIGN KEY (disk_id) REFERENCES "Disk" (id) ON DELETE CASCADE
+    		);
+
+        CREATE TABLE IF NOT EXISTS "DiskRAMStats"
+            (
+                disk_id integer NOT NULL PRIMARY KEY,
+                total_ram bigint NOT NULL DEFAULT 0,
+                ram_count integer NOT NULL DEFAULT 0,
+                foreign_ram_count integer NOT NULL DEFAULT 0,
+                FOREIGN KEY (disk_id) REFERENCES "Disk" (id) ON DELETE CASCADE
+            );
+
+        CREATE OR REPLACE FUNCTION "DiskRAMStats_disk_added"() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO "DiskRAMStats" (disk_id) VALUES (NEW.id);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "DiskRAMStats_disk_changed"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskRAMStats" SET foreign_ram_count =
+                (SELECT COUNT(*) FROM "RAMInDisk" INNER JOIN "RAM" ON "RAM".id = "RAMInDisk".ram_id
+                 WHERE "RAMInDisk".disk_id = NEW.id AND "RAM".company <> NEW.manufacturing_company)
+            WHERE disk_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "DiskRAMStats_ram_attached"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskRAMStats" SET total_ram = total_ram + "RAM".size, ram_count = ram_count + 1,
+                foreign_ram_count = foreign_ram_count + ("RAM".company <> "Disk".manufacturing_company)::integer
+            FROM "RAM", "Disk"
+            WHERE "DiskRAMStats".disk_id = NEW.disk_id AND "RAM".id = NEW.ram_id AND "Disk".id = NEW.disk_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- a detach cascaded from deleteRAM no longer sees the RAM row, "DiskRAMStats_ram_deleted" already did the work
+        CREATE OR REPLACE FUNCTION "DiskRAMStats_ram_detached"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskRAMStats" SET total_ram = total_ram - "RAM".size, ram_count = ram_count - 1,
+                foreign_ram_count = foreign_ram_count - ("RAM".company <> "Disk".manufacturing_company)::integer
+            FROM "RAM", "Disk"
+            WHERE "DiskRAMStats".disk_id = OLD.disk_id AND "RAM".id = OLD.ram_id AND "Disk".id = OLD.disk_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "DiskRAMStats_ram_changed"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskRAMStats" SET total_ram = total_ram - OLD.size + NEW.size,
+                foreign_ram_count = foreign_ram_count - (OLD.company <> "Disk".manufacturing_company)::integer
+                                                      + (NEW.company <> "Disk".manufacturing_company)::integer
+            FROM "RAMInDisk", "Disk"
+            WHERE "RAMInDisk".ram_id = NEW.id AND "DiskRAMStats".disk_id = "RAMInDisk".disk_id
+            AND "Disk".id = "RAMInDisk".disk_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "DiskRAMStats_ram_deleted"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskRAMStats" SET total_ram = total_ram - OLD.size, ram_count = ram_count - 1,
+                foreign_ram_count = foreign_ram_count - (OLD.company <> "Disk".manufacturing_company)::integer
+            FROM "RAMInDisk", "Disk"
+            WHERE "RAMInDisk".ram_id = OLD.id AND "DiskRAMStats".disk_id = "RAMInDisk".disk_id
+            AND "Disk".id = "RAMInDisk".disk_id;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS "Disk_ram_stats_insert" ON "Disk";
+        CREATE TRIGGER "Disk_ram_stats_insert" AFTER INSERT ON "Disk"
+            FOR EACH ROW EXECUTE FUNCTION "DiskRAMStats_disk_added"();
+        DROP TRIGGER IF EXISTS "Disk_ram_stats_update" ON "Disk";
+        CREATE TRIGGER "Disk_ram_stats_update" AFTER UPDATE OF manufacturing_company ON "Disk"
+            FOR EACH ROW EXECUTE FUNCTION "DiskRAMStats_disk_changed"();
+        DROP TRIGGER IF EXISTS "RAMInDisk_ram_stats_insert" ON "RAMInDisk";
+        CREATE TRIGGER "RAMInDisk_ram_stats_insert" AFTER INSERT ON "RAMInDisk"
+            FOR EACH ROW EXECUTE FUNCTION "DiskRAMStats_ram_attached"();
+        DROP TRIGGER IF EXISTS "RAMInDisk_ram_stats_delete" ON "RAMInDisk";
+        CREATE TRIGGER "RAMInDisk_ram_stats_delete" AFTER DELETE ON "RAMInDisk"
+            FOR EACH ROW EXECUTE FUNCTION "DiskRAMStats_ram_detached"();
+        DROP TRIGGER IF EXISTS "RAM_ram_stats_update" ON "RAM";
+        CREATE TRIGGER "RAM_ram_stats_update" AFTER UPDATE OF size, company ON "RAM"
+            FOR EACH ROW EXECUTE FUNCTION "DiskRAMStats_ram_changed"();
+        DROP TRIGGER IF EXISTS "RAM_ram_stats_delete" ON "RAM";
+        CREATE TRIGGER "RAM_ram_stats_delete" BEFORE DELETE ON "RAM"
+            FOR EACH ROW EXECUTE FUNCTION "DiskRAMStats_ram_deleted"();
+
+        INSERT INTO "DiskRAMStats" (disk_id, total_ram, ram_count, foreign_ram_count)
+        SELECT "Disk".id, COALESCE(SUM("RAM".size), 0), COUNT("RAM".id),
+               COUNT("RAM".id) FILTER (WHERE "RAM".company <> "Disk".manufacturing_company)
+        FROM "Disk"
+        LEFT OUTER JOIN "RAMInDisk" ON "Disk".id = "RAMInDisk".disk_id
+        LEFT OUTER JOIN "RAM" ON "RAM".id = "RAMInDisk".ram_id
+        GROUP BY "Disk".id
+        ON CONFLICT (disk_id) DO NOTHING;
+
+        CREATE OR REPLACE VIEW "TotalRAMInDisk" AS
+        SELECT disk_id, total_ram FROM "DiskRAMStats";
+
+        CREATE TABLE IF NOT EXISTS "PhotoSizeCounts"
+            (
+                disk_size_needed integer NOT NULL PRIMARY KEY,
+                photo_count bigint NOT NULL,
+                cumulative_count bigint NOT NULL
+            );
+
+        -- cumulative_count is the number of photos whose size is at most disk_size_needed,
+        -- writers are serialized on an advisory lock so a new bucket never starts from a stale prefix sum
+        CREATE OR REPLACE FUNCTION "PhotoSizeCounts_photo_added"() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('PhotoSizeCounts'));
+            INSERT INTO "PhotoSizeCounts" (disk_size_needed, photo_count, cumulative_count)
+            VALUES (NEW.disk_size_needed, 0, COALESCE(
+                (SELECT cumulative_count FROM "PhotoSizeCounts" WHERE disk_size_needed < NEW.disk_size_needed
+                 ORDER BY disk_size_needed DESC LIMIT 1), 0))
+            ON CONFLICT (disk_size_needed) DO NOTHING;
+            UPDATE "PhotoSizeCounts"
+            SET photo_count = photo_count + (disk_size_needed = NEW.disk_size_needed)::integer,
+                cumulative_count = cumulative_count + 1
+            WHERE disk_size_needed >= NEW.disk_size_needed;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "PhotoSizeCounts_photo_removed"() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('PhotoSizeCounts'));
+            UPDATE "PhotoSizeCounts"
+            SET photo_count = photo_count - (disk_size_needed = OLD.disk_size_needed)::integer,
+                cumulative_count = cumulative_count - 1
+            WHERE disk_size_needed >= OLD.disk_size_needed;
+            DELETE FROM "PhotoSizeCounts" WHERE disk_size_needed = OLD.disk_size_needed AND photo_count = 0;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS "Photo_size_counts_insert" ON "Photo";
+        CREATE TRIGGER "Photo_size_counts_insert" AFTER INSERT ON "Photo"
+            FOR EACH ROW EXECUTE FUNCTION "PhotoSizeCounts_photo_added"();
+        DROP TRIGGER IF EXISTS "Photo_size_counts_delete" ON "Photo";
+        CREATE TRIGGER "Photo_size_counts_delete" AFTER DELETE ON "Photo"
+            FOR EACH ROW EXECUTE FUNCTION "PhotoSizeCounts_photo_removed"();
+        DROP TRIGGER IF EXISTS "Photo_size_counts_update_removed" ON "Photo";
+        CREATE TRIGGER "Photo_size_counts_update_removed" AFTER UPDATE OF disk_size_needed ON "Photo"
+            FOR EACH ROW EXECUTE FUNCTION "PhotoSizeCounts_photo_removed"();
+        DROP TRIGGER IF EXISTS "Photo_size_counts_update_added" ON "Photo";
+        CREATE TRIGGER "Photo_size_counts_update_added" AFTER UPDATE OF disk_size_needed ON "Photo"
+            FOR EACH ROW EXECUTE FUNCTION "PhotoSizeCounts_photo_added"();
+
+        INSERT INTO "PhotoSizeCounts" (disk_size_needed, photo_count, cumulative_count)
+        SELECT disk_size_needed, photo_count, SUM(photo_count) OVER (ORDER BY disk_size_needed)
+        FROM (SELECT disk_size_needed, COUNT(*) AS photo_count FROM "Photo" GROUP BY disk_size_needed) AS sizes
+        WHERE NOT EXISTS (SELECT 1 FROM "PhotoSizeCounts");
+
+        CREATE OR REPLACE VIEW "DiskPhotoCounts" AS
+        SELECT
+            "Disk".id AS disk_id,
+            COALESCE(fitting.cumulative_count, 0) AS photo_count,
+            "Disk".speed AS disk_speed
+        FROM "Disk"
+        LEFT JOIN LATERAL (
+            SELECT cumulative_count FROM "PhotoSizeCounts"
+            WHERE "PhotoSizeCounts".disk_size_needed <= "Disk".free_space
+            ORDER BY "PhotoSizeCounts".disk_size_needed DESC
+            LIMIT 1
+        ) AS fitting ON TRUE;
+
+        CREATE TABLE IF NOT EXISTS "PhotoCoOccurrence"
+            (
+                photo_id integer NOT NULL,
+                other_photo_id integer NOT NULL,
+                shared_disks integer NOT NULL,
+                PRIMARY KEY (photo_id, other_photo_id)
+            );
+        CREATE INDEX IF NOT EXISTS "PhotoCoOccurrence_empty_idx" ON "PhotoCoOccurrence" (photo_id)
+            WHERE shared_disks <= 0;
+
+        CREATE TABLE IF NOT EXISTS "PhotoDiskCount"
+            (
+                photo_id integer NOT NULL PRIMARY KEY,
+                disk_count integer NOT NULL
+            );
+        CREATE INDEX IF NOT EXISTS "PhotoDiskCount_empty_idx" ON "PhotoDiskCount" (photo_id) WHERE disk_count <= 0;
+
+        -- statement level, so a cascaded delete of a whole disk sees all of the disk's removed placements at once
+        CREATE OR REPLACE FUNCTION "PhotoCoOccurrence_placed"() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO "PhotoCoOccurrence" AS co (photo_id, other_photo_id, shared_disks)
+            SELECT pairs.photo_id, pairs.other_photo_id, COUNT(*) FROM (
+                SELECT added.photo_id, remaining.photo_id AS other_photo_id
+                FROM added INNER JOIN "PhotoInDisk" AS remaining
+                ON remaining.disk_id = added.disk_id AND remaining.photo_id <> added.photo_id
+                UNION ALL
+                SELECT remaining.photo_id, added.photo_id
+                FROM added INNER JOIN "PhotoInDisk" AS remaining
+                ON remaining.disk_id = added.disk_id AND remaining.photo_id <> added.photo_id
+                WHERE NOT EXISTS (SELECT 1 FROM added AS also
+                                  WHERE also.photo_id = remaining.photo_id AND also.disk_id = remaining.disk_id)
+            ) AS pairs
+            GROUP BY pairs.photo_id, pairs.other_photo_id
+            ON CONFLICT (photo_id, other_photo_id) DO UPDATE SET shared_disks = co.shared_disks + EXCLUDED.shared_disks;
+
+            INSERT INTO "PhotoDiskCount" AS counts (photo_id, disk_count)
+            SELECT photo_id, COUNT(*) FROM added GROUP BY photo_id
+            ON CONFLICT (photo_id) DO UPDATE SET disk_count = counts.disk_count + EXCLUDED.disk_count;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "PhotoCoOccurrence_removed"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "PhotoCoOccurrence" AS co SET shared_disks = co.shared_disks - lost.shared_disks
+            FROM (
+                SELECT pairs.photo_id, pairs.other_photo_id, COUNT(*) AS shared_disks FROM (
+                    SELECT removed.photo_id, previous.photo_id AS other_photo_id
+                    FROM removed INNER JOIN (SELECT photo_id, disk_id FROM "PhotoInDisk"
+                                             UNION ALL SELECT photo_id, disk_id FROM removed) AS previous
+                    ON previous.disk_id = removed.disk_id AND previous.photo_id <> removed.photo_id
+                    UNION ALL
+                    SELECT remaining.photo_id, removed.photo_id
+                    FROM removed INNER JOIN "PhotoInDisk" AS remaining
+                    ON remaining.disk_id = removed.disk_id AND remaining.photo_id <> removed.photo_id
+                ) AS pairs
+                GROUP BY pairs.photo_id, pairs.other_photo_id
+            ) AS lost
+            WHERE co.photo_id = lost.photo_id AND co.other_photo_id = lost.other_photo_id;
+            DELETE FROM "PhotoCoOccurrence" WHERE shared_disks <= 0;
+
+            UPDATE "PhotoDiskCount" AS counts SET disk_count = counts.disk_count - lost.disk_count
+            FROM (SELECT photo_id, COUNT(*) AS disk_count FROM removed GROUP BY photo_id) AS lost
+            WHERE counts.photo_id = lost.photo_id;
+            DELETE FROM "PhotoDiskCount" WHERE disk_count <= 0;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- created disabled, setClosePhotosStrategy turns maintenance on together with a rebuild
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'PhotoInDisk_co_occurrence_insert') THEN
+                CREATE TRIGGER "PhotoInDisk_co_occurrence_insert" AFTER INSERT ON "PhotoInDisk"
+                    REFERENCING NEW TABLE AS added
+                    FOR EACH STATEMENT EXECUTE FUNCTION "PhotoCoOccurrence_placed"();
+                ALTER TABLE "PhotoInDisk" DISABLE TRIGGER "PhotoInDisk_co_occurrence_insert";
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'PhotoInDisk_co_occurrence_delete') THEN
+                CREATE TRIGGER "PhotoInDisk_co_occurrence_delete" AFTER DELETE ON "PhotoInDisk"
+                    REFERENCING OLD TABLE AS removed
+                    FOR EACH STATEMENT EXECUTE FUNCTION "PhotoCoOccurrence_removed"();
+                ALTER TABLE "PhotoInDisk" DISABLE TRIGGER "PhotoInDisk_co_occurrence_delete";
+            END IF;
+        END;
+        $$;
+
+        CREATE TABLE IF NOT EXISTS "DiskUsage"
+            (
+                disk_id integer NOT NULL PRIMARY KEY,
+                used_bytes bigint NOT NULL DEFAULT 0,
+                photo_count integer NOT NULL DEFAULT 0,
+                FOREIGN KEY (disk_id) REFERENCES "Disk" (id) ON DELETE CASCADE
+            );
+        CREATE INDEX IF NOT EXISTS "DiskUsage_used_bytes_idx" ON "DiskUsage" (used_bytes DESC, disk_id)
+            WHERE photo_count > 0;
+
+        CREATE TABLE IF NOT EXISTS "DescriptionCost"
+            (
+                description TEXT NOT NULL PRIMARY KEY,
+                total_cost bigint NOT NULL DEFAULT 0
+            );
+
+        CREATE OR REPLACE FUNCTION "DiskUsage_disk_added"() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO "DiskUsage" (disk_id) VALUES (NEW.id);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "PlacementTotals_placed"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskUsage" SET used_bytes = used_bytes + "Photo".disk_size_needed, photo_count = photo_count + 1
+            FROM "Photo" WHERE "DiskUsage".disk_id = NEW.disk_id AND "Photo".id = NEW.photo_id;
+            INSERT INTO "DescriptionCost" AS costs (description, total_cost)
+            SELECT "Photo".description, "Disk".cost_per_byte::bigint * "Photo".disk_size_needed
+            FROM "Photo", "Disk" WHERE "Photo".id = NEW.photo_id AND "Disk".id = NEW.disk_id
+            ON CONFLICT (description) DO UPDATE SET total_cost = costs.total_cost + EXCLUDED.total_cost;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- a removal cascaded from deletePhoto or deleteDisk no longer sees the photo or the disk,
+        -- "PlacementTotals_photo_deleted" / "PlacementTotals_disk_deleted" already did the work
+        CREATE OR REPLACE FUNCTION "PlacementTotals_removed"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskUsage" SET used_bytes = used_bytes - "Photo".disk_size_needed, photo_count = photo_count - 1
+            FROM "Photo" WHERE "DiskUsage".disk_id = OLD.disk_id AND "Photo".id = OLD.photo_id;
+            UPDATE "DescriptionCost"
+            SET total_cost = total_cost - "Disk".cost_per_byte::bigint * "Photo".disk_size_needed
+            FROM "Photo", "Disk"
+            WHERE "Photo".id = OLD.photo_id AND "Disk".id = OLD.disk_id
+            AND "DescriptionCost".description = "Photo".description;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "PlacementTotals_photo_deleted"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskUsage" SET used_bytes = used_bytes - OLD.disk_size_needed, photo_count = photo_count - 1
+            FROM "PhotoInDisk" WHERE "PhotoInDisk".photo_id = OLD.id AND "DiskUsage".disk_id = "PhotoInDisk".disk_id;
+            UPDATE "DescriptionCost" SET total_cost = total_cost - lost.cost
+            FROM (SELECT SUM("Disk".cost_per_byte::bigint * OLD.disk_size_needed) AS cost
+                  FROM "PhotoInDisk" INNER JOIN "Disk" ON "Disk".id = "PhotoInDisk".disk_id
+                  WHERE "PhotoInDisk".photo_id = OLD.id) AS lost
+            WHERE "DescriptionCost".description = OLD.description AND lost.cost IS NOT NULL;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "PlacementTotals_disk_deleted"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DescriptionCost" SET total_cost = total_cost - lost.cost
+            FROM (SELECT "Photo".description, SUM(OLD.cost_per_byte::bigint * "Photo".disk_size_needed) AS cost
+                  FROM "PhotoInDisk" INNER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
+                  WHERE "PhotoInDisk".disk_id = OLD.id
+                  GROUP BY "Photo".description) AS lost
+            WHERE "DescriptionCost".description = lost.description;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "PlacementTotals_photo_changed"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DiskUsage" SET used_bytes = used_bytes - OLD.disk_size_needed + NEW.disk_size_needed
+            FROM "PhotoInDisk" WHERE "PhotoInDisk".photo_id = NEW.id AND "DiskUsage".disk_id = "PhotoInDisk".disk_id;
+            UPDATE "DescriptionCost" SET total_cost = total_cost - lost.cost
+            FROM (SELECT SUM("Disk".cost_per_byte::bigint * OLD.disk_size_needed) AS cost
+                  FROM "PhotoInDisk" INNER JOIN "Disk" ON "Disk".id = "PhotoInDisk".disk_id
+                  WHERE "PhotoInDisk".photo_id = NEW.id) AS lost
+            WHERE "DescriptionCost".description = OLD.description AND lost.cost IS NOT NULL;
+            INSERT INTO "DescriptionCost" AS costs (description, total_cost)
+            SELECT NEW.description, SUM("Disk".cost_per_byte::bigint * NEW.disk_size_needed)
+            FROM "PhotoInDisk" INNER JOIN "Disk" ON "Disk".id = "PhotoInDisk".disk_id
+            WHERE "PhotoInDisk".photo_id = NEW.id
+            HAVING COUNT(*) > 0
+            ON CONFLICT (description) DO UPDATE SET total_cost = costs.total_cost + EXCLUDED.total_cost;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "PlacementTotals_disk_changed"() RETURNS trigger AS $$
+        BEGIN
+            UPDATE "DescriptionCost"
+            SET total_cost = total_cost + (NEW.cost_per_byte - OLD.cost_per_byte) * changed.bytes
+            FROM (SELECT "Photo".description, SUM("Photo".disk_size_needed) AS bytes
+                  FROM "PhotoInDisk" INNER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
+                  WHERE "PhotoInDisk".disk_id = NEW.id
+                  GROUP BY "Photo".description) AS changed
+            WHERE "DescriptionCost".description = changed.description;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS "Disk_usage_insert" ON "Disk";
+        CREATE TRIGGER "Disk_usage_insert" AFTER INSERT ON "Disk"
+            FOR EACH ROW EXECUTE FUNCTION "DiskUsage_disk_added"();
+        DROP TRIGGER IF EXISTS "PhotoInDisk_totals_insert" ON "PhotoInDisk";
+        CREATE TRIGGER "PhotoInDisk_totals_insert" AFTER INSERT ON "PhotoInDisk"
+            FOR EACH ROW EXECUTE FUNCTION "PlacementTotals_placed"();
+        DROP TRIGGER IF EXISTS "PhotoInDisk_totals_delete" ON "PhotoInDisk";
+        CREATE TRIGGER "PhotoInDisk_totals_delete" AFTER DELETE ON "PhotoInDisk"
+            FOR EACH ROW EXECUTE FUNCTION "PlacementTotals_removed"();
+        DROP TRIGGER IF EXISTS "Photo_totals_delete" ON "Photo";
+        CREATE TRIGGER "Photo_totals_delete" BEFORE DELETE ON "Photo"
+            FOR EACH ROW EXECUTE FUNCTION "PlacementTotals_photo_deleted"();
+        DROP TRIGGER IF EXISTS "Disk_totals_delete" ON "Disk";
+        CREATE TRIGGER "Disk_totals_delete" BEFORE DELETE ON "Disk"
+            FOR EACH ROW EXECUTE FUNCTION "PlacementTotals_disk_deleted"();
+        DROP TRIGGER IF EXISTS "Photo_totals_update" ON "Photo";
+        CREATE TRIGGER "Photo_totals_update" AFTER UPDATE OF description, disk_size_needed ON "Photo"
+            FOR EACH ROW EXECUTE FUNCTION "PlacementTotals_photo_changed"();
+        DROP TRIGGER IF EXISTS "Disk_totals_update" ON "Disk";
+        CREATE TRIGGER "Disk_totals_update" AFTER UPDATE OF cost_per_byte ON "Disk"
+            FOR EACH ROW EXECUTE FUNCTION "PlacementTotals_disk_changed"();
+
+        INSERT INTO "DiskUsage" (disk_id, used_bytes, photo_count)
+        SELECT "Disk".id, COALESCE(SUM("Photo".disk_size_needed), 0), COUNT("Photo".id)
+        FROM "Disk"
+        LEFT OUTER JOIN "PhotoInDisk" ON "Disk".id = "PhotoInDisk".disk_id
+        LEFT OUTER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
+        GROUP BY "Disk".id
+        ON CONFLICT (disk_id) DO NOTHING;
+
+        INSERT INTO "DescriptionCost" (description, total_cost)
+        SELECT "Photo".description, SUM("Disk".cost_per_byte::bigint * "Photo".disk_size_needed)
+        FROM "PhotoInDisk"
+        INNER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
+        INNER JOIN "Disk" ON "Disk".id = "PhotoInDisk".disk_id
+        GROUP BY "Photo".description
+        ON CONFLICT (description) DO NOTHING;
+
+        -- views the older getClosePhotos/removePhotoFromDisk created on every call
+        DROP VIEW IF EXISTS "PhotoSize", "PhotoNotSavedOnSomeDisk", "DisksPhotoSavedOn";
+
+        CREATE INDEX IF NOT EXISTS "Photo_description_idx" ON "Photo" (description, id) INCLUDE (disk_size_needed);
+        CREATE INDEX IF NOT EXISTS "Photo_disk_size_needed_idx" ON "Photo" (disk_size_needed, id);
+        CREATE INDEX IF NOT EXISTS "PhotoInDisk_disk_id_idx" ON "PhotoInDisk" (disk_id, photo_id);
+        CREATE INDEX IF NOT EXISTS "RAMInDisk_disk_id_idx" ON "RAMInDisk" (disk_id, ram_id);
+"""
+
+# the id walk of Statements.PHOTOS_CAN_BE_ADDED reads sizes from the index instead of the heap
+PHOTO_ID_SIZE_INDEX = """
+        CREATE INDEX IF NOT EXISTS "Photo_id_size_idx" ON "Photo" (id) INCLUDE (disk_size_needed);
+"""
+
+# Replaces the row triggers of migration 1, which serialized every Photo write on one advisory lock and updated the
+# running total of every larger size, with statement triggers that apply each statement's net change per size.
+# "PhotoSizeCounts" keeps only the per-size counts. "PhotoSizeBlocks" counts the photos in every block of 2^level
+# sizes, level 1 to 31, so a write touches one row per level and the photos no larger than a bound are the sum of
+# at most one block per level of the bound's binary decomposition, see "PhotoSizesAtMost".
+PHOTO_SIZE_BLOCKS = """
+        LOCK TABLE "Photo" IN SHARE ROW EXCLUSIVE MODE;
+
+        CREATE TABLE IF NOT EXISTS "PhotoSizeBlocks"
+            (
+                level smallint NOT NULL,
+                block integer NOT NULL,
+                photo_count bigint NOT NULL,
+                PRIMARY KEY (level, block)
+            );
+
+        -- the sizes photos are no larger than bound, below t = bound + 1, are the blocks (t >> level) - 1 of the
+        -- levels whose bit is set in t; level 0 is the bucket of bound itself
+        CREATE OR REPLACE FUNCTION "PhotoSizesAtMost"(bound bigint) RETURNS bigint AS $$
+            SELECT COALESCE(SUM(counts.photo_count), 0)::bigint
+            FROM (SELECT LEAST(bound, 2147483647) + 1 AS t) AS upper
+            CROSS JOIN generate_series(0, 31) AS levels (level)
+            CROSS JOIN LATERAL (
+                SELECT photo_count FROM "PhotoSizeCounts"
+                WHERE levels.level = 0 AND disk_size_needed = upper.t - 1
+                UNION ALL
+                SELECT photo_count FROM "PhotoSizeBlocks"
+                WHERE levels.level > 0 AND "PhotoSizeBlocks".level = levels.level
+                AND "PhotoSizeBlocks".block = (upper.t >> levels.level) - 1
+            ) AS counts
+            WHERE (upper.t >> levels.level) & 1 = 1
+        $$ LANGUAGE sql STABLE PARALLEL SAFE;
+
+        CREATE OR REPLACE VIEW "DiskPhotoCounts" AS
+        SELECT
+            "Disk".id AS disk_id,
+            "PhotoSizesAtMost"("Disk".free_space) AS photo_count,
+            "Disk".speed AS disk_speed
+        FROM "Disk";
+
+        ALTER TABLE "PhotoSizeCounts" DROP COLUMN IF EXISTS cumulative_count;
+
+        -- counts[i] photos more of size sizes[i], negative for fewer; rows are updated in key order, so writers
+        -- touching the same sizes or blocks wait for each other instead of deadlocking
+        CREATE OR REPLACE FUNCTION "PhotoSizeCounts_apply"(sizes integer[], counts bigint[]) RETURNS void AS $$
+            INSERT INTO "PhotoSizeCounts" AS buckets (disk_size_needed, photo_count)
+            SELECT size, change FROM unnest(sizes, counts) AS changes (size, change)
+            ORDER BY size
+            ON CONFLICT (disk_size_needed) DO UPDATE SET photo_count = buckets.photo_count + EXCLUDED.photo_count;
+            DELETE FROM "PhotoSizeCounts" WHERE disk_size_needed = ANY(sizes) AND photo_count = 0;
+            INSERT INTO "PhotoSizeBlocks" AS blocks (level, block, photo_count)
+            SELECT levels.level, changes.size >> levels.level, SUM(changes.change)
+            FROM unnest(sizes, counts) AS changes (size, change) CROSS JOIN generate_series(1, 31) AS levels (level)
+            GROUP BY levels.level, changes.size >> levels.level
+            ORDER BY levels.level, changes.size >> levels.level
+            ON CONFLICT (level, block) DO UPDATE SET photo_count = blocks.photo_count + EXCLUDED.photo_count;
+        $$ LANGUAGE sql;
+
+        CREATE OR REPLACE FUNCTION "PhotoSizeCounts_photos_added"() RETURNS trigger AS $$
+        BEGIN
+            PERFORM "PhotoSizeCounts_apply"(array_agg(disk_size_needed), array_agg(photo_count))
+            FROM (SELECT disk_size_needed, COUNT(*) AS photo_count FROM added GROUP BY disk_size_needed) AS changes
+            HAVING COUNT(*) > 0;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION "PhotoSizeCounts_photos_removed"() RETURNS trigger AS $$
+        BEGIN
+            PERFORM "PhotoSizeCounts_apply"(array_agg(disk_size_needed), array_agg(photo_count))
+            FROM (SELECT disk_size_needed, -COUNT(*) AS photo_count FROM removed GROUP BY disk_size_needed) AS changes
+            HAVING COUNT(*) > 0;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        -- transition tables rule out a column list, so every update fires it; sizes that did not change cancel out
+        CREATE OR REPLACE FUNCTION "PhotoSizeCounts_photos_changed"() RETURNS trigger AS $$
+        BEGIN
+            PERFORM "PhotoSizeCounts_apply"(array_agg(disk_size_needed), array_agg(photo_count))
+            FROM (SELECT disk_size_needed, SUM(change) AS photo_count
+                  FROM (SELECT disk_size_needed, 1 AS change FROM added
+                        UNION ALL SELECT disk_size_needed, -1 FROM removed) AS moves
+                  GROUP BY disk_size_needed HAVING SUM(change) <> 0) AS changes
+            HAVING COUNT(*) > 0;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER IF EXISTS "Photo_size_counts_insert" ON "Photo";
+        DROP TRIGGER IF EXISTS "Photo_size_counts_delete" ON "Photo";
+        DROP TRIGGER IF EXISTS "Photo_size_counts_update_removed" ON "Photo";
+        DROP TRIGGER IF EXISTS "Photo_size_counts_update_added" ON "Photo";
+        DROP TRIGGER IF EXISTS "Photo_size_counts_update" ON "Photo";
+        DROP FUNCTION IF EXISTS "PhotoSizeCounts_photo_added"(), "PhotoSizeCounts_photo_removed"();
+
+        CREATE TRIGGER "Photo_size_counts_insert" AFTER INSERT ON "Photo"
+            REFERENCING NEW TABLE AS added
+            FOR EACH STATEMENT EXECUTE FUNCTION "PhotoSizeCounts_photos_added"();
+        CREATE TRIGGER "Photo_size_counts_delete" AFTER DELETE ON "Photo"
+            REFERENCING OLD TABLE AS removed
+            FOR EACH STATEMENT EXECUTE FUNCTION "PhotoSizeCounts_photos_removed"();
+        CREATE TRIGGER "Photo_size_counts_update" AFTER UPDATE ON "Photo"
+            REFERENCING OLD TABLE AS removed NEW TABLE AS added
+            FOR EACH STATEMENT EXECUTE FUNCTION "PhotoSizeCounts_photos_changed"();
+
+        INSERT INTO "PhotoSizeBlocks" (level, block, photo_count)
+        SELECT levels.level, disk_size_needed >> levels.level, SUM(photo_count)
+        FROM "PhotoSizeCounts" CROSS JOIN generate_series(1, 31) AS levels (level)
+        GROUP BY levels.level, disk_size_needed >> levels.level
+        ON CONFLICT (level, block) DO NOTHING;
+"""
+
+# the tables Cache keeps rows of, with the kind their notifications carry
+CACHED_TABLES = {"Photo": "photo", "Disk": "disk", "RAM": "ram"}
+
+CACHE_EVENTS = {"insert": " REFERENCING NEW TABLE AS changed", "update": " REFERENCING NEW TABLE AS changed",
+                "delete": " REFERENCING OLD TABLE AS changed", "truncate": ""}
+
+CACHE_TRIGGERS = [(table, "{}_cache_{}".format(table, event)) for table in CACHED_TABLES for event in CACHE_EVENTS]
+
+# Statement triggers that NOTIFY Cache.CHANNEL of the ids every write to a cached table changed, "kind:id,id,..." in
+# chunks of 500 ids, and "all:" for a TRUNCATE. The notifications go out with the writer's own commit and not at all
+# on a rollback. Created disabled, Cache.enableNotifications turns them on.
+CACHE_NOTIFY = """
+        CREATE OR REPLACE FUNCTION "Cache_notify"() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                PERFORM pg_notify('solution_cache', 'all:');
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('solution_cache', TG_ARGV[0] || ':' || string_agg(numbered.id::text, ','))
+            FROM (SELECT id, (row_number() OVER () - 1) / 500 AS chunk FROM changed) AS numbered
+            GROUP BY numbered.chunk;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+""" + "".join("""
+        CREATE TRIGGER "{name}" AFTER {event} ON "{table}"{transition}
+            FOR EACH STATEMENT EXECUTE FUNCTION "Cache_notify"('{kind}');
+        ALTER TABLE "{table}" DISABLE TRIGGER "{name}";
+""".format(name="{}_cache_{}".format(table, event), event=event.upper(), table=table, transition=transition, kind=kind)
+    for table, kind in CACHED_TABLES.items() for event, transition in CACHE_EVENTS.items())
+
+# the roomiest disks and the candidate range of Statements.MOST_AVAILABLE_DISKS; placements change free_space, so
+# their Disk updates now also write this index
+DISK_FREE_SPACE_INDEX = """
+        CREATE INDEX IF NOT EXISTS "Disk_free_space_idx" ON "Disk" (free_space) INCLUDE (speed, id);
+"""
+
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, "tables, maintained aggregates, triggers and indexes", BASELINE),
+    (2, "covering id index for the photos that fit on a disk", PHOTO_ID_SIZE_INDEX),
+    (3, "statement-level photo size counts with per-level blocks", PHOTO_SIZE_BLOCKS),
+    (4, "cache invalidation notifications from the writing transaction", CACHE_NOTIFY),
+    (5, "free space index for the most available disks", DISK_FREE_SPACE_INDEX),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def quoted(names: List[str]) -> str:
+    return ", ".join('"{}"'.format(name) for name in names)
+
+
+# one statement each, RESTART IDENTITY CASCADE also covers anything referencing the tables
+TRUNCATE_ALL = "TRUNCATE {} RESTART IDENTITY CASCADE".format(quoted(TABLES + MAINTAINED_TABLES))
+
+DROP_ALL = "DROP VIEW IF EXISTS {}; DROP TABLE IF EXISTS {} CASCADE; DROP FUNCTION IF EXISTS {} CASCADE".format(
+    quoted(VIEWS), quoted(TABLES + MAINTAINED_TABLES + ["SchemaVersion"]), quoted(FUNCTIONS))
+
+
+VERSION_QUERY = 'SELECT COALESCE(MAX(version), 0) FROM "SchemaVersion"'
+
+CACHE_TRIGGERS_DISABLED = "SELECT COUNT(*) FROM pg_trigger WHERE tgname IN ({}) AND tgenabled = 'D'".format(
+    ", ".join("'{}'".format(name) for _, name in CACHE_TRIGGERS))
+
+ENABLE_CACHE_TRIGGERS = "; ".join('ALTER TABLE "{}" ENABLE TRIGGER "{}"'.format(table, name)
+                                  for table, name in CACHE_TRIGGERS)
+
+
+def schemaVersion(conn) -> Optional[int]:
+    """The version the database is at, 0 for an empty SchemaVersion and None if it does not exist."""
+    try:
+        _, entries = conn.execute(VERSION_QUERY)
+        return entries.rows[0][0]
+    except Exception:
+        conn.rollback()
+        return None
+
+
+def migrate(conn) -> int:
+    """Brings the database on conn to LATEST and returns the version it was at before."""
+    version = schemaVersion(conn)
+    if version == LATEST:
+        return version
+    conn.execute("""
+        SELECT pg_advisory_xact_lock({lock});
+        CREATE TABLE IF NOT EXISTS "SchemaVersion"
+            (
+                version integer NOT NULL PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at timestamptz NOT NULL DEFAULT now()
+            );
+    """.format(lock=LOCK_KEY))
+    # another process may have migrated while this one waited for the lock
+    _, entries = conn.execute(VERSION_QUERY)
+    before = entries.rows[0][0]
+    for number, description, script in MIGRATIONS:
+        if number > before:
+            conn.execute(script)
+            conn.execute(sql.SQL('INSERT INTO "SchemaVersion" (version, description) VALUES ({}, {})').format(
+                sql.Literal(number), sql.Literal(description)))
+    conn.commit()
+    return before if version is None else version
@@ -0,0 +1,115 @@
+"""
+Bin-packing planner behind Solution.placePhotos.
+Photos are placed largest first (first-fit decreasing); the strategy decides which of the disks with room a photo
+goes to. Each lookup is O(log disks): disks are kept in a max segment tree over their remaining room, in the order
+the strategy prefers them, or, for best-fit, in a list sorted by remaining room.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+FIRST_FIT_DECREASING = "first-fit-decreasing"
+BEST_FIT = "best-fit"
+CHEAPEST = "cheapest"
+FASTEST = "fastest"
+STRATEGIES = (FIRST_FIT_DECREASING, BEST_FIT, CHEAPEST, FASTEST)
+
+
+class DiskCandidate:
+    def __init__(self, disk_id: int, free_space: int, speed: int, cost_per_byte: int, total_ram: Optional[int]):
+        self.disk_id = disk_id
+        self.free_space = free_space
+        self.speed = speed
+        self.cost_per_byte = cost_per_byte
+        self.total_ram = total_ram
+
+    def room(self, respectRAM: bool) -> int:
+        """The largest photo the disk can still take."""
+        if respectRAM:
+            return min(self.free_space, self.total_ram or 0)
+        return self.free_space
+
+
+class MaxTree:
+    """Segment tree over a fixed sequence of values, finding the first position at or after `start` with value >= x."""
+
+    def __init__(self, values: List[int]):
+        self.size = 1
+        while self.size < max(1, len(values)):
+            self.size *= 2
+        self.tree = [-1] * (2 * self.size)
+        self.tree[self.size:self.size + len(values)] = values
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def update(self, position: int, value: int):
+        node = position + self.size
+        self.tree[node] = value
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def first(self, x: int, start: int = 0) -> Optional[int]:
+        return self._first(1, 0, self.size, x, start)
+
+    def _first(self, node: int, low: int, high: int, x: int, start: int) -> Optional[int]:
+        if high <= start or self.tree[node] < x:
+            return None
+        if high - low == 1:
+            return low
+        middle = (low + high) // 2
+        found = self._first(2 * node, low, middle, x, start)
+        if found is None:
+            found = self._first(2 * node + 1, middle, high, x, start)
+        return found
+
+
+def preference(strategy: str):
+    if strategy == CHEAPEST:
+        return lambda disk: (disk.cost_per_byte, disk.disk_id)
+    if strategy == FASTEST:
+        return lambda disk: (-disk.speed, disk.disk_id)
+    return lambda disk: disk.disk_id
+
+
+def plan(photos: Iterable[Tuple[int, int]], disks: List[DiskCandidate], placed: Set[Tuple[int, int]],
+         strategy: str = FIRST_FIT_DECREASING, respectRAM: bool = False) -> Tuple[Dict[int, int], List[int]]:
+    """
+    Assigns every (photo_id, size) to one disk with room that does not hold the photo yet, updating the disks'
+    free_space as it goes. Returns {photo_id: disk_id} and the ids of the photos no disk could take.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError("unknown placement strategy {}".format(strategy))
+    ordered = sorted(photos, key=lambda photo: (-photo[1], photo[0]))
+    placement = {}
+    unplaced = []
+    if strategy == BEST_FIT:
+        rooms = sorted((disk.room(respectRAM), disk.disk_id) for disk in disks)
+        byID = {disk.disk_id: disk for disk in disks}
+        for photo_id, size in ordered:
+            index = bisect_left(rooms, (size, 0))
+            while index < len(rooms) and (photo_id, rooms[index][1]) in placed:
+                index += 1
+            if index == len(rooms):
+                unplaced.append(photo_id)
+                continue
+            _, disk_id = rooms.pop(index)
+            disk = byID[disk_id]
+            disk.free_space -= size
+            insort(rooms, (disk.room(respectRAM), disk_id))
+            placement[photo_id] = disk_id
+        return placement, unplaced
+    disks = sorted(disks, key=preference(strategy))
+    tree = MaxTree([disk.room(respectRAM) for disk in disks])
+    for photo_id, size in ordered:
+        index = tree.first(size)
+        while index is not None and (photo_id, disks[index].disk_id) in placed:
+            index = tree.first(size, index + 1)
+        if index is None:
+            unplaced.append(photo_id)
+            continue
+        disk = disks[index]
+        disk.free_space -= size
+        tree.update(index, disk.room(respectRAM))
+        placement[photo_id] = disk.disk_id
+    return placement, unplaced
@@ -0,0 +1,153 @@
+import argparse
+import json
+from typing import Dict, List, Tuple
+
+import ConnectionPool
+import Statements
+
+SAMPLE_PARAMS = {"integer": 1, "bigint": 10, "text": "sample", "integer[]": [1], "text[]": ["sample"]}
+
+# scan nodes and the plan key holding the condition that bounds them; without it the node reads the whole relation
+SCAN_CONDITIONS = {
+    "Seq Scan": None,
+    "Index Scan": "Index Cond",
+    "Index Only Scan": "Index Cond",
+    "Bitmap Heap Scan": "Recheck Cond",
+}
+
+# nodes that pass rows on one at a time, so a Limit above them stops their outer input early too
+STREAMING = {"Limit", "Unique", "Result", "Subquery Scan", "Nested Loop"}
+
+# relations smaller than this are read in full by any plan and are not judged
+MIN_ROWS = 1000
+
+RELTUPLES = """
+    SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace
+"""
+
+
+def fullScans(plan: dict, limited: bool = False) -> List[str]:
+    """
+    Relations a plan reads without a condition: sequential scans, and index or bitmap scans with no index condition.
+    An index walked in order under a Limit with no Filter reads only the rows the Limit returns and is not counted.
+    """
+    relations = []
+    node = plan.get("Node Type")
+    if node in SCAN_CONDITIONS:
+        condition = SCAN_CONDITIONS[node]
+        bounded = limited and condition is not None and "Filter" not in plan
+        if (condition is None or condition not in plan) and not bounded:
+            relations.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        streamed = node in STREAMING and child.get("Parent Relationship") in ("Outer", "Subquery")
+        relations.extend(fullScans(child, (node == "Limit" or limited) and streamed))
+    return relations
+
+
+def rowsRead(plan: dict) -> Dict[str, float]:
+    """Rows each relation's scan nodes read in an EXPLAIN ANALYZE plan, including those their filters dropped."""
+    read = {}
+    if plan.get("Node Type") in SCAN_CONDITIONS:
+        rows = (plan.get("Actual Rows", 0) + plan.get("Rows Removed by Filter", 0)
+                + plan.get("Rows Removed by Index Recheck", 0))
+        relation = plan.get("Relation Name")
+        read[relation] = read.get(relation, 0) + rows * plan.get("Actual Loops", 1)
+    for child in plan.get("Plans", []):
+        for relation, rows in rowsRead(child).items():
+            read[relation] = read.get(relation, 0) + rows
+    return read
+
+
+def planOf(entries) -> dict:
+    plan = entries.rows[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def checkQueryPlans(statements: List[Statements.Statement] = None) -> Dict[str, List[str]]:
+    """
+    Runs EXPLAIN on every registered statement and returns, per statement, the relations the plan reads in full,
+    see fullScans.
+    Sequential scans are switched off for the check, so on a small test database the planner still picks an index
+    whenever one can serve the query - what it would do at 10M rows. A relation left in the result is read whole
+    through whichever scan the planner found; whether that is more than the statement returns takes data to tell,
+    see checkRowsRead.
+    """
+    if statements is None:
+        statements = list(Statements.registry.statements.values())
+    conn = None
+    result = {}
+    try:
+        conn = ConnectionPool.getConnection()
+        conn.execute("SET LOCAL enable_seqscan = off")
+        for statement in statements:
+            params = [SAMPLE_PARAMS[paramType] for paramType in statement.paramTypes]
+            _, entries = Statements.registry.explain(conn, statement, *params)
+            result[statement.name] = fullScans(planOf(entries))
+    finally:
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+    return result
+
+
+def checkRowsRead(statements: List[Statements.Statement] = None,
+                  share: float = 0.5) -> Dict[str, List[Tuple[str, int, int]]]:
+    """
+    Runs every registered statement under EXPLAIN ANALYZE against the loaded data and returns, per statement,
+    (relation, rows read, reltuples) for each relation of at least MIN_ROWS rows that the statement reads at
+    least share of while returning less than share of it - a full read the result does not need.
+    Each statement runs in a savepoint that is rolled back, and so is the ANALYZE that refreshes reltuples;
+    statements that fail on the sample parameters are skipped. An empty database has nothing to judge, so it is an
+    error: load one at a realistic scale first, e.g. with Benchmark.Data.
+    """
+    if statements is None:
+        statements = list(Statements.registry.statements.values())
+    conn = None
+    result = {}
+    try:
+        conn = ConnectionPool.getConnection()
+        conn.execute("ANALYZE")
+        _, entries = conn.execute(RELTUPLES)
+        reltuples = {relation: tuples for relation, tuples in entries.rows}
+        if max(reltuples.values(), default=0) < MIN_ROWS:
+            raise ValueError("no table has {} rows to judge the plans by, load a dataset first".format(MIN_ROWS))
+        for statement in statements:
+            params = [SAMPLE_PARAMS[paramType] for paramType in statement.paramTypes]
+            conn.execute("SAVEPOINT query_plan")
+            try:
+                _, entries = Statements.registry.explain(conn, statement, *params, analyze=True)
+                plan = planOf(entries)
+            except Exception:
+                plan = None
+            conn.execute("ROLLBACK TO SAVEPOINT query_plan")
+            if plan is None:
+                continue
+            returned = plan.get("Actual Rows", 0) * plan.get("Actual Loops", 1)
+            result[statement.name] = [(relation, int(rows), int(reltuples.get(relation, 0)))
+                                      for relation, rows in sorted(rowsRead(plan).items())
+                                      if reltuples.get(relation, 0) >= MIN_ROWS
+                                      and rows >= share * reltuples[relation] > returned]
+    finally:
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fails on statements that read most of a table they do not return.")
+    parser.add_argument("--load", type=int, default=None, metavar="PHOTOS",
+                        help="first recreate the schema with a Benchmark.Data dataset of this many photos")
+    args = parser.parse_args()
+    if args.load is not None:
+        from Benchmark import Data
+        Data.load(Data.DataSpec(photos=args.load))
+    failures = {name: scans for name, scans in checkRowsRead().items() if scans}
+    for name, scans in sorted(failures.items()):
+        for relation, rows, tuples in scans:
+            print("{}: reads {} of the {} rows of {}".format(name, rows, tuples, relation))
+    if failures:
+        raise SystemExit(1)
+    print("no statement reads a table it does not return in {} statements".format(len(Statements.registry.statements)))
@@ -0,0 +1,377 @@
+"""
+Read/write splitting for the Solution API. Every public function is tagged in Solution: READS run on a streaming
+replica, PRIMARY_READS and all the writes run on the primary. Once replicas are configured
+
+    Replicas.configureReplicas(["host=replica1 dbname=hw2", "host=replica2 dbname=hw2"], maxLagSeconds=1.0)
+
+reads are spread round robin over the replicas, and everything else keeps using the primary pool of ConnectionPool.
+A read sees the writes made before it on the same thread: the first read after writes that returned OK (or, for a
+batch, an OK among its results) asks the primary for its WAL position (LSN), and only goes to a replica that has
+replayed up to it. writeToken() and readAfter() carry that position to another thread or process. A replica that has not caught up, or lags by more than maxLagSeconds,
+is skipped, and when no replica qualifies the read falls back to the primary. A replica that fails ejectAfter times
+in a row, on connecting or with a connection error mid-call, is ejected for ejectFor seconds and then probed again;
+a read that lost its replica mid-call is answered by the primary. Every decision is counted per function and route,
+see stats() and prometheusText(), and is the route of the call's Instrumentation record.
+
+Calls made while a connection provider is bound, in a UnitOfWork.Session or on a Sharding shard, are not routed.
+With no replicas configured, which is the default, every call runs as before.
+"""
+import functools
+import inspect
+import threading
+import time
+from itertools import count
+from typing import Callable, Dict, List, Optional, Tuple
+
+import ConnectionPool
+import Instrumentation
+import Statements
+from Utility.Exceptions import DatabaseException
+from Utility.ReturnValue import ReturnValue
+
+READ = "read"
+WRITE = "write"
+PRIMARY = "primary"
+
+# the routes a call can take, as counted by the metrics
+ROUTE_REPLICA = "replica"
+ROUTE_WRITE = "primary_write"
+ROUTE_PRIMARY_READ = "primary_read"
+ROUTE_LAGGING = "primary_lagging"
+ROUTE_UNHEALTHY = "primary_unhealthy"
+ROUTE_RETRIED = "primary_retried"
+
+# connection exceptions and operator intervention, e.g. a standby shutting down; other errors are the query's own
+UNHEALTHY_SQLSTATE_CLASSES = ("08", "57")
+
+# the position of a server that is not in recovery: it is the primary itself and always current
+NOT_A_STANDBY = float("inf")
+
+
+def parseLSN(text: str) -> int:
+    """A pg_lsn as text, e.g. 16/B374D848, as a number that orders the same way."""
+    high, low = text.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def isUnhealthy(error: BaseException) -> bool:
+    if isinstance(error, DatabaseException.ConnectionInvalid):
+        return True
+    state = ConnectionPool.sqlState(error)
+    return state is not None and state[:2] in UNHEALTHY_SQLSTATE_CLASSES
+
+
+class ReplicaConnection:
+    """What ConnectionPool.getConnection() returns while a read runs on a replica; it reports connection errors."""
+
+    def __init__(self, replica, conn: ConnectionPool.PooledConnection):
+        self.replica = replica
+        self.conn = conn
+
+    @property
+    def connector(self):
+        return self.conn.connector
+
+    @property
+    def prepared(self) -> set:
+        return self.conn.prepared
+
+    def execute(self, query):
+        try:
+            return self.conn.execute(query)
+        except Exception as error:
+            self.replica.failed(error)
+            raise
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class Replica:
+    def __init__(self, name: str, dsn: str, minSize: int, maxSize: int):
+        self.name = name
+        self.dsn = dsn
+        self.pool = ConnectionPool.ConnectionPool(factory=functools.partial(ConnectionPool.DSNConnector, dsn),
+                                                  minSize=minSize, maxSize=maxSize)
+        self.replayed = 0
+        self.lagSeconds = 0.0
+        self.checkedAt = float("-inf")
+        self.failures = 0
+        self.ejectedUntil = 0.0
+        self.reads = 0
+        self.ejections = 0
+        self._lock = threading.Lock()
+
+    def getConnection(self) -> ReplicaConnection:
+        try:
+            conn = self.pool.getConnection()
+        except Exception as error:
+            self.failed(error)
+            raise
+        return ReplicaConnection(self, conn)
+
+    def failed(self, error: BaseException, always: bool = False):
+        if not always and not isUnhealthy(error):
+            return
+        _local.failed = True
+        with self._lock:
+            self.failures += 1
+            if self.failures >= _ejectAfter and self.ejectedUntil <= time.monotonic():
+                self.ejectedUntil = time.monotonic() + _ejectFor
+                self.ejections += 1
+
+    def refresh(self) -> bool:
+        """Reads how far the replica has replayed; a replica whose status cannot be read counts as failing."""
+        conn = None
+        try:
+            conn = self.pool.getConnection()
+            _, entries = Statements.execute(conn, Statements.REPLICA_STATUS)
+            replayed, lagSeconds = entries.rows[0]
+        except Exception as error:
+            self.failed(error, always=True)
+            return False
+        finally:
+            if conn is not None:
+                conn.close()
+        with self._lock:
+            self.replayed = parseLSN(replayed) if replayed is not None else NOT_A_STANDBY
+            self.lagSeconds = float(lagSeconds)
+            self.checkedAt = time.monotonic()
+            self.failures = 0
+            self.ejectedUntil = 0.0
+        return True
+
+    def route(self, required: float) -> str:
+        """ROUTE_REPLICA if a read that has to see LSN required can run here, else why it cannot."""
+        now = time.monotonic()
+        with self._lock:
+            if self.ejectedUntil > now:
+                return ROUTE_UNHEALTHY
+            fresh = now - self.checkedAt < _refreshInterval
+            if fresh and self.lagSeconds > _maxLagSeconds:
+                return ROUTE_LAGGING
+            current = fresh and self.replayed >= required
+        # a stale status is read again, and so is a fresh one that is behind this thread's last write
+        if not current and not self.refresh():
+            return ROUTE_UNHEALTHY
+        with self._lock:
+            if self.lagSeconds > _maxLagSeconds or self.replayed < required:
+                return ROUTE_LAGGING
+        return ROUTE_REPLICA
+
+    def served(self):
+        with self._lock:
+            self.reads += 1
+
+    def resetStats(self):
+        with self._lock:
+            self.reads = 0
+            self.ejections = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"name": self.name, "reads": self.reads, "failures": self.failures, "ejections": self.ejections,
+                    "ejected": self.ejectedUntil > time.monotonic(), "lag_seconds": self.lagSeconds,
+                    "replayed_lsn": self.replayed if self.replayed != NOT_A_STANDBY else None}
+
+
+_replicas: List[Replica] = []
+_maxLagSeconds = 1.0
+_refreshInterval = 0.5
+_ejectAfter = 3
+_ejectFor = 30.0
+_turns = count()
+_local = threading.local()
+_routes: Dict[Tuple[str, str], int] = {}
+_routesLock = threading.Lock()
+
+
+def configureReplicas(dsns: List[str], maxLagSeconds: float = 1.0, refreshInterval: float = 0.5,
+                      ejectAfter: int = 3, ejectFor: float = 30.0, minSize: int = 0,
+                      maxSize: int = 10) -> List[Replica]:
+    """
+    One pool per replica connection string; an empty list turns routing off. refreshInterval is how long a
+    replica's replay position and lag are trusted before they are read again.
+    """
+    global _replicas, _maxLagSeconds, _refreshInterval, _ejectAfter, _ejectFor
+    _maxLagSeconds = maxLagSeconds
+    _refreshInterval = refreshInterval
+    _ejectAfter = ejectAfter
+    _ejectFor = ejectFor
+    old, _replicas = _replicas, [Replica("replica{}".format(index), dsn, minSize, maxSize)
+                                 for index, dsn in enumerate(dsns)]
+    for replica in old:
+        replica.pool.closeAll()
+    return _replicas
+
+
+def configured() -> bool:
+    return bool(_replicas)
+
+
+def writeToken() -> float:
+    """The WAL position this thread's reads wait for, to hand to readAfter() on another thread."""
+    if getattr(_local, "pending", False):
+        _local.pending = False
+        _local.lsn = primaryPosition()
+    return getattr(_local, "lsn", 0)
+
+
+def readAfter(token: float):
+    """Reads on this thread see at least what the primary had at token, e.g. another thread's writeToken()."""
+    _local.lsn = max(writeToken(), token)
+
+
+def primaryPosition() -> float:
+    conn = None
+    try:
+        conn = ConnectionPool.getPool().getConnection()
+        _, entries = Statements.execute(conn, Statements.CURRENT_WAL_LSN)
+        return parseLSN(entries.rows[0][0])
+    except Exception:
+        # without the position no replica is known to have the write, so reads stay on the primary until the next one
+        return NOT_A_STANDBY
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def noteWrite():
+    """
+    Records that this thread committed a write on the primary. The primary's WAL position is only read when a read
+    or writeToken() needs it, so a run of writes costs one extra round trip at most.
+    """
+    if _replicas:
+        _local.pending = True
+
+
+def notePosition(lsn: str):
+    """Records a WAL position read after a commit, e.g. on the connection that made it, instead of noteWrite()."""
+    if _replicas:
+        _local.pending = False
+        _local.lsn = max(getattr(_local, "lsn", 0), parseLSN(lsn))
+
+
+def wrote(result) -> bool:
+    """Whether a write function's result says it may have changed something, see the module docstring."""
+    if isinstance(result, ReturnValue):
+        return result == ReturnValue.OK
+    if isinstance(result, tuple) and result:
+        # (ReturnValue, id) of addPhotoToAnyDisk, (placement, unplaced) of placePhotos
+        return wrote(result[0])
+    if isinstance(result, list):
+        return any(wrote(item) for item in result)
+    if isinstance(result, dict):
+        return bool(result)
+    # createTables and the other schema functions return nothing and raise on failure
+    return True
+
+
+def choose() -> Tuple[Optional[Replica], str]:
+    """The next replica, round robin, that can serve this thread's read, or None and why the primary serves it."""
+    replicas = _replicas
+    start = next(_turns)
+    reason = ROUTE_UNHEALTHY
+    for offset in range(len(replicas)):
+        replica = replicas[(start + offset) % len(replicas)]
+        route = replica.route(writeToken())
+        if route == ROUTE_REPLICA:
+            return replica, route
+        if route == ROUTE_LAGGING:
+            reason = route
+    return None, reason
+
+
+def decided(function: str, route: str):
+    record = Instrumentation.current()
+    if record is not None:
+        record.route = route
+    with _routesLock:
+        _routes[(function, route)] = _routes.get((function, route), 0) + 1
+
+
+def routed(function: Callable, kind: str) -> Callable:
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _replicas or ConnectionPool.boundProvider() is not None:
+            return function(*args, **kwargs)
+        if kind == WRITE:
+            decided(name, ROUTE_WRITE)
+            result = function(*args, **kwargs)
+            if wrote(result):
+                noteWrite()
+            return result
+        replica, route = choose() if kind == READ else (None, ROUTE_PRIMARY_READ)
+        if replica is None:
+            decided(name, route)
+            return function(*args, **kwargs)
+        _local.failed = False
+        previous = ConnectionPool.bindThread(replica.getConnection)
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            if not _local.failed:
+                raise
+            result = None
+        finally:
+            ConnectionPool.bindThread(previous)
+        if inspect.isgenerator(result):
+            decided(name, ROUTE_REPLICA)
+            return ConnectionPool.bindStream(replica.getConnection, result)
+        if _local.failed:
+            # the replica went away under the call, whose result is only its error value
+            decided(name, ROUTE_RETRIED)
+            return function(*args, **kwargs)
+        replica.served()
+        decided(name, ROUTE_REPLICA)
+        return result
+
+    return wrapper
+
+
+def routeModule(namespace: dict, names: List[str], reads: List[str], primaryReads: List[str]):
+    """Replaces the named functions of a module, given as its globals(), with routed versions; the rest are writes."""
+    for name in names:
+        kind = READ if name in reads else PRIMARY if name in primaryReads else WRITE
+        namespace[name] = routed(namespace[name], kind)
+
+
+def stats() -> dict:
+    """Calls per function and route, and per replica its reads, failures, ejections and last known lag."""
+    with _routesLock:
+        routes = {}
+        for (function, route), value in _routes.items():
+            routes.setdefault(function, {})[route] = value
+    return {"routes": routes, "replicas": [replica.stats() for replica in _replicas]}
+
+
+def resetStats():
+    with _routesLock:
+        _routes.clear()
+    for replica in _replicas:
+        replica.resetStats()
+
+
+def prometheusText(prefix: str = "solution") -> str:
+    lines = ["# TYPE {}_routed_calls_total counter".format(prefix)]
+    with _routesLock:
+        for (function, route), value in sorted(_routes.items()):
+            lines.append('{}_routed_calls_total{{function="{}",route="{}"}} {}'.format(prefix, function, route, value))
+    replicas = [replica.stats() for replica in _replicas]
+    for metric, kind, key in (("replica_reads_total", "counter", "reads"),
+                              ("replica_ejections_total", "counter", "ejections"),
+                              ("replica_ejected", "gauge", "ejected"),
+                              ("replica_lag_seconds", "gauge", "lag_seconds")):
+        lines.append("# TYPE {}_{} {}".format(prefix, metric, kind))
+        for replica in replicas:
+            lines.append('{}_{}{{replica="{}"}} {}'.format(prefix, metric, replica["name"], int(replica[key])
+                                                           if isinstance(replica[key], bool) else replica[key]))
+    return "\n".join(lines) + "\n"
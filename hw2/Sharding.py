@@ -0,0 +1,565 @@
+"""
+The Solution API over several PostgreSQL databases. Disk, PhotoInDisk and RAMInDisk are partitioned by disk id,
+disk d living on shard d % N, and Photo and RAM are replicated to every shard, so each shard keeps the whole schema
+with its foreign keys and triggers, and Solution itself runs unchanged against any one of them:
+
+    Sharding.configureShards(["host=localhost port=5433 dbname=hw2", "host=localhost port=5434 dbname=hw2"])
+    Sharding.createTables()
+    Sharding.addPhotoToDisk(photo, 12)      # Solution.addPhotoToDisk on shard 12 % 2
+
+or Backend.configureBackend(Backend.SHARDED) with the connection strings in SOLUTION_SHARDS, separated by ";".
+
+A call about one disk runs on that disk's shard, a photo or RAM write runs on shard 0 first and, when it succeeded
+there, on the other shards in parallel; a read of a photo or RAM can use any copy. The queries over all disks run on
+every shard in parallel and their partial results are merged: top-5 lists from each shard's own top 5, conflicting
+disks from the photos placed on more than one disk over all shards, close photos from per-shard shared-disk counts.
+Writes to several shards are not atomic across them: a replica that fails to apply a photo or RAM write, or a
+placePhotos whose commit fails on one shard after another committed, leaves the shards to be repaired by hand.
+Placement is by modulo, so changing the number of shards means reloading the data.
+"""
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import groupby, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import Cache
+import ConnectionPool
+import Instrumentation
+import Placement
+import Solution
+import Statements
+from Business.Disk import Disk
+from Business.Photo import Photo
+from Business.RAM import RAM
+from Utility.ReturnValue import ReturnValue
+
+
+class Shard:
+    def __init__(self, index: int, dsn: str, minSize: int, maxSize: int):
+        self.index = index
+        self.dsn = dsn
+        self.pool = ConnectionPool.ConnectionPool(factory=partial(ConnectionPool.DSNConnector, dsn), minSize=minSize,
+                                                  maxSize=maxSize)
+
+
+_shards: List[Shard] = []
+_executor: Optional[ThreadPoolExecutor] = None
+_shardsLock = threading.Lock()
+
+
+def install(dsns: List[str], minSize: int, maxSize: int):
+    # called with _shardsLock held, returns what it replaced for the caller to shut down outside the lock
+    global _shards, _executor
+    old = _shards, _executor
+    _shards = [Shard(index, dsn, minSize, maxSize) for index, dsn in enumerate(dsns)]
+    _executor = ThreadPoolExecutor(max_workers=4 * len(dsns), thread_name_prefix="shard")
+    return old
+
+
+def configureShards(dsns: List[str], minSize: int = 1, maxSize: int = 10) -> List[Shard]:
+    """One pool per connection string, in shard order; the order decides where every disk lives."""
+    if not dsns:
+        raise ValueError("at least one shard is needed")
+    with _shardsLock:
+        old, oldExecutor = install(dsns, minSize, maxSize)
+    for shard in old:
+        shard.pool.closeAll()
+    if oldExecutor is not None:
+        oldExecutor.shutdown(wait=False)
+    Cache.clearAll()
+    return _shards
+
+
+def getShards() -> List[Shard]:
+    if not _shards:
+        dsns = [dsn.strip() for dsn in os.environ.get("SOLUTION_SHARDS", "").split(";") if dsn.strip()]
+        if not dsns:
+            raise ValueError("no shards configured, call configureShards() or set SOLUTION_SHARDS")
+        with _shardsLock:
+            if not _shards:
+                install(dsns, 1, 10)
+    return _shards
+
+
+def shardOf(diskID: int) -> Shard:
+    """The shard holding the disk; ids that are not integers go to shard 0, where Solution rejects them."""
+    shards = getShards()
+    return shards[diskID % len(shards)] if isinstance(diskID, int) else shards[0]
+
+
+def replicaOf(key: int) -> Shard:
+    """The copy of a replicated row to read, spread over the shards by id."""
+    return shardOf(key)
+
+
+def onShard(shard: Shard, function: Callable, *args, **kwargs):
+    """Runs a Solution function with every connection it asks the pool for taken from the shard's pool."""
+    previous = ConnectionPool.bindThread(shard.pool.getConnection)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        ConnectionPool.bindThread(previous)
+
+
+def streamOnShard(shard: Shard, function: Callable, *args, **kwargs) -> Iterator:
+    return ConnectionPool.bindStream(shard.pool.getConnection, function(*args, **kwargs))
+
+
+def scatter(function: Callable, *args, shards: List[Shard] = None) -> list:
+    """Runs function(*args) on every shard, or on the given ones, in parallel; the results come in shard order."""
+    shards = getShards() if shards is None else shards
+    if len(shards) == 1:
+        return [onShard(shards[0], function, *args)]
+    futures = [_executor.submit(onShard, shard, function, *args) for shard in shards]
+    return [future.result() for future in futures]
+
+
+def query(shard: Shard, statement: Statements.Statement, *params) -> list:
+    conn = None
+    try:
+        conn = shard.pool.getConnection()
+        _, entries = Statements.execute(conn, statement, *params)
+        return entries.rows
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def gather(statement: Statements.Statement, *params) -> List[list]:
+    """The rows of the statement on every shard, in shard order. Raises when any shard fails."""
+    shards = getShards()
+    if len(shards) == 1:
+        return [query(shards[0], statement, *params)]
+    futures = [_executor.submit(query, shard, statement, *params) for shard in shards]
+    return [future.result() for future in futures]
+
+
+def replicated(function: Callable, *args):
+    """A write to a replicated table: shard 0 decides the result, the other shards follow when it is OK."""
+    shards = getShards()
+    result = onShard(shards[0], function, *args)
+    if result == ReturnValue.OK and len(shards) > 1:
+        scatter(function, *args, shards=shards[1:])
+    return result
+
+
+def byShard(items: List, diskID: Callable) -> Dict[int, List[int]]:
+    """Positions of the items grouped by the index of the shard holding each item's disk."""
+    groups = {}
+    for position, item in enumerate(items):
+        groups.setdefault(shardOf(diskID(item)).index, []).append(position)
+    return groups
+
+
+def partitioned(function: Callable, items: List, diskID: Callable, *args) -> list:
+    """Runs a batch function on each shard with that shard's items and puts the results back in the items' order."""
+    shards = getShards()
+    groups = byShard(items, diskID)
+    futures = {index: _executor.submit(onShard, shards[index], function, [items[p] for p in positions], *args)
+               for index, positions in groups.items()}
+    result = [None] * len(items)
+    for index, positions in groups.items():
+        for position, value in zip(positions, futures[index].result()):
+            result[position] = value
+    return result
+
+
+def limited(ids: Iterable[int], limit: Optional[int]) -> List[int]:
+    return list(ids) if limit is None else list(islice(ids, max(limit, 0)))
+
+
+def createTables():
+    scatter(Solution.createTables)
+
+
+def clearTables():
+    scatter(Solution.clearTables)
+
+
+def dropTables():
+    scatter(Solution.dropTables)
+
+
+def addPhoto(photo: Photo) -> ReturnValue:
+    return replicated(Solution.addPhoto, photo)
+
+
+def getPhotoByID(photoID: int) -> Photo:
+    return onShard(replicaOf(photoID), Solution.getPhotoByID, photoID)
+
+
+def deletePhoto(photo: Photo) -> ReturnValue:
+    return replicated(Solution.deletePhoto, photo)
+
+
+def addDisk(disk: Disk) -> ReturnValue:
+    return onShard(shardOf(disk.getDiskID()), Solution.addDisk, disk)
+
+
+def getDiskByID(diskID: int) -> Disk:
+    return onShard(shardOf(diskID), Solution.getDiskByID, diskID)
+
+
+def deleteDisk(diskID: int) -> ReturnValue:
+    return onShard(shardOf(diskID), Solution.deleteDisk, diskID)
+
+
+def addRAM(ram: RAM) -> ReturnValue:
+    return replicated(Solution.addRAM, ram)
+
+
+def getRAMByID(ramID: int) -> RAM:
+    return onShard(replicaOf(ramID), Solution.getRAMByID, ramID)
+
+
+def deleteRAM(ramID: int) -> ReturnValue:
+    return replicated(Solution.deleteRAM, ramID)
+
+
+def getPhotosByIDs(photoIDs: Iterable[int], views: bool = False) -> List[Photo]:
+    return onShard(getShards()[0], Solution.getPhotosByIDs, list(photoIDs), views)
+
+
+def getDisksByIDs(diskIDs: Iterable[int], views: bool = False) -> List[Disk]:
+    return partitioned(Solution.getDisksByIDs, list(diskIDs), lambda diskID: diskID, views)
+
+
+def getRAMsByIDs(ramIDs: Iterable[int], views: bool = False) -> List[RAM]:
+    return onShard(getShards()[0], Solution.getRAMsByIDs, list(ramIDs), views)
+
+
+def addDiskAndPhoto(disk: Disk, photo: Photo) -> ReturnValue:
+    """Both rows go in together on the disk's shard, the photo is then copied to the others."""
+    home = shardOf(disk.getDiskID())
+    result = onShard(home, Solution.addDiskAndPhoto, disk, photo)
+    if result == ReturnValue.OK:
+        others = [shard for shard in getShards() if shard is not home]
+        if others:
+            scatter(Solution.addPhoto, photo, shards=others)
+    return result
+
+
+def addPhotoToDisk(photo: Photo, diskID: int) -> ReturnValue:
+    return onShard(shardOf(diskID), Solution.addPhotoToDisk, photo, diskID)
+
+
+def addPhotoToAnyDisk(photo: Photo) -> Tuple[ReturnValue, Optional[int]]:
+    """
+    Every shard proposes its lowest-id disk with room, the lowest proposal is placed with addPhotoToDisk on its shard.
+    If another writer took the room or placed the photo there in between, the shards are asked again.
+    """
+    result = ReturnValue.ERROR, None
+    try:
+        for _ in range(Solution.RETRY_ATTEMPTS):
+            candidates = [rows[0] for rows in gather(Statements.SHARD_ANY_DISK_CANDIDATE,
+                                                     *Solution.photoParams(photo))]
+            disks = [disk_id for disk_id, _ in candidates if disk_id is not None]
+            if not disks:
+                photo_exists = any(exists for _, exists in candidates)
+                result = (ReturnValue.BAD_PARAMS if photo_exists else ReturnValue.NOT_EXISTS), None
+                break
+            diskID = min(disks)
+            if addPhotoToDisk(photo, diskID) == ReturnValue.OK:
+                result = ReturnValue.OK, diskID
+                break
+    except Exception as e:
+        result = ReturnValue.ERROR, None
+    return result
+
+
+def removePhotoFromDisk(photo: Photo, diskID: int) -> ReturnValue:
+    return onShard(shardOf(diskID), Solution.removePhotoFromDisk, photo, diskID)
+
+
+def addRAMToDisk(ramID: int, diskID: int) -> ReturnValue:
+    return onShard(shardOf(diskID), Solution.addRAMToDisk, ramID, diskID)
+
+
+def removeRAMFromDisk(ramID: int, diskID: int) -> ReturnValue:
+    return onShard(shardOf(diskID), Solution.removeRAMFromDisk, ramID, diskID)
+
+
+def addReplicated(function: Callable, rows: Iterable, chunkSize: int) -> List[ReturnValue]:
+    """addPhotos/addRAMs: the batch runs on shard 0 and the rows it accepted are copied to the other shards."""
+    shards = getShards()
+    rows = list(rows)
+    result = onShard(shards[0], function, rows, chunkSize)
+    accepted = [row for row, value in zip(rows, result) if value == ReturnValue.OK]
+    if accepted and len(shards) > 1:
+        scatter(function, accepted, chunkSize, shards=shards[1:])
+    return result
+
+
+def addPhotos(photos: Iterable[Photo], chunkSize: int = Solution.BATCH_SIZE) -> List[ReturnValue]:
+    return addReplicated(Solution.addPhotos, photos, chunkSize)
+
+
+def addDisks(disks: Iterable[Disk], chunkSize: int = Solution.BATCH_SIZE) -> List[ReturnValue]:
+    return partitioned(Solution.addDisks, list(disks), lambda disk: disk.getDiskID(), chunkSize)
+
+
+def addRAMs(rams: Iterable[RAM], chunkSize: int = Solution.BATCH_SIZE) -> List[ReturnValue]:
+    return addReplicated(Solution.addRAMs, rams, chunkSize)
+
+
+def addPhotosToDisk(placements: Iterable[Tuple[Photo, int]], chunkSize: int = Solution.BATCH_SIZE) \
+        -> List[ReturnValue]:
+    return partitioned(Solution.addPhotosToDisk, list(placements), lambda placement: placement[1], chunkSize)
+
+
+def placePhotos(photoIDs: Iterable[int], strategy: str = Placement.FIRST_FIT_DECREASING,
+                respectRAM: bool = False) -> Tuple[Dict[int, int], List[int]]:
+    """
+    Solution.placePhotos over all shards: one plan is made over the unlocked disks of every shard, each shard locks
+    and checks the disks it was given, one shard after the other in shard order so concurrent callers cannot
+    deadlock, and then writes and commits its part. A stale plan is made again as in Solution.placePhotos, the
+    last time with the disks of every shard locked.
+    """
+    photoIDs = sorted(set(photoIDs))
+    conns = []
+    result = {}, photoIDs
+    try:
+        for shard in getShards():
+            conns.append(shard.pool.getConnection())
+        for attempt in range(Solution.PLACEMENT_REPLANS + 1):
+            planner = Statements.PLANNER_DISKS_LOCKED if attempt == Solution.PLACEMENT_REPLANS \
+                else Statements.PLANNER_DISKS
+            disks = []
+            pairs = set()
+            for conn in conns:
+                _, entries = Statements.execute(conn, planner)
+                disks.extend(entries.rows)
+                _, entries = Statements.execute(conn, Statements.PLANNER_PAIRS, photoIDs)
+                pairs.update(tuple(row) for row in entries.rows)
+            _, photos = Statements.execute(conns[0], Statements.PLANNER_PHOTOS, photoIDs)
+            sizes = {photo_id: size for photo_id, size in photos.rows}
+            placement, unplaced = Placement.plan(sizes.items(),
+                                                 [Placement.DiskCandidate(*row) for row in sorted(disks)],
+                                                 pairs, strategy, respectRAM)
+            parts = {}
+            for photo_id, disk_id in placement.items():
+                parts.setdefault(shardOf(disk_id).index, {})[photo_id] = disk_id
+            usedSpace = {}
+            for index in sorted(parts):
+                usedSpace[index] = Solution.lockPlannedDisks(conns[index], parts[index], sizes, respectRAM)
+                if usedSpace[index] is None:
+                    break
+            if any(used is None for used in usedSpace.values()):
+                for conn in conns:
+                    conn.rollback()
+                continue
+            for index, placed in parts.items():
+                Statements.execute(conns[index], Statements.PLACE_PHOTOS, *Solution.columns(list(placed.items())),
+                                   *Solution.columns(list(usedSpace[index].items())))
+            for conn in conns:
+                conn.commit()
+            result = placement, sorted(unplaced + [photo_id for photo_id in photoIDs if photo_id not in sizes])
+            break
+    except Exception as e:
+        for conn in conns:
+            conn.rollback()
+        result = {}, photoIDs
+    finally:
+        for conn in conns:
+            conn.close()
+        Cache.invalidate("disk", set(result[0].values()))
+    return result
+
+
+def averagePhotosSizeOnDisk(diskID: int) -> float:
+    return onShard(shardOf(diskID), Solution.averagePhotosSizeOnDisk, diskID)
+
+
+def getTotalRamOnDisk(diskID: int) -> int:
+    return onShard(shardOf(diskID), Solution.getTotalRamOnDisk, diskID)
+
+
+def getCostForDescription(description: str) -> int:
+    costs = scatter(Solution.getCostForDescription, description)
+    return -1 if -1 in costs else sum(costs)
+
+
+def getPhotosCanBeAddedToDisk(diskID: int, k: int = 5) -> List[int]:
+    return onShard(shardOf(diskID), Solution.getPhotosCanBeAddedToDisk, diskID, k)
+
+
+def getPhotosCanBeAddedToDiskAndRAM(diskID: int, k: int = 5) -> List[int]:
+    return onShard(shardOf(diskID), Solution.getPhotosCanBeAddedToDiskAndRAM, diskID, k)
+
+
+def isCompanyExclusive(diskID: int) -> bool:
+    return onShard(shardOf(diskID), Solution.isCompanyExclusive, diskID)
+
+
+def isDiskContainingAtLeastNumExists(description: str, num: int) -> bool:
+    return any(scatter(Solution.isDiskContainingAtLeastNumExists, description, num))
+
+
+def disksContainingTheMostData(after_id: Optional[int], limit: Optional[int]) -> List[int]:
+    """The global order is (used_bytes DESC, id ASC); every shard returns its own head of it and the heads merge."""
+    usedBytes = None
+    if after_id is not None:
+        rows = query(shardOf(after_id), Statements.SHARD_DISK_USED_BYTES, after_id)
+        if not rows:
+            return []
+        usedBytes = rows[0][0]
+    pages = gather(Statements.SHARD_DISKS_CONTAINING_THE_MOST_DATA_PAGE, usedBytes, after_id, limit)
+    merged = heapq.merge(*pages, key=lambda row: (-row[1], row[0]))
+    return limited((row[0] for row in merged), limit)
+
+
+# photo ids per round trip while the shards' placed photos are merged
+PLACED_PHOTOS_PAGE = 10000
+
+
+def placedPhotos(shard: Shard) -> Iterator[Tuple[int, int]]:
+    """(photo_id, shard index) for every photo placed on the shard, ascending, read one keyset page at a time."""
+    after = None
+    while True:
+        rows = query(shard, Statements.SHARD_PLACED_PHOTOS_PAGE, after, PLACED_PHOTOS_PAGE)
+        for row in rows:
+            yield row[0], shard.index
+        if len(rows) < PLACED_PHOTOS_PAGE:
+            return
+        after = rows[-1][0]
+
+
+def conflictingDisks(after_id: Optional[int], limit: Optional[int]) -> List[int]:
+    """
+    A disk conflicts when one of its photos is on another disk of the same shard, which the shard finds itself, or
+    on a disk of another shard. The photos placed on more than one shard come from merging the shards' ascending
+    placed photo ids, a page at a time; each shard is sent only its own such photos and returns its next page of
+    conflicting disks, and the pages merge.
+    """
+    shards = getShards()
+    crossing = [[] for _ in shards]
+    if len(shards) > 1:
+        merged = heapq.merge(*(placedPhotos(shard) for shard in shards))
+        for photo_id, holders in groupby(merged, key=lambda entry: entry[0]):
+            holders = [index for _, index in holders]
+            if len(holders) > 1:
+                for index in holders:
+                    crossing[index].append(photo_id)
+    futures = [_executor.submit(query, shard, Statements.SHARD_CONFLICTING_DISKS_PAGE, crossing[shard.index],
+                                after_id, limit) for shard in shards[1:]]
+    pages = [query(shards[0], Statements.SHARD_CONFLICTING_DISKS_PAGE, crossing[0], after_id, limit)]
+    pages.extend(future.result() for future in futures)
+    return limited((row[0] for row in heapq.merge(*pages)), limit)
+
+
+def closePhotos(photoID: int, after_id: Optional[int], limit: Optional[int]) -> List[int]:
+    """The photos sharing at least half of the disks photoID is on, counted per shard and summed."""
+    saved = 0
+    shared = {}
+    for rows in gather(Statements.SHARD_CLOSE_PHOTO_COUNTS, photoID):
+        for photo_id, disk_count in rows:
+            if photo_id is None:
+                saved += disk_count
+            else:
+                shared[photo_id] = shared.get(photo_id, 0) + disk_count
+    if saved == 0:
+        return [row[0] for row in query(getShards()[0], Statements.PHOTO_IDS_PAGE, photoID, after_id, limit)]
+    after = after_id if after_id is not None else 0
+    return limited(sorted(photo_id for photo_id, disk_count in shared.items()
+                          if disk_count >= saved * 0.5 and photo_id > after), limit)
+
+
+def getDisksContainingTheMostData() -> List[int]:
+    try:
+        return disksContainingTheMostData(None, 5)
+    except Exception as e:
+        return []
+
+
+def getConflictingDisks() -> List[int]:
+    try:
+        return conflictingDisks(None, None)
+    except Exception as e:
+        return []
+
+
+def mostAvailableDisks() -> List[int]:
+    """Every shard's own top 5, see Solution.mostAvailableDisks for what each of them reads, merged."""
+    try:
+        heads = gather(Statements.SHARD_MOST_AVAILABLE_DISKS, 5)
+        merged = heapq.merge(*heads, key=lambda row: (-row[1], -row[2], row[0]))
+        return [row[0] for row in islice(merged, 5)]
+    except Exception as e:
+        return []
+
+
+def rebuildPhotoCoOccurrence() -> ReturnValue:
+    results = scatter(Solution.rebuildPhotoCoOccurrence)
+    return next((result for result in results if result != ReturnValue.OK), ReturnValue.OK)
+
+
+def setClosePhotosStrategy(strategy: str) -> ReturnValue:
+    results = scatter(Solution.setClosePhotosStrategy, strategy)
+    return next((result for result in results if result != ReturnValue.OK), ReturnValue.OK)
+
+
+def getClosePhotos(photoID: int) -> List[int]:
+    # the same answer under either strategy, the precomputed tables only hold each shard's share of the counts
+    try:
+        return closePhotos(photoID, None, 10)
+    except Exception as e:
+        return []
+
+
+def pageOf(merge: Callable, *params) -> List[int]:
+    try:
+        return merge(*params)
+    except Exception as e:
+        return []
+
+
+def streamOf(merge: Callable, *params) -> Iterator[int]:
+    """The global streams merge whole results, so they are read up front and fetchSize does not apply."""
+    yield from pageOf(merge, *params)
+
+
+def streamConflictingDisks(fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamOf(conflictingDisks, None, None)
+
+
+def streamPhotosCanBeAddedToDisk(diskID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamOnShard(shardOf(diskID), Solution.streamPhotosCanBeAddedToDisk, diskID, fetchSize)
+
+
+def streamPhotosCanBeAddedToDiskAndRAM(diskID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamOnShard(shardOf(diskID), Solution.streamPhotosCanBeAddedToDiskAndRAM, diskID, fetchSize)
+
+
+def streamDisksContainingTheMostData(fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamOf(disksContainingTheMostData, None, None)
+
+
+def streamClosePhotos(photoID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamOf(closePhotos, photoID, None, None)
+
+
+def getConflictingDisksPage(after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return pageOf(conflictingDisks, after_id, limit)
+
+
+def getPhotosCanBeAddedToDiskPage(diskID: int, after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return onShard(shardOf(diskID), Solution.getPhotosCanBeAddedToDiskPage, diskID, after_id, limit)
+
+
+def getPhotosCanBeAddedToDiskAndRAMPage(diskID: int, after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return onShard(shardOf(diskID), Solution.getPhotosCanBeAddedToDiskAndRAMPage, diskID, after_id, limit)
+
+
+def getDisksContainingTheMostDataPage(after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return pageOf(disksContainingTheMostData, after_id, limit)
+
+
+def getClosePhotosPage(photoID: int, after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return pageOf(closePhotos, photoID, after_id, limit)
+
+
+# the calls are recorded as a whole, and each shard's Solution call again on the thread that runs it
+Instrumentation.instrumentModule(globals(), Solution.INSTRUMENTED)
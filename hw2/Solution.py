@@ -1,5 +1,16 @@
-from typing import List
-import Utility.DBConnector as Connector
+import random
+import threading
+import time
+from itertools import count, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+import ConnectionPool
+import Cache
+import Instrumentation
+import Migrations
+import Placement
+import Replicas
+import Statements
+import Views
 from Utility.ReturnValue import ReturnValue
 from Utility.Exceptions import DatabaseException
 from Business.Photo import Photo
@@ -9,103 +20,93 @@ from psycopg2 import sql
 
 
 def createTables():
+    """Applies the migrations this database is missing, see Migrations; a no-op query when it is current."""
     conn = None
     try:
-        conn = Connector.DBConnector()
-        conn.execute("""
-        CREATE TABLE IF NOT EXISTS "Photo"
-            (
-                id integer NOT NULL PRIMARY KEY CHECK (id > 0),
-                description TEXT NOT NULL,
-                disk_size_needed integer NOT NULL CHECK (disk_size_needed >= 0)
-            );
-        CREATE TABLE IF NOT EXISTS "Disk"
-            (
-                id integer NOT NULL PRIMARY KEY CHECK (id > 0),
-                manufacturing_company TEXT NOT NULL,
-                speed integer NOT NULL CHECK (speed > 0),
-                free_space integer NOT NULL CHECK (free_space >= 0),
-                cost_per_byte integer NOT NULL CHECK (cost_per_byte > 0)
-            );
-         CREATE TABLE IF NOT EXISTS "RAM"
-            (
-                id integer NOT NULL PRIMARY KEY CHECK (id > 0),
-                size integer NOT NULL CHECK (size > 0),
-                company TEXT NOT NULL
-            );
-
-        CREATE TABLE IF NOT EXISTS "PhotoInDisk"
-            (
-                photo_id integer NOT NULL,
-                disk_id integer NOT NULL,
-                PRIMARY KEY (photo_id, disk_id),
-                FOREIGN KEY (photo_id) REFERENCES "Photo" (id) ON DELETE CASCADE,
-                FOREIGN KEY (disk_id) REFERENCES "Disk" (id) ON DELETE CASCADE
-            );
-
-        CREATE TABLE IF NOT EXISTS "RAMInDisk"
-    		(
-    			ram_id integer NOT NULL,
-    			disk_id integer NOT NULL,
-    			PRIMARY KEY (ram_id, disk_id),
-    			FOREIGN KEY (ram_id) REFERENCES "RAM" (id) ON DELETE CASCADE,
-    			FOREIGN KEY (disk_id) REFERENCES "Disk" (id) ON DELETE CASCADE
-    		);
-
-        CREATE OR REPLACE VIEW "TotalRAMInDisk" as 
-        select "Disk".id as disk_id,COALESCE(SUM("RAM".size), 0) as total_ram
-        from "Disk"
-        left outer join "RAMInDisk" on "Disk".id = "RAMInDisk".disk_id
-        left outer join  "RAM" on "RAM".id = "RAMInDisk".ram_id
-        GROUP BY "Disk".id;
-
-        CREATE OR REPLACE VIEW "DiskPhotoCounts" AS 
-        SELECT 
-            "Disk".id AS disk_id, 
-            COALESCE(COUNT("Photo".id), 0) AS photo_count, 
-            "Disk".speed AS disk_speed 
-        FROM "Disk" 
-        LEFT JOIN "Photo" ON "Disk".free_space >= "Photo".disk_size_needed
-        GROUP BY "Disk".id, "Disk".speed;     
-    """)
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
+        conn = ConnectionPool.getConnection()
+        Migrations.migrate(conn)
+        if Cache.notify:
+            # tables created again after dropTables come with the notification triggers disabled
+            Cache.publishWrites(conn)
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        raise
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
+        Cache.clearAll()
 
 
 def clearTables():
     conn = None
     try:
-        conn = Connector.DBConnector()
-        conn.execute("\n".join(['DELETE FROM "{table}";'.format(table=table) for table in ["Photo", "Disk", "RAM", "PhotoInDisk", "RAMInDisk"]]))
+        conn = ConnectionPool.getConnection()
+        conn.execute(Migrations.TRUNCATE_ALL)
         conn.commit()
     except Exception as e:
         conn.rollback()
     finally:
         conn.close()
+        Cache.clearAll()
 
 
 def dropTables():
     conn = None
     try:
-        conn = Connector.DBConnector()
-        conn.execute("\n".join(['DROP TABLE IF EXISTS "{table}" CASCADE;'.format(table=table) for table in
-               ["Photo", "Disk", "RAM", "PhotoInDisk", "RAMInDisk", "TotalRAMInDisk", "DiskPhotoCounts"]]))
+        conn = ConnectionPool.getConnection()
+        # the rows other processes cached go away with the tables, the triggers that would announce it do too
+        conn.execute(sql.SQL("SELECT pg_notify({channel}, 'all:')").format(channel=sql.Literal(Cache.CHANNEL)))
+        conn.execute(Migrations.DROP_ALL)
         conn.commit()
     except Exception as e:
         conn.rollback()
     finally:
         conn.close()
+        Cache.clearAll()
+
+T = TypeVar("T")
+
+# deadlock_detected and serialization_failure: the transaction lost a race and can simply be run again
+TRANSIENT_SQLSTATES = {"40P01", "40001"}
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.005
+RETRY_MAX_DELAY = 0.2
+retryStats = {"retries": 0, "exhausted": 0}
+_retryLock = threading.Lock()
+
+
+def withRetries(conn, work: Callable[[], T]) -> T:
+    """
+    Runs work(), which ends with its commit, and when it fails on a deadlock or a serialization failure rolls back
+    and runs it again after a jittered exponential backoff, at most RETRY_ATTEMPTS times in all.
+    Any other error, or the last transient one, is raised to the caller's usual error handling.
+    """
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return work()
+        except Exception as e:
+            if ConnectionPool.sqlState(e) not in TRANSIENT_SQLSTATES:
+                raise
+            with _retryLock:
+                retryStats["exhausted" if attempt + 1 == RETRY_ATTEMPTS else "retries"] += 1
+            if attempt + 1 == RETRY_ATTEMPTS:
+                raise
+            conn.rollback()
+            time.sleep(random.uniform(0.5, 1.0) * min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
 
 def addTuple(query) -> ReturnValue:
     conn = None
     result = ReturnValue.OK
     try:
-        conn = Connector.DBConnector()
-        conn.execute(query)
-        conn.commit()
+        conn = ConnectionPool.getConnection()
+
+        def work():
+            Statements.run(conn, query)
+            conn.commit()
+
+        withRetries(conn, work)
     except (DatabaseException.CHECK_VIOLATION, DatabaseException.NOT_NULL_VIOLATION):
         conn.rollback()
         result = ReturnValue.BAD_PARAMS
@@ -115,50 +116,99 @@ def addTuple(query) -> ReturnValue:
     except DatabaseException.UNIQUE_VIOLATION:
         conn.rollback()
         result = ReturnValue.ALREADY_EXISTS
-    except Exception:
+    except Exception as e:
+        Instrumentation.noteError(e)
         conn.rollback()
         result = ReturnValue.ERROR
     finally:
         conn.close()
         return result
 
+def photoParams(photo: Photo) -> tuple:
+    return photo.getPhotoID(), photo.getDescription(), photo.getSize()
+
+
+def diskParams(disk: Disk) -> tuple:
+    return disk.getDiskID(), disk.getCompany(), disk.getSpeed(), disk.getFreeSpace(), disk.getCost()
+
+
+def ramParams(ram: RAM) -> tuple:
+    return ram.getRamID(), ram.getSize(), ram.getCompany()
+
+
+def photoFromRow(row) -> Photo:
+    result = Photo.badPhoto()
+    if row is not None:
+        photo_id, description, size = row
+        result.setPhotoID(photo_id)
+        result.setDescription(description)
+        result.setSize(size)
+    return result
+
+
+def diskFromRow(row) -> Disk:
+    result = Disk.badDisk()
+    if row is not None:
+        disk_id, manufacturing_company, speed, free_space, cost_per_byte = row
+        result.setDiskID(disk_id)
+        result.setCompany(manufacturing_company)
+        result.setSpeed(speed)
+        result.setFreeSpace(free_space)
+        result.setCost(cost_per_byte)
+    return result
+
+
+def ramFromRow(row) -> RAM:
+    result = RAM.badRAM()
+    if row is not None:
+        ram_id, size, company = row
+        result.setRamID(ram_id)
+        result.setCompany(company)
+        result.setSize(size)
+    return result
+
+
 def addPhoto(photo: Photo) -> ReturnValue:
-    return addTuple(sql.SQL('INSERT INTO "Photo" VALUES ({photo_id}, {description}, {disk_size_needed})').format(
-        photo_id=sql.Literal(photo.getPhotoID()),
-        description=sql.Literal(photo.getDescription()),
-        disk_size_needed=sql.Literal(photo.getSize())
-    ))
+    result = addTuple(Statements.bind(Statements.ADD_PHOTO, *photoParams(photo)))
+    Cache.invalidate("photo", [photo.getPhotoID()])
+    return result
 
 
 def getPhotoByID(photoID: int) -> Photo:
     conn = None
     result = Photo.badPhoto()
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(sql.SQL('SELECT * FROM "Photo" WHERE id = {id} ').format(id=sql.Literal(photoID)))
-        if row_effected != 0:
-            photo_id, description, size = entries[0].values()
-            result.setPhotoID(photo_id)
-            result.setDescription(description)
-            result.setSize(size)
+        row = Cache.photos.get(photoID)
+        if row is Cache.MISSING:
+            version = Cache.photos.version()
+            conn = ConnectionPool.getConnection()
+            row_effected, entries = Statements.execute(conn, Statements.PHOTO_BY_ID, photoID)
+            row = tuple(entries.rows[0]) if row_effected != 0 else None
+            Cache.photos.put(photoID, row, version)
+        result = photoFromRow(row)
     except Exception as e:
         pass
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
         return result
 
 def deleteTuple(query, not_photo=False):
     conn = None
     result = ReturnValue.OK
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(query)
-        if row_effected != 0:
-            conn.commit()
-        else:
-            if not_photo:
-                result = ReturnValue.NOT_EXISTS
+        conn = ConnectionPool.getConnection()
+
+        def work() -> int:
+            row_effected, entries = Statements.run(conn, query)
+            if row_effected != 0:
+                conn.commit()
+            return row_effected
+
+        if withRetries(conn, work) == 0 and not_photo:
+            result = ReturnValue.NOT_EXISTS
     except Exception as e:
+        Instrumentation.noteError(e)
         conn.rollback()
         result = ReturnValue.ERROR
     finally:
@@ -166,124 +216,178 @@ def deleteTuple(query, not_photo=False):
         return result
 
 def deletePhoto(photo: Photo) -> ReturnValue:
-    return deleteTuple(sql.SQL(
-        """
-        UPDATE "Disk" SET free_space = free_space + {disk_size_needed} WHERE id IN
-            (SELECT "PhotoInDisk".Disk_id FROM "PhotoInDisk" INNER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id  
-                WHERE ("Photo".id, "Photo".description, "Photo".disk_size_needed) =
-                                                                ({id}, {description}, {disk_size_needed}));          
-        DELETE FROM "Photo" WHERE (id, description, disk_size_needed) =
-                                                    ({id}, {description}, {disk_size_needed});
-        """).format(
-        id=sql.Literal(photo.getPhotoID()),
-        description=sql.Literal(photo.getDescription()),
-        disk_size_needed=sql.Literal(photo.getSize())))
+    conn = None
+    result = ReturnValue.OK
+    try:
+        conn = ConnectionPool.getConnection()
+
+        def work() -> tuple:
+            _, entries = Statements.execute(conn, Statements.DELETE_PHOTO, *photoParams(photo))
+            disk_ids, deleted = entries.rows[0]
+            if deleted != 0:
+                conn.commit()
+            return deleted, disk_ids
+
+        deleted, disk_ids = withRetries(conn, work)
+        if deleted != 0:
+            Cache.invalidate("photo", [photo.getPhotoID()])
+            Cache.invalidate("disk", disk_ids)
+    except Exception as e:
+        conn.rollback()
+        result = ReturnValue.ERROR
+    finally:
+        conn.close()
+        return result
 
 
 def addDisk(disk: Disk) -> ReturnValue:
-    return addTuple(sql.SQL("""
-        INSERT INTO "Disk" (id, manufacturing_company, speed, free_space, cost_per_byte) 
-        VALUES ({disk_id}, {manufacturing_company}, {speed}, {free_space}, {cost_per_byte});""").format(
-        disk_id=sql.Literal(disk.getDiskID()),
-        manufacturing_company=sql.Literal(disk.getCompany()),
-        speed=sql.Literal(disk.getSpeed()),
-        free_space=sql.Literal(disk.getFreeSpace()),
-        cost_per_byte=sql.Literal(disk.getCost())
-    ))
+    result = addTuple(Statements.bind(Statements.ADD_DISK, *diskParams(disk)))
+    Cache.invalidate("disk", [disk.getDiskID()])
+    return result
 
 
 def getDiskByID(diskID: int) -> Disk:
     conn = None
     result = Disk.badDisk()
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(sql.SQL('SELECT * FROM "Disk" WHERE id = {id} ').format(id=sql.Literal(diskID)))
-        if row_effected != 0:
-            disk_id, manufacturing_company, speed, free_space, cost_per_byte = entries[0].values()
-            result.setDiskID(disk_id)
-            result.setCompany(manufacturing_company)
-            result.setSpeed(speed)
-            result.setFreeSpace(free_space)
-            result.setCost(cost_per_byte)
+        row = Cache.disks.get(diskID)
+        if row is Cache.MISSING:
+            version = Cache.disks.version()
+            conn = ConnectionPool.getConnection()
+            row_effected, entries = Statements.execute(conn, Statements.DISK_BY_ID, diskID)
+            row = tuple(entries.rows[0]) if row_effected != 0 else None
+            Cache.disks.put(diskID, row, version)
+        result = diskFromRow(row)
     except Exception as e:
         pass
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
         return result
 
 
 def deleteDisk(diskID: int) -> ReturnValue:
-    return deleteTuple(query=sql.SQL('DELETE FROM "Disk" where id = {id}').format(id=sql.Literal(diskID)), not_photo=True)
+    result = deleteTuple(query=Statements.bind(Statements.DELETE_DISK, diskID), not_photo=True)
+    Cache.invalidate("disk", [diskID])
+    return result
 
 
 def addRAM(ram: RAM) -> ReturnValue:
-    return addTuple(sql.SQL('INSERT INTO "RAM" VALUES ({id}, {size}, {company})').format(
-        id=sql.Literal(ram.getRamID()),
-        size=sql.Literal(ram.getSize()),
-        company=sql.Literal(ram.getCompany())
-    ))
+    result = addTuple(Statements.bind(Statements.ADD_RAM, *ramParams(ram)))
+    Cache.invalidate("ram", [ram.getRamID()])
+    return result
 
 
 def getRAMByID(ramID: int) -> RAM:
     conn = None
     result = RAM.badRAM()
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(sql.SQL('SELECT * FROM "RAM" WHERE id = {id} ').format(id=sql.Literal(ramID)))
-        if row_effected != 0:
-            ram_id, size, company = entries[0].values()
-            result.setRamID(ram_id)
-            result.setCompany(company)
-            result.setSize(size)
+        row = Cache.rams.get(ramID)
+        if row is Cache.MISSING:
+            version = Cache.rams.version()
+            conn = ConnectionPool.getConnection()
+            row_effected, entries = Statements.execute(conn, Statements.RAM_BY_ID, ramID)
+            row = tuple(entries.rows[0]) if row_effected != 0 else None
+            Cache.rams.put(ramID, row, version)
+        result = ramFromRow(row)
     except Exception as e:
         pass
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
         return result
 
 
 def deleteRAM(ramID: int) -> ReturnValue:
-    return deleteTuple(query=sql.SQL(
-        'DELETE FROM "RAM" where id = {id}').format(
-        id=sql.Literal(ramID)), not_photo=True)
+    result = deleteTuple(query=Statements.bind(Statements.DELETE_RAM, ramID), not_photo=True)
+    Cache.invalidate("ram", [ramID])
+    return result
+
+
+def rowsByIDs(cache: Cache.LRUCache, statement: Statements.Statement, ids: List[int]) -> Dict[int, tuple]:
+    """
+    The cached rows of ids plus one = ANY query for the rest; ids that do not exist map to None.
+    Missing rows are cached too, as getPhotoByID and friends do.
+    """
+    rows = {}
+    missing = []
+    for key in ids:
+        row = cache.get(key)
+        if row is Cache.MISSING:
+            missing.append(key)
+        else:
+            rows[key] = row
+    if missing:
+        conn = None
+        try:
+            version = cache.version()
+            conn = ConnectionPool.getConnection()
+            _, entries = Statements.execute(conn, statement, sorted(set(missing)))
+            found = {row[0]: tuple(row) for row in entries.rows}
+            for key in missing:
+                rows[key] = found.get(key)
+                cache.put(key, rows[key], version)
+        finally:
+            if conn is not None:
+                conn.close()
+    return rows
+
+
+def getPhotosByIDs(photoIDs: Iterable[int], views: bool = False) -> List[Photo]:
+    """
+    getPhotoByID for every id in one round trip, in the order given; ids that do not exist give badPhoto().
+    With views the results are Views.PhotoView tuples, which skip the Business object and its setters.
+    """
+    photoIDs = list(photoIDs)
+    try:
+        rows = rowsByIDs(Cache.photos, Statements.PHOTOS_BY_IDS, [key for key in photoIDs if key is not None])
+    except Exception:
+        rows = {}
+    if views:
+        return [Views.PhotoView._make(rows[key]) if rows.get(key) else Views.BAD_PHOTO for key in photoIDs]
+    return [photoFromRow(rows.get(key)) for key in photoIDs]
+
+
+def getDisksByIDs(diskIDs: Iterable[int], views: bool = False) -> List[Disk]:
+    diskIDs = list(diskIDs)
+    try:
+        rows = rowsByIDs(Cache.disks, Statements.DISKS_BY_IDS, [key for key in diskIDs if key is not None])
+    except Exception:
+        rows = {}
+    if views:
+        return [Views.DiskView._make(rows[key]) if rows.get(key) else Views.BAD_DISK for key in diskIDs]
+    return [diskFromRow(rows.get(key)) for key in diskIDs]
+
+
+def getRAMsByIDs(ramIDs: Iterable[int], views: bool = False) -> List[RAM]:
+    ramIDs = list(ramIDs)
+    try:
+        rows = rowsByIDs(Cache.rams, Statements.RAMS_BY_IDS, [key for key in ramIDs if key is not None])
+    except Exception:
+        rows = {}
+    if views:
+        return [Views.RAMView._make(rows[key]) if rows.get(key) else Views.BAD_RAM for key in ramIDs]
+    return [ramFromRow(rows.get(key)) for key in ramIDs]
 
 
 def addDiskAndPhoto(disk: Disk, photo: Photo) -> ReturnValue:
-    return addTuple(sql.SQL("""
-        BEGIN TRANSACTION;
-        INSERT INTO "Disk" VALUES ({disk_id}, {manufacturing_company}, {speed}, {free_space}, {cost_per_byte});
-        INSERT INTO "Photo" VALUES ({photo_id}, {description}, {disk_size_needed});
-        COMMIT;
-        """).format(
-        disk_id=sql.Literal(disk.getDiskID()),
-        manufacturing_company=sql.Literal(disk.getCompany()),
-        speed=sql.Literal(disk.getSpeed()),
-        free_space=sql.Literal(disk.getFreeSpace()),
-        cost_per_byte=sql.Literal(disk.getCost()),
-        photo_id=sql.Literal(photo.getPhotoID()),
-        description=sql.Literal(photo.getDescription()),
-        disk_size_needed=sql.Literal(photo.getSize())
-    ))
+    result = addTuple(Statements.bind(Statements.ADD_DISK_AND_PHOTO, *diskParams(disk), *photoParams(photo)))
+    Cache.invalidate("disk", [disk.getDiskID()])
+    Cache.invalidate("photo", [photo.getPhotoID()])
+    return result
 
 
 def addPhotoToDisk(photo: Photo, diskID: int) -> ReturnValue:
     conn = None
     result = ReturnValue.OK
     try:
-        conn = Connector.DBConnector()
-        conn.execute(sql.SQL("""
-            BEGIN TRANSACTION;  
-            INSERT INTO "PhotoInDisk" VALUES ((SELECT COALESCE("Photo".id) FROM "Photo" WHERE
-            id = {photo_id} AND description = {photo_description} AND disk_size_needed = {photo_size}),
-            (SELECT COALESCE("Disk".id) FROM "Disk" WHERE "Disk".id = {disk_id}));
-            UPDATE "Disk" SET free_space = free_space - {photo_size} WHERE "Disk".id = {disk_id};
-            COMMIT;
-            """).format(
-        photo_id=sql.Literal(photo.getPhotoID()),
-        photo_description=sql.Literal(photo.getDescription()),
-        photo_size=sql.Literal(photo.getSize()),
-        disk_id=sql.Literal(diskID)))
-        conn.commit()
+        conn = ConnectionPool.getConnection()
+
+        def work():
+            Statements.execute(conn, Statements.ADD_PHOTO_TO_DISK, *photoParams(photo), diskID)
+            conn.commit()
+
+        withRetries(conn, work)
     except DatabaseException.NOT_NULL_VIOLATION:
         conn.rollback()
         result = ReturnValue.NOT_EXISTS
@@ -298,54 +402,360 @@ def addPhotoToDisk(photo: Photo, diskID: int) -> ReturnValue:
         result = ReturnValue.ERROR
     finally:
         conn.close()
+        Cache.invalidate("disk", [diskID])
+        return result
+
+
+def addPhotoToAnyDisk(photo: Photo) -> Tuple[ReturnValue, Optional[int]]:
+    """
+    Saves the photo on the lowest-id disk that has room for it and does not hold it yet, and returns that disk's id.
+    Disks other writers hold locked are skipped (FOR UPDATE SKIP LOCKED), so concurrent callers spread over
+    different disks instead of queueing on the same row; only when every disk with room is locked does the call
+    wait for one. NOT_EXISTS if the photo does not exist, BAD_PARAMS if no disk has room.
+    """
+    conn = None
+    result = ReturnValue.OK, None
+    try:
+        conn = ConnectionPool.getConnection()
+
+        def work() -> Tuple[ReturnValue, Optional[int]]:
+            for statement in (Statements.ADD_PHOTO_TO_ANY_DISK_SKIP_LOCKED, Statements.ADD_PHOTO_TO_ANY_DISK):
+                _, entries = Statements.execute(conn, statement, *photoParams(photo))
+                disk_id, photo_exists = entries.rows[0]
+                if disk_id is not None:
+                    conn.commit()
+                    return ReturnValue.OK, disk_id
+                if not photo_exists:
+                    break
+            conn.rollback()
+            return (ReturnValue.BAD_PARAMS if photo_exists else ReturnValue.NOT_EXISTS), None
+
+        result = withRetries(conn, work)
+    except Exception as e:
+        conn.rollback()
+        result = ReturnValue.ERROR, None
+    finally:
+        conn.close()
+        if result[1] is not None:
+            Cache.invalidate("disk", [result[1]])
         return result
 
 
 def removePhotoFromDisk(photo: Photo, diskID: int) -> ReturnValue:
-    return deleteTuple(query=sql.SQL("""
-        CREATE OR REPLACE VIEW "PhotoSize" AS
-        SELECT COALESCE(
-        (
-            SELECT "Photo".disk_size_needed
-            FROM "Photo"
-            INNER JOIN "PhotoInDisk"
-            ON "PhotoInDisk".disk_id = {diskID} AND "Photo".id = "PhotoInDisk".photo_id AND "Photo".id = {photoID}
-        ), 0);
-
-        UPDATE "Disk" set free_space=free_space + (SELECT * FROM "PhotoSize") where id = {diskID};
-        DELETE FROM "PhotoInDisk" where Photo_id = {photoID} and disk_id = {diskID};
-        """).format(
-        photoID=sql.Literal(photo.getPhotoID()),
-        PhotoSize=sql.Literal(photo.getSize()),
-        diskID=sql.Literal(diskID)))
+    result = deleteTuple(query=Statements.bind(Statements.REMOVE_PHOTO_FROM_DISK, photo.getPhotoID(), diskID))
+    Cache.invalidate("disk", [diskID])
+    return result
 
 
 def addRAMToDisk(ramID: int, diskID: int) -> ReturnValue:
-    return addTuple(sql.SQL("""INSERT INTO "RAMInDisk" VALUES ({ram_id},{disk_id} )""").format(
-        ram_id=sql.Literal(ramID),
-        disk_id=sql.Literal(diskID)
-    ))
+    return addTuple(Statements.bind(Statements.ADD_RAM_TO_DISK, ramID, diskID))
 
 
 def removeRAMFromDisk(ramID: int, diskID: int) -> ReturnValue:
-    return deleteTuple(query=sql.SQL("""
-        DELETE FROM "RAMInDisk" where ram_id = {ramID} and disk_id = {diskID};
-        """).format(
-        ramID=sql.Literal(ramID),
-        diskID=sql.Literal(diskID)), not_photo=True)
+    return deleteTuple(query=Statements.bind(Statements.REMOVE_RAM_FROM_DISK, ramID, diskID), not_photo=True)
+
+
+BATCH_SIZE = 1000
+
+
+def chunks(rows: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def columns(chunk: List[tuple]) -> List[list]:
+    return [list(column) for column in zip(*chunk)]
+
+
+def addTupleInSavepoint(conn, query) -> ReturnValue:
+    result = ReturnValue.OK
+    conn.execute("SAVEPOINT single_row")
+    try:
+        Statements.run(conn, query)
+        conn.execute("RELEASE SAVEPOINT single_row")
+    except (DatabaseException.CHECK_VIOLATION, DatabaseException.NOT_NULL_VIOLATION):
+        conn.execute("ROLLBACK TO SAVEPOINT single_row")
+        result = ReturnValue.BAD_PARAMS
+    except DatabaseException.FOREIGN_KEY_VIOLATION:
+        conn.execute("ROLLBACK TO SAVEPOINT single_row")
+        result = ReturnValue.NOT_EXISTS
+    except DatabaseException.UNIQUE_VIOLATION:
+        conn.execute("ROLLBACK TO SAVEPOINT single_row")
+        result = ReturnValue.ALREADY_EXISTS
+    except Exception:
+        conn.execute("ROLLBACK TO SAVEPOINT single_row")
+        result = ReturnValue.ERROR
+    return result
+
+
+def insertedResults(chunk: List[tuple], insertedIDs: Iterable[int]) -> List[ReturnValue]:
+    """Rows whose id the multi-row INSERT did not return were skipped by ON CONFLICT, i.e. ALREADY_EXISTS."""
+    inserted = set(insertedIDs)
+    result = []
+    for row in chunk:
+        if row[0] in inserted:
+            inserted.discard(row[0])
+            result.append(ReturnValue.OK)
+        else:
+            result.append(ReturnValue.ALREADY_EXISTS)
+    return result
+
+
+def addTuplesChunk(conn, batch: Statements.Statement, single: Statements.Statement,
+                   chunk: List[tuple]) -> List[ReturnValue]:
+    """
+    Inserts the whole chunk with one multi-row INSERT, rows whose id is taken come back as ALREADY_EXISTS.
+    If the chunk violates a constraint it is replayed row by row so every row gets the code addTuple would give it.
+    """
+    conn.execute("SAVEPOINT chunk")
+    try:
+        _, entries = Statements.execute(conn, batch, *columns(chunk))
+        conn.execute("RELEASE SAVEPOINT chunk")
+    except Exception:
+        conn.execute("ROLLBACK TO SAVEPOINT chunk")
+        return [addTupleInSavepoint(conn, Statements.bind(single, *row)) for row in chunk]
+    return insertedResults(chunk, (row[0] for row in entries.rows))
+
+
+def addTuples(kind: str, batch: Statements.Statement, single: Statements.Statement, rows: Iterable[tuple],
+              chunkSize: int = BATCH_SIZE) -> List[ReturnValue]:
+    conn = None
+    result = []
+    try:
+        conn = ConnectionPool.getConnection()
+        for chunk in chunks(rows, chunkSize):
+            try:
+                result.extend(addTuplesChunk(conn, batch, single, chunk))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                result.extend([ReturnValue.ERROR] * len(chunk))
+            Cache.invalidate(kind, [row[0] for row in chunk])
+    finally:
+        if conn is not None:
+            conn.close()
+    return result
+
+
+def addPhotos(photos: Iterable[Photo], chunkSize: int = BATCH_SIZE) -> List[ReturnValue]:
+    return addTuples("photo", Statements.ADD_PHOTOS, Statements.ADD_PHOTO, map(photoParams, photos), chunkSize)
+
+
+def addDisks(disks: Iterable[Disk], chunkSize: int = BATCH_SIZE) -> List[ReturnValue]:
+    return addTuples("disk", Statements.ADD_DISKS, Statements.ADD_DISK, map(diskParams, disks), chunkSize)
+
+
+def addRAMs(rams: Iterable[RAM], chunkSize: int = BATCH_SIZE) -> List[ReturnValue]:
+    return addTuples("ram", Statements.ADD_RAMS, Statements.ADD_RAM, map(ramParams, rams), chunkSize)
+
+
+def placementKeys(chunk: List[Tuple[Photo, int]]) -> Tuple[List[int], List[int]]:
+    photoIDs = sorted({photo.getPhotoID() for photo, _ in chunk if photo.getPhotoID() is not None})
+    diskIDs = sorted({diskID for _, diskID in chunk if diskID is not None})
+    return photoIDs, diskIDs
+
+
+def planPlacements(chunk: List[Tuple[Photo, int]], disks, photos, pairs) -> Tuple[List[ReturnValue], list, list]:
+    """
+    Replays addPhotoToDisk for every (photo, disk) pair in memory against the locked disk rows.
+    Returns the per-pair results and the PLACE_PHOTOS arguments that apply the accepted pairs:
+    one INSERT for the placements and one free_space change per disk.
+    """
+    freeSpace = {disk_id: free_space for disk_id, free_space in disks}
+    existingPhotos = {row[0]: tuple(row) for row in photos}
+    placed = {tuple(row) for row in pairs}
+    inserts = []
+    usedSpace = {}
+    result = []
+    for photo, diskID in chunk:
+        key = photoParams(photo)
+        if existingPhotos.get(key[0]) != key or diskID not in freeSpace:
+            result.append(ReturnValue.NOT_EXISTS)
+        elif (key[0], diskID) in placed:
+            result.append(ReturnValue.ALREADY_EXISTS)
+        elif freeSpace[diskID] < key[2]:
+            result.append(ReturnValue.BAD_PARAMS)
+        else:
+            placed.add((key[0], diskID))
+            freeSpace[diskID] -= key[2]
+            usedSpace[diskID] = usedSpace.get(diskID, 0) + key[2]
+            inserts.append((key[0], diskID))
+            result.append(ReturnValue.OK)
+    params = []
+    if inserts:
+        params = columns(inserts) + columns(list(usedSpace.items()))
+    return result, inserts, params
+
+
+def placeInSavepoint(conn, photo: Photo, diskID: int) -> ReturnValue:
+    """addPhotoToDisk inside the caller's transaction; transient errors are raised for withRetries."""
+    result = ReturnValue.OK
+    conn.execute("SAVEPOINT single_row")
+    try:
+        Statements.execute(conn, Statements.ADD_PHOTO_TO_DISK, *photoParams(photo), diskID)
+        conn.execute("RELEASE SAVEPOINT single_row")
+    except DatabaseException.NOT_NULL_VIOLATION:
+        conn.execute("ROLLBACK TO SAVEPOINT single_row")
+        result = ReturnValue.NOT_EXISTS
+    except DatabaseException.UNIQUE_VIOLATION:
+        conn.execute("ROLLBACK TO SAVEPOINT single_row")
+        result = ReturnValue.ALREADY_EXISTS
+    except DatabaseException.CHECK_VIOLATION:
+        conn.execute("ROLLBACK TO SAVEPOINT single_row")
+        result = ReturnValue.BAD_PARAMS
+    except Exception as e:
+        if ConnectionPool.sqlState(e) in TRANSIENT_SQLSTATES:
+            raise
+        conn.execute("ROLLBACK TO SAVEPOINT single_row")
+        result = ReturnValue.ERROR
+    return result
+
+
+def addPhotosToDiskChunk(conn, chunk: List[Tuple[Photo, int]]) -> List[ReturnValue]:
+    """
+    Places the whole chunk with one read of its disks, photos and pairs and one write, see planPlacements.
+    If that fails, e.g. on an id outside int4, the chunk is replayed pair by pair so every pair gets the code
+    addPhotoToDisk would give it.
+    """
+    conn.execute("SAVEPOINT chunk")
+    try:
+        photoIDs, diskIDs = placementKeys(chunk)
+        _, disks = Statements.execute(conn, Statements.PLACEMENT_DISKS, diskIDs)
+        _, photos = Statements.execute(conn, Statements.PLACEMENT_PHOTOS, photoIDs)
+        _, pairs = Statements.execute(conn, Statements.PLACEMENT_PAIRS, photoIDs, diskIDs)
+        result, inserts, params = planPlacements(chunk, disks.rows, photos.rows, pairs.rows)
+        if inserts:
+            Statements.execute(conn, Statements.PLACE_PHOTOS, *params)
+        conn.execute("RELEASE SAVEPOINT chunk")
+    except Exception as e:
+        if ConnectionPool.sqlState(e) in TRANSIENT_SQLSTATES:
+            raise
+        conn.execute("ROLLBACK TO SAVEPOINT chunk")
+        return [placeInSavepoint(conn, photo, diskID) for photo, diskID in chunk]
+    return result
+
+
+def addPhotosToDisk(placements: Iterable[Tuple[Photo, int]], chunkSize: int = BATCH_SIZE) -> List[ReturnValue]:
+    conn = None
+    result = []
+    try:
+        conn = ConnectionPool.getConnection()
+        for chunk in chunks(placements, chunkSize):
+            try:
+                def work() -> List[ReturnValue]:
+                    chunkResult = addPhotosToDiskChunk(conn, chunk)
+                    conn.commit()
+                    return chunkResult
+
+                result.extend(withRetries(conn, work))
+            except Exception:
+                conn.rollback()
+                result.extend([ReturnValue.ERROR] * len(chunk))
+            Cache.invalidate("disk", {diskID for _, diskID in chunk})
+    finally:
+        if conn is not None:
+            conn.close()
+    return result
+
+
+# plans made from unlocked reads before the last attempt, which plans with every disk locked
+PLACEMENT_REPLANS = 3
+
+
+def lockPlannedDisks(conn, placement: Dict[int, int], sizes: Dict[int, int],
+                     respectRAM: bool) -> Optional[Dict[int, int]]:
+    """
+    Locks the disks a plan chose, in id order, and checks the plan still holds on them: each disk exists, has room
+    for its photos and, with respectRAM, RAM for the largest one, and holds none of the photos it was given.
+    Returns the bytes to take from each disk, or None when the plan went stale and has to be made again.
+    """
+    usedSpace, largest = plannedUse(placement, sizes)
+    _, disks = Statements.execute(conn, Statements.PLANNER_CHOSEN_DISKS, sorted(usedSpace))
+    _, pairs = Statements.execute(conn, Statements.PLACEMENT_PAIRS, sorted(placement), sorted(usedSpace))
+    return usedSpace if planHolds(placement, usedSpace, largest, disks.rows, pairs.rows, respectRAM) else None
+
+
+def plannedUse(placement: Dict[int, int], sizes: Dict[int, int]) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """The bytes a plan takes from each disk and the largest photo it puts there."""
+    usedSpace = {}
+    largest = {}
+    for photo_id, disk_id in placement.items():
+        usedSpace[disk_id] = usedSpace.get(disk_id, 0) + sizes[photo_id]
+        largest[disk_id] = max(largest.get(disk_id, 0), sizes[photo_id])
+    return usedSpace, largest
+
+
+def planHolds(placement: Dict[int, int], usedSpace: Dict[int, int], largest: Dict[int, int], disks, pairs,
+              respectRAM: bool) -> bool:
+    """The checks of lockPlannedDisks on its PLANNER_CHOSEN_DISKS and PLACEMENT_PAIRS rows."""
+    current = {disk_id: (free_space, total_ram) for disk_id, free_space, total_ram in disks}
+    for disk_id, used in usedSpace.items():
+        if disk_id not in current:
+            return False
+        free_space, total_ram = current[disk_id]
+        if free_space < used or respectRAM and (total_ram or 0) < largest[disk_id]:
+            return False
+    return not any(placement[photo_id] == disk_id for photo_id, disk_id in pairs)
+
+
+def placePhotos(photoIDs: Iterable[int], strategy: str = Placement.FIRST_FIT_DECREASING,
+                respectRAM: bool = False) -> Tuple[Dict[int, int], List[int]]:
+    """
+    Saves each of the photos on one disk chosen by Placement.plan and returns ({photo_id: disk_id}, unplaced ids).
+    The plan is made from unlocked reads; only the disks it chose are then locked and checked again, and the whole
+    assignment is written in the same transaction. A plan that went stale is made again, the last time with every
+    disk locked. With respectRAM a photo only goes to a disk whose attached RAM is at least its size, as in
+    getPhotosCanBeAddedToDiskAndRAM.
+    Ids of photos that do not exist come back unplaced; on error nothing is placed and all ids come back unplaced.
+    """
+    conn = None
+    photoIDs = sorted(set(photoIDs))
+    result = {}, photoIDs
+    try:
+        conn = ConnectionPool.getConnection()
+
+        def work() -> Tuple[Dict[int, int], List[int]]:
+            for attempt in range(PLACEMENT_REPLANS + 1):
+                locked = attempt == PLACEMENT_REPLANS
+                _, disks = Statements.execute(conn, Statements.PLANNER_DISKS_LOCKED if locked
+                                              else Statements.PLANNER_DISKS)
+                _, photos = Statements.execute(conn, Statements.PLANNER_PHOTOS, photoIDs)
+                _, pairs = Statements.execute(conn, Statements.PLANNER_PAIRS, photoIDs)
+                sizes = {photo_id: size for photo_id, size in photos.rows}
+                placement, unplaced = Placement.plan(sizes.items(),
+                                                     [Placement.DiskCandidate(*row) for row in disks.rows],
+                                                     {tuple(row) for row in pairs.rows}, strategy, respectRAM)
+                usedSpace = lockPlannedDisks(conn, placement, sizes, respectRAM) if placement else {}
+                if usedSpace is None:
+                    conn.rollback()
+                    continue
+                if placement:
+                    Statements.execute(conn, Statements.PLACE_PHOTOS, *columns(list(placement.items())),
+                                       *columns(list(usedSpace.items())))
+                conn.commit()
+                return placement, sorted(unplaced + [photo_id for photo_id in photoIDs if photo_id not in sizes])
+            return {}, photoIDs
+
+        result = withRetries(conn, work)
+    except Exception as e:
+        conn.rollback()
+        result = {}, photoIDs
+    finally:
+        conn.close()
+        Cache.invalidate("disk", set(result[0].values()))
+        return result
 
 
 def averagePhotosSizeOnDisk(diskID: int) -> float:
     conn = None
     result = 0
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(sql.SQL("""
-         SELECT COALESCE(       
-         (SELECT AVG("Photo".disk_size_needed)
-         FROM "Photo" INNER JOIN "PhotoInDisk" ON "PhotoInDisk".disk_id = {diskID} AND "Photo".id = "PhotoInDisk".photo_id)
-         , 0);
-    """).format(diskID=sql.Literal(diskID)))
+        conn = ConnectionPool.getConnection()
+        row_effected, entries = Statements.execute(conn, Statements.AVERAGE_PHOTOS_SIZE_ON_DISK, diskID)
         if row_effected != 0:
             result = entries.rows[0][0]
     except Exception as e:
@@ -359,19 +769,14 @@ def getTotalRamOnDisk(diskID: int) -> int:
     conn = None
     result = 0
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(sql.SQL("""
-            select total_ram
-            from "TotalRAMInDisk"
-            where "TotalRAMInDisk".disk_id = {diskID}
-        """).format(
-        diskID=sql.Literal(diskID)))
+        conn = ConnectionPool.getConnection()
+        row_effected, entries = Statements.execute(conn, Statements.TOTAL_RAM_ON_DISK, diskID)
         if row_effected != 0:
             result = entries.rows[0][0]
     except DatabaseException.ConnectionInvalid as e:
         return -1
     except Exception as e:
-        print(e)
+        Instrumentation.noteError(e)
         return -1
     finally:
         conn.close()
@@ -382,16 +787,8 @@ def getCostForDescription(description: str) -> int:
     conn = None
     result = 0
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(sql.SQL("""
-            SELECT COALESCE(
-            (select sum("Disk".cost_per_byte * "Photo".disk_size_needed)
-            from "Disk"
-            inner join "PhotoInDisk" on "PhotoInDisk".disk_id = "Disk".id
-            inner join "Photo" on "Photo".id = "PhotoInDisk".photo_id and "Photo".description = {description})
-            , 0)
-        """).format(
-        description=sql.Literal(description)))
+        conn = ConnectionPool.getConnection()
+        row_effected, entries = Statements.execute(conn, Statements.COST_FOR_DESCRIPTION, description)
         if row_effected != 0:
             result = entries.rows[0][0]
     except Exception as e:
@@ -401,15 +798,13 @@ def getCostForDescription(description: str) -> int:
     return result
 
 
-def getPhotosCanBeAddedToDisk(diskID: int) -> List[int]:
+def getPhotosCanBeAddedToDisk(diskID: int, k: int = 5) -> List[int]:
+    """The k highest photo ids that fit in the disk's free space; see Statements.PHOTOS_CAN_BE_ADDED for the plan."""
     conn = None
     result = []
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(sql.SQL("""
-         SELECT "Photo".id FROM "Disk" INNER JOIN "Photo" ON "Photo".disk_size_needed <= "Disk".free_space 
-         where "Disk".id = {disk_id} ORDER BY "Photo".id DESC LIMIT 5
-        """).format(disk_id=sql.Literal(diskID)))
+        conn = ConnectionPool.getConnection()
+        row_effected, entries = Statements.execute(conn, Statements.PHOTOS_CAN_BE_ADDED_TO_DISK, diskID, k)
         for row in entries.rows:
             result.append(row[0])
     except Exception as e:
@@ -419,20 +814,13 @@ def getPhotosCanBeAddedToDisk(diskID: int) -> List[int]:
     return result
 
 
-def getPhotosCanBeAddedToDiskAndRAM(diskID: int) -> List[int]:
+def getPhotosCanBeAddedToDiskAndRAM(diskID: int, k: int = 5) -> List[int]:
+    """The k lowest photo ids that fit in both the disk's free space and the total RAM attached to it."""
     conn = None
     result = []
     try:
-        conn = Connector.DBConnector()
-        row_effected, entries = conn.execute(sql.SQL("""
-            SELECT "Photo".id FROM "Disk" 
-            LEFT OUTER JOIN "TotalRAMInDisk" ON "TotalRAMInDisk".disk_id="Disk".id
-            LEFT OUTER JOIN "Photo" ON "Photo".disk_size_needed <= "Disk".free_space 
-            AND "Photo".disk_size_needed <= "TotalRAMInDisk".total_ram
-            WHERE "Disk".id = {disk_id} AND "Photo".id IS NOT NULL
-            ORDER BY "Photo".id ASC 
-            LIMIT 5;
-        """).format(disk_id=sql.Literal(diskID)))
+        conn = ConnectionPool.getConnection()
+        row_effected, entries = Statements.execute(conn, Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_AND_RAM, diskID, k)
         for row in entries.rows:
             result.append(row[0])
     except Exception as e:
@@ -446,17 +834,8 @@ def isCompanyExclusive(diskID: int) -> bool:
     conn = None
     result = False
     try:
-        conn = Connector.DBConnector()
-        rows_effected, entries = conn.execute(sql.SQL("""
-            SELECT (COUNT(DISTINCT "RAM".company) = 1 
-            AND MIN("Disk".manufacturing_company) = MIN("RAM".company)) 
-            OR (COUNT(DISTINCT "RAM".company) = 0 AND EXISTS(SELECT "Disk".id FROM "Disk" WHERE "Disk".id = {disk_id})) 
-            AS is_exclusive
-            FROM "Disk"
-            LEFT JOIN "RAMInDisk" ON "Disk".id = "RAMInDisk".disk_id
-            LEFT JOIN "RAM" ON "RAMInDisk".ram_id = "RAM".id
-            WHERE "Disk".id = {disk_id}
-        """).format(disk_id=sql.Literal(diskID)))
+        conn = ConnectionPool.getConnection()
+        rows_effected, entries = Statements.execute(conn, Statements.IS_COMPANY_EXCLUSIVE, diskID)
         result = entries.rows[0][0]
     except Exception as e:
         pass
@@ -469,20 +848,8 @@ def isDiskContainingAtLeastNumExists(description : str, num : int) -> bool:
     conn = None
     result = False
     try:
-        conn = Connector.DBConnector()
-        _, results = conn.execute(sql.SQL("""
-        SELECT EXISTS 
-        (
-            SELECT 1 FROM "PhotoInDisk"
-            INNER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
-            WHERE "Photo".description = {description}
-            GROUP BY "PhotoInDisk".disk_id
-            HAVING COUNT(*) >= {num}
-        ) AS result
-        """).format(
-            description=sql.Literal(description),
-            num=sql.Literal(num)
-        ))
+        conn = ConnectionPool.getConnection()
+        _, results = Statements.execute(conn, Statements.DISK_CONTAINING_AT_LEAST_NUM_EXISTS, description, num)
         result = results.rows[0][0]
     except Exception as e:
         pass
@@ -495,16 +862,8 @@ def getDisksContainingTheMostData() -> List[int]:
     conn = None
     result = []
     try:
-        conn = Connector.DBConnector()
-        _, results = conn.execute(sql.SQL("""
-            SELECT DISTINCT "Disk".id
-            FROM "Disk"
-            JOIN "PhotoInDisk" ON "Disk".id = "PhotoInDisk".disk_id
-            JOIN "Photo" ON "PhotoInDisk".photo_id = "Photo".id
-            GROUP BY "Disk".id
-            ORDER BY SUM("Photo".disk_size_needed) DESC, "Disk".id ASC
-            LIMIT 5;
-        """))
+        conn = ConnectionPool.getConnection()
+        _, results = Statements.execute(conn, Statements.DISKS_CONTAINING_THE_MOST_DATA)
         for row in results.rows:
             result.append(row[0])
     except Exception as e:
@@ -518,11 +877,8 @@ def getConflictingDisks() -> List[int]:
     conn = None
     result = []
     try:
-        conn = Connector.DBConnector()
-        _, results = conn.execute(sql.SQL("""
-            SELECT DISTINCT p1.disk_id FROM "PhotoInDisk" AS p1 JOIN "PhotoInDisk" AS p2 ON p1.photo_id = p2.photo_id
-            WHERE p1.disk_id <> p2.disk_id ORDER BY p1.disk_id ASC;
-        """))
+        conn = ConnectionPool.getConnection()
+        _, results = Statements.execute(conn, Statements.CONFLICTING_DISKS)
         for row in results.rows:
             result.append(row[0])
     except Exception as e:
@@ -533,16 +889,16 @@ def getConflictingDisks() -> List[int]:
 
 
 def mostAvailableDisks() -> List[int]:
+    """
+    Counts the fitting photos only for the disks with room for the largest photo that fits on the 5th roomiest disk,
+    a range of Disk_free_space_idx, at O(log |Photo|) per disk. That is every disk when no photo fits on the 5th
+    roomiest one, and all disks of nearly equal free space when they crowd that bound; then it is O(|Disk|).
+    """
     conn = None
     result = []
     try:
-        conn = Connector.DBConnector()
-        _, results = conn.execute(sql.SQL("""
-            SELECT disk_id 
-            FROM "DiskPhotoCounts"
-            ORDER BY photo_count DESC, disk_speed DESC, disk_id ASC 
-            LIMIT 5;
-        """))
+        conn = ConnectionPool.getConnection()
+        _, results = Statements.execute(conn, Statements.MOST_AVAILABLE_DISKS)
         for row in results.rows:
             result.append(row[0])
     except Exception as e:
@@ -552,26 +908,89 @@ def mostAvailableDisks() -> List[int]:
     return result
 
 
+CLOSE_PHOTOS_QUERY = "query"
+CLOSE_PHOTOS_PRECOMPUTED = "precomputed"
+
+
+REBUILD_PHOTO_CO_OCCURRENCE = """
+    LOCK TABLE "PhotoInDisk" IN SHARE MODE;
+    TRUNCATE "PhotoCoOccurrence", "PhotoDiskCount";
+    INSERT INTO "PhotoCoOccurrence" (photo_id, other_photo_id, shared_disks)
+    SELECT p1.photo_id, p2.photo_id, COUNT(*) FROM "PhotoInDisk" AS p1
+    INNER JOIN "PhotoInDisk" AS p2 ON p1.disk_id = p2.disk_id AND p1.photo_id <> p2.photo_id
+    GROUP BY p1.photo_id, p2.photo_id;
+    INSERT INTO "PhotoDiskCount" (photo_id, disk_count)
+    SELECT photo_id, COUNT(*) FROM "PhotoInDisk" GROUP BY photo_id;
+"""
+
+ENABLE_CO_OCCURRENCE = """
+    ALTER TABLE "PhotoInDisk" ENABLE TRIGGER "PhotoInDisk_co_occurrence_insert";
+    ALTER TABLE "PhotoInDisk" ENABLE TRIGGER "PhotoInDisk_co_occurrence_delete";
+"""
+
+DISABLE_CO_OCCURRENCE = """
+    ALTER TABLE "PhotoInDisk" DISABLE TRIGGER "PhotoInDisk_co_occurrence_insert";
+    ALTER TABLE "PhotoInDisk" DISABLE TRIGGER "PhotoInDisk_co_occurrence_delete";
+    TRUNCATE "PhotoCoOccurrence", "PhotoDiskCount";
+"""
+
+
+def rebuildPhotoCoOccurrence(conn=None) -> ReturnValue:
+    owned = conn is None
+    result = ReturnValue.OK
+    try:
+        if owned:
+            conn = ConnectionPool.getConnection()
+        conn.execute(REBUILD_PHOTO_CO_OCCURRENCE)
+        if owned:
+            conn.commit()
+    except Exception as e:
+        if owned:
+            conn.rollback()
+        result = ReturnValue.ERROR
+    finally:
+        if owned and conn is not None:
+            conn.close()
+    return result
+
+
+def setClosePhotosStrategy(strategy: str) -> ReturnValue:
+    """
+    CLOSE_PHOTOS_QUERY answers getClosePhotos by self-joining PhotoInDisk at query time.
+    CLOSE_PHOTOS_PRECOMPUTED enables the PhotoInDisk triggers that maintain PhotoCoOccurrence and PhotoDiskCount,
+    rebuilds both tables from the current placements in the same transaction, and answers from them.
+    The strategy is the state of those triggers, so it holds for every process on the database, and createTables
+    after dropTables starts over with CLOSE_PHOTOS_QUERY.
+    """
+    if strategy not in (CLOSE_PHOTOS_QUERY, CLOSE_PHOTOS_PRECOMPUTED):
+        return ReturnValue.BAD_PARAMS
+    conn = None
+    result = ReturnValue.OK
+    try:
+        conn = ConnectionPool.getConnection()
+        if strategy == CLOSE_PHOTOS_PRECOMPUTED:
+            conn.execute(ENABLE_CO_OCCURRENCE)
+            result = rebuildPhotoCoOccurrence(conn)
+        else:
+            conn.execute(DISABLE_CO_OCCURRENCE)
+        if result == ReturnValue.OK:
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception as e:
+        conn.rollback()
+        result = ReturnValue.ERROR
+    finally:
+        conn.close()
+    return result
+
+
 def getClosePhotos(photoID: int) -> List[int]:
     conn = None
     result = []
     try:
-        conn = Connector.DBConnector()
-        _, results = conn.execute(sql.SQL(""" 
-            CREATE OR REPLACE VIEW "PhotoNotSavedOnSomeDisk" AS
-            SELECT NOT EXISTS (SELECT * FROM "PhotoInDisk" WHERE "PhotoInDisk".photo_id = {photo_id});
-            CREATE OR REPLACE VIEW "DisksPhotoSavedOn" AS
-            SELECT "PhotoInDisk".disk_id FROM "PhotoInDisk" WHERE "PhotoInDisk".photo_id = {photo_id}; 
-            (SELECT DISTINCT PID.photo_id FROM "PhotoInDisk" PID 
-            WHERE PID.disk_id IN (SELECT * FROM "DisksPhotoSavedOn") AND PID.photo_id <> {photo_id}
-            GROUP BY PID.photo_id
-            HAVING COUNT(PID.photo_id) >= (SELECT COUNT(*) FROM "DisksPhotoSavedOn")  * 0.5 
-            ORDER BY PID.photo_id ASC
-            LIMIT 10)
-            UNION ALL
-            (SELECT "Photo".id FROM "Photo" WHERE (SELECT * FROM "PhotoNotSavedOnSomeDisk") AND "Photo".id <> {photo_id}
-            ORDER BY "Photo".id ASC LIMIT 10);
-        """).format(photo_id=sql.Literal(photoID)))
+        conn = ConnectionPool.getConnection()
+        _, results = Statements.execute(conn, Statements.CLOSE_PHOTOS_CURRENT, photoID)
         for row in results.rows:
             result.append(row[0])
     except Exception as e:
@@ -579,3 +998,127 @@ def getClosePhotos(photoID: int) -> List[int]:
     finally:
         conn.close()
     return result
+
+
+STREAM_FETCH_SIZE = 1000
+_cursorNames = count(1)
+
+
+def streamIDs(statement: Statements.Statement, *params, fetchSize: Optional[int] = None) -> Iterator[int]:
+    """
+    Runs a page statement with no boundary and no limit behind a server-side cursor and yields the first column
+    of every row, fetching fetchSize rows per round trip.
+    The pooled connection stays borrowed until the generator is exhausted or closed; a database error ends the
+    stream early, the way the list functions return [] on error.
+    """
+    conn = None
+    name = sql.Identifier("stream_{}".format(next(_cursorNames)))
+    fetch = sql.SQL("FETCH FORWARD {size} FROM {name}").format(size=sql.Literal(fetchSize or STREAM_FETCH_SIZE),
+                                                                name=name)
+    try:
+        conn = ConnectionPool.getConnection()
+        conn.execute(sql.SQL("DECLARE {name} NO SCROLL CURSOR FOR {query}").format(
+            name=name, query=statement.literalQuery(params + (None, None))))
+        while True:
+            _, results = conn.execute(fetch)
+            for row in results.rows:
+                yield row[0]
+            if len(results.rows) < (fetchSize or STREAM_FETCH_SIZE):
+                break
+    except Exception as e:
+        pass
+    finally:
+        if conn is not None:
+            conn.rollback()
+            conn.close()
+
+
+def pageIDs(statement: Statements.Statement, *params) -> List[int]:
+    conn = None
+    result = []
+    try:
+        conn = ConnectionPool.getConnection()
+        _, results = Statements.execute(conn, statement, *params)
+        for row in results.rows:
+            result.append(row[0])
+    except Exception as e:
+        result = []
+    finally:
+        conn.close()
+    return result
+
+
+def streamConflictingDisks(fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamIDs(Statements.CONFLICTING_DISKS_PAGE, fetchSize=fetchSize)
+
+
+def streamPhotosCanBeAddedToDisk(diskID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamIDs(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_PAGE, diskID, fetchSize=fetchSize)
+
+
+def streamPhotosCanBeAddedToDiskAndRAM(diskID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamIDs(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_AND_RAM_PAGE, diskID, fetchSize=fetchSize)
+
+
+def streamDisksContainingTheMostData(fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamIDs(Statements.DISKS_CONTAINING_THE_MOST_DATA_PAGE, fetchSize=fetchSize)
+
+
+def streamClosePhotos(photoID: int, fetchSize: Optional[int] = None) -> Iterator[int]:
+    return streamIDs(Statements.CLOSE_PHOTOS_CURRENT_PAGE, photoID, fetchSize=fetchSize)
+
+
+def getConflictingDisksPage(after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    """Conflicting disks with an id greater than after_id, pass the last id of a page to get the next one."""
+    return pageIDs(Statements.CONFLICTING_DISKS_PAGE, after_id, limit)
+
+
+def getPhotosCanBeAddedToDiskPage(diskID: int, after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    """Ordered by id descending like getPhotosCanBeAddedToDisk, so a page continues below after_id."""
+    return pageIDs(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_PAGE, diskID, after_id, limit)
+
+
+def getPhotosCanBeAddedToDiskAndRAMPage(diskID: int, after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return pageIDs(Statements.PHOTOS_CAN_BE_ADDED_TO_DISK_AND_RAM_PAGE, diskID, after_id, limit)
+
+
+def getDisksContainingTheMostDataPage(after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    """
+    Ordered by stored bytes descending, then id. The page after after_id starts behind that disk's current total,
+    so a disk whose photos change between two calls can move across the page boundary.
+    """
+    return pageIDs(Statements.DISKS_CONTAINING_THE_MOST_DATA_PAGE, after_id, limit)
+
+
+def getClosePhotosPage(photoID: int, after_id: Optional[int] = None, limit: int = 100) -> List[int]:
+    return pageIDs(Statements.CLOSE_PHOTOS_CURRENT_PAGE, photoID, after_id, limit)
+
+
+# the public API; internal helpers such as addTuple are accounted to the public call that uses them
+INSTRUMENTED = ["createTables", "clearTables", "dropTables", "addPhoto", "getPhotoByID", "deletePhoto", "addDisk",
+                "getDiskByID", "deleteDisk", "addRAM", "getRAMByID", "deleteRAM", "getPhotosByIDs", "getDisksByIDs",
+                "getRAMsByIDs", "addDiskAndPhoto", "addPhotoToDisk", "addPhotoToAnyDisk", "removePhotoFromDisk",
+                "addRAMToDisk", "removeRAMFromDisk", "addPhotos", "addDisks", "addRAMs", "addPhotosToDisk",
+                "placePhotos", "averagePhotosSizeOnDisk", "getTotalRamOnDisk", "getCostForDescription",
+                "getPhotosCanBeAddedToDisk", "getPhotosCanBeAddedToDiskAndRAM", "isCompanyExclusive",
+                "isDiskContainingAtLeastNumExists", "getDisksContainingTheMostData", "getConflictingDisks",
+                "mostAvailableDisks", "rebuildPhotoCoOccurrence", "setClosePhotosStrategy", "getClosePhotos",
+                "streamConflictingDisks", "streamPhotosCanBeAddedToDisk", "streamPhotosCanBeAddedToDiskAndRAM",
+                "streamDisksContainingTheMostData", "streamClosePhotos", "getConflictingDisksPage",
+                "getPhotosCanBeAddedToDiskPage", "getPhotosCanBeAddedToDiskAndRAMPage",
+                "getDisksContainingTheMostDataPage", "getClosePhotosPage"]
+
+# how Replicas routes the public API once replicas are configured; everything else is a write and runs on the primary
+READS = ["averagePhotosSizeOnDisk", "getTotalRamOnDisk", "getCostForDescription", "getPhotosCanBeAddedToDisk",
+         "getPhotosCanBeAddedToDiskAndRAM", "isCompanyExclusive", "isDiskContainingAtLeastNumExists",
+         "getDisksContainingTheMostData", "getConflictingDisks", "mostAvailableDisks", "getClosePhotos",
+         "streamConflictingDisks", "streamPhotosCanBeAddedToDisk", "streamPhotosCanBeAddedToDiskAndRAM",
+         "streamDisksContainingTheMostData", "streamClosePhotos", "getConflictingDisksPage",
+         "getPhotosCanBeAddedToDiskPage", "getPhotosCanBeAddedToDiskAndRAMPage", "getDisksContainingTheMostDataPage",
+         "getClosePhotosPage"]
+# reads that fill the id caches, which other threads trust without a write position of their own
+PRIMARY_READS = ["getPhotoByID", "getDiskByID", "getRAMByID", "getPhotosByIDs", "getDisksByIDs", "getRAMsByIDs"]
+
+# routed inside the instrumented call, so the record holds the route and the replica's round trips
+Replicas.routeModule(globals(), INSTRUMENTED, READS, PRIMARY_READS)
+Instrumentation.instrumentModule(globals(), INSTRUMENTED)
@@ -0,0 +1,580 @@
+import re
+import threading
+from typing import Dict, List
+
+from psycopg2 import sql
+
+
+class Statement:
+    def __init__(self, name: str, paramTypes: List[str], text: str):
+        self.name = name
+        self.paramTypes = paramTypes
+        self.text = text
+
+    @property
+    def typedText(self) -> str:
+        """The text with every placeholder cast to its declared type, for drivers that bind $n without PREPARE."""
+        return re.sub(r"\$(\d+)(?!\d)", lambda match: "(${}::{})".format(
+            match.group(1), self.paramTypes[int(match.group(1)) - 1]), self.text)
+
+    def literalQuery(self, params):
+        """The text with the parameters inlined as typed literals, for commands that cannot EXECUTE, e.g. DECLARE."""
+        parts = re.split(r"\$(\d+)(?!\d)", self.text)
+        query = [sql.SQL(parts[0])]
+        for index in range(1, len(parts), 2):
+            position = int(parts[index]) - 1
+            query.append(sql.SQL("({}::{})").format(sql.Literal(params[position]), sql.SQL(self.paramTypes[position])))
+            query.append(sql.SQL(parts[index + 1]))
+        return sql.Composed(query)
+
+    def prepareQuery(self):
+        if not self.paramTypes:
+            return sql.SQL('PREPARE {name} AS {text}').format(name=sql.Identifier(self.name), text=sql.SQL(self.text))
+        return sql.SQL('PREPARE {name} ({types}) AS {text}').format(
+            name=sql.Identifier(self.name),
+            types=sql.SQL(', ').join(sql.SQL(paramType) for paramType in self.paramTypes),
+            text=sql.SQL(self.text))
+
+    def executeQuery(self, params):
+        if not params:
+            return sql.SQL('EXECUTE {name}').format(name=sql.Identifier(self.name))
+        return sql.SQL('EXECUTE {name} ({params})').format(
+            name=sql.Identifier(self.name),
+            params=sql.SQL(', ').join(map(sql.Literal, params)))
+
+
+class BoundStatement:
+    def __init__(self, statement: Statement, params: tuple):
+        self.statement = statement
+        self.params = params
+
+
+class StatementRegistry:
+    """
+    Named, parameterized statements ($1, $2, ... placeholders) that are PREPAREd once per session
+    and then run with EXECUTE, so PostgreSQL parses and plans them once per pooled connection.
+    The set of statements a session already prepared is kept on the connection object itself,
+    so it goes away together with the session when the pool discards it.
+    """
+
+    def __init__(self):
+        self.statements: Dict[str, Statement] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def register(self, name: str, paramTypes: List[str], text: str) -> Statement:
+        if name in self.statements:
+            raise ValueError("statement {} is already registered".format(name))
+        statement = Statement(name, paramTypes, text)
+        self.statements[name] = statement
+        return statement
+
+    def prepare(self, conn, statement: Statement):
+        prepared = getattr(conn, "prepared", None)
+        if prepared is None:
+            prepared = conn.prepared = set()
+        if statement.name in prepared:
+            with self._lock:
+                self.hits += 1
+        else:
+            conn.execute(statement.prepareQuery())
+            prepared.add(statement.name)
+            with self._lock:
+                self.misses += 1
+
+    def execute(self, conn, statement: Statement, *params):
+        self.prepare(conn, statement)
+        return conn.execute(statement.executeQuery(params))
+
+    def explain(self, conn, statement: Statement, *params, analyze: bool = False):
+        self.prepare(conn, statement)
+        options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+        return conn.execute(sql.SQL('EXPLAIN ({options}) {query}').format(options=sql.SQL(options),
+                                                                          query=statement.executeQuery(params)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hitRate": self.hits / total if total else 0.0,
+                    "statements": len(self.statements)}
+
+    def resetStats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+registry = StatementRegistry()
+
+PHOTO_BY_ID = registry.register("photo_by_id", ["integer"], 'SELECT * FROM "Photo" WHERE id = $1')
+
+DISK_BY_ID = registry.register("disk_by_id", ["integer"], 'SELECT * FROM "Disk" WHERE id = $1')
+
+RAM_BY_ID = registry.register("ram_by_id", ["integer"], 'SELECT * FROM "RAM" WHERE id = $1')
+
+PHOTOS_BY_IDS = registry.register("photos_by_ids", ["integer[]"], 'SELECT * FROM "Photo" WHERE id = ANY($1)')
+
+DISKS_BY_IDS = registry.register("disks_by_ids", ["integer[]"], 'SELECT * FROM "Disk" WHERE id = ANY($1)')
+
+RAMS_BY_IDS = registry.register("rams_by_ids", ["integer[]"], 'SELECT * FROM "RAM" WHERE id = ANY($1)')
+
+TOTAL_RAM_ON_DISK = registry.register("total_ram_on_disk", ["integer"], """
+    SELECT total_ram FROM "DiskRAMStats" WHERE "DiskRAMStats".disk_id = $1
+""")
+
+AVERAGE_PHOTOS_SIZE_ON_DISK = registry.register("average_photos_size_on_disk", ["integer"], """
+    SELECT COALESCE(
+    (SELECT AVG("Photo".disk_size_needed)
+    FROM "Photo" INNER JOIN "PhotoInDisk" ON "PhotoInDisk".disk_id = $1 AND "Photo".id = "PhotoInDisk".photo_id)
+    , 0)
+""")
+
+COST_FOR_DESCRIPTION = registry.register("cost_for_description", ["text"], """
+    SELECT COALESCE((SELECT total_cost FROM "DescriptionCost" WHERE description = $1), 0)
+""")
+
+# Top k photos no larger than a disk's bound, by id. When at least 1/64 of the photos fit, walking the id index
+# ("Photo_id_size_idx", covering the size) finds k of them within about 64k entries. Otherwise every size bucket
+# up to the bound, one "PhotoSizeCounts" row each, gives its own top k from the (disk_size_needed, id) index and
+# the buckets' heads are merged, so a nearly full disk reads k entries per bucket instead of every fitting photo.
+# Both branches are gated on a one-time filter over the counts, only the chosen one runs.
+PHOTOS_CAN_BE_ADDED = """
+    WITH bound AS ({bound}),
+    sizes AS (
+        SELECT "PhotoSizesAtMost"((SELECT bound FROM bound)) AS fitting, "PhotoSizesAtMost"(2147483647) AS total)
+    (SELECT "Photo".id FROM "Photo"
+    WHERE (SELECT fitting * 64 >= total FROM sizes) AND "Photo".disk_size_needed <= (SELECT bound FROM bound)
+    ORDER BY "Photo".id {order} LIMIT $2)
+    UNION ALL
+    (SELECT head.id FROM "PhotoSizeCounts" AS buckets
+    CROSS JOIN LATERAL (SELECT "Photo".id FROM "Photo" WHERE "Photo".disk_size_needed = buckets.disk_size_needed
+                        ORDER BY "Photo".id {order} LIMIT $2) AS head
+    WHERE (SELECT fitting * 64 < total FROM sizes) AND buckets.disk_size_needed <= (SELECT bound FROM bound)
+    ORDER BY head.id {order} LIMIT $2)
+"""
+
+DISK_BOUND = 'SELECT free_space AS bound FROM "Disk" WHERE id = $1'
+
+# the RAM bound is the maintained total, a disk without a "DiskRAMStats" row has no bound and no photos
+DISK_AND_RAM_BOUND = """
+    SELECT LEAST("Disk".free_space, "DiskRAMStats".total_ram) AS bound
+    FROM "Disk" INNER JOIN "DiskRAMStats" ON "DiskRAMStats".disk_id = "Disk".id WHERE "Disk".id = $1
+"""
+
+PHOTOS_CAN_BE_ADDED_TO_DISK = registry.register("photos_can_be_added_to_disk", ["integer", "bigint"],
+                                                PHOTOS_CAN_BE_ADDED.format(bound=DISK_BOUND, order="DESC"))
+
+PHOTOS_CAN_BE_ADDED_TO_DISK_AND_RAM = registry.register("photos_can_be_added_to_disk_and_ram", ["integer", "bigint"],
+                                                        PHOTOS_CAN_BE_ADDED.format(bound=DISK_AND_RAM_BOUND,
+                                                                                   order="ASC"))
+
+IS_COMPANY_EXCLUSIVE = registry.register("is_company_exclusive", ["integer"], """
+    SELECT COALESCE((SELECT foreign_ram_count = 0 FROM "DiskRAMStats" WHERE disk_id = $1), FALSE) AS is_exclusive
+""")
+
+DISK_CONTAINING_AT_LEAST_NUM_EXISTS = registry.register("disk_containing_at_least_num_exists", ["text", "integer"], """
+    SELECT EXISTS
+    (
+        SELECT 1 FROM "PhotoInDisk"
+        INNER JOIN "Photo" ON "Photo".id = "PhotoInDisk".photo_id
+        WHERE "Photo".description = $1
+        GROUP BY "PhotoInDisk".disk_id
+        HAVING COUNT(*) >= $2
+    ) AS result
+""")
+
+DISKS_CONTAINING_THE_MOST_DATA = registry.register("disks_containing_the_most_data", [], """
+    SELECT disk_id FROM "DiskUsage" WHERE photo_count > 0 ORDER BY used_bytes DESC, disk_id ASC LIMIT 5
+""")
+
+# Driven by the disks: each disk's photos are walked through PhotoInDisk_disk_id_idx only until one of them has
+# another copy, instead of joining every placement with every other copy of its photo.
+CONFLICTING_DISKS_QUERY = """
+    SELECT "Disk".id FROM "Disk"
+    WHERE EXISTS (SELECT 1 FROM "PhotoInDisk" AS p1
+                  WHERE p1.disk_id = "Disk".id
+                  AND EXISTS (SELECT 1 FROM "PhotoInDisk" AS p2 WHERE p2.photo_id = p1.photo_id
+                              AND p2.disk_id <> p1.disk_id))
+"""
+
+CONFLICTING_DISKS = registry.register("conflicting_disks", [], CONFLICTING_DISKS_QUERY + """
+    ORDER BY "Disk".id ASC
+""")
+
+# A disk's photo count only grows with its free space, so the top k all have room for the largest photo that fits on
+# the kth roomiest disk, or any room if none fits there: the candidates are a range of Disk_free_space_idx and
+# PhotoSizesAtMost runs for them only. Fewer than k disks leave the bound at 0.
+MOST_AVAILABLE_DISKS_QUERY = """
+    WITH fit AS (
+        SELECT COALESCE(MAX(disk_size_needed), 0) AS at_least FROM "PhotoSizeCounts"
+        WHERE disk_size_needed <= (SELECT free_space FROM "Disk" ORDER BY free_space DESC LIMIT 1 OFFSET {limit} - 1)
+    )
+    SELECT "Disk".id AS disk_id, "PhotoSizesAtMost"("Disk".free_space) AS photo_count, "Disk".speed AS disk_speed
+    FROM "Disk", fit
+    WHERE "Disk".free_space >= fit.at_least
+    ORDER BY photo_count DESC, disk_speed DESC, disk_id ASC
+    LIMIT {limit}
+"""
+
+MOST_AVAILABLE_DISKS = registry.register("most_available_disks", [], MOST_AVAILABLE_DISKS_QUERY.format(limit=5))
+
+ADD_PHOTO = registry.register("add_photo", ["integer", "text", "integer"], """
+    INSERT INTO "Photo" VALUES ($1, $2, $3)
+""")
+
+ADD_DISK = registry.register("add_disk", ["integer", "text", "integer", "integer", "integer"], """
+    INSERT INTO "Disk" (id, manufacturing_company, speed, free_space, cost_per_byte) VALUES ($1, $2, $3, $4, $5)
+""")
+
+ADD_RAM = registry.register("add_ram", ["integer", "integer", "text"], """
+    INSERT INTO "RAM" VALUES ($1, $2, $3)
+""")
+
+DELETE_DISK = registry.register("delete_disk", ["integer"], 'DELETE FROM "Disk" WHERE id = $1')
+
+DELETE_RAM = registry.register("delete_ram", ["integer"], 'DELETE FROM "RAM" WHERE id = $1')
+
+# selecting from disk makes the Disk insert run, and report its error, before the Photo insert
+ADD_DISK_AND_PHOTO = registry.register("add_disk_and_photo", ["integer", "text", "integer", "integer", "integer",
+                                                              "integer", "text", "integer"], """
+    WITH disk AS (INSERT INTO "Disk" VALUES ($1, $2, $3, $4, $5) RETURNING id)
+    INSERT INTO "Photo" SELECT $6, $7, $8 FROM disk
+""")
+
+# Writers that change free_space lock the Disk rows first, in id order, and only then touch PhotoInDisk and Photo,
+# so a placement, a removal and a photo deletion meeting on the same disks wait for each other instead of deadlocking.
+
+ADD_PHOTO_TO_DISK = registry.register("add_photo_to_disk", ["integer", "text", "integer", "integer"], """
+    WITH disk AS (SELECT "Disk".id FROM "Disk" WHERE "Disk".id = $4 FOR NO KEY UPDATE),
+    placed AS (
+        INSERT INTO "PhotoInDisk" VALUES (
+            (SELECT "Photo".id FROM "Photo" WHERE id = $1 AND description = $2 AND disk_size_needed = $3),
+            (SELECT id FROM disk))
+        RETURNING disk_id)
+    UPDATE "Disk" SET free_space = free_space - $3 FROM placed WHERE "Disk".id = placed.disk_id
+""")
+
+ADD_PHOTO_TO_ANY_DISK = """
+    WITH photo AS (SELECT id, disk_size_needed FROM "Photo"
+                   WHERE (id, description, disk_size_needed) = ($1::integer, $2::text, $3::integer)),
+    target AS (
+        SELECT "Disk".id FROM "Disk", photo
+        WHERE "Disk".free_space >= photo.disk_size_needed
+        AND NOT EXISTS (SELECT 1 FROM "PhotoInDisk" WHERE photo_id = photo.id AND disk_id = "Disk".id)
+        ORDER BY "Disk".id LIMIT 1
+        FOR NO KEY UPDATE OF "Disk" {wait}),
+    placed AS (INSERT INTO "PhotoInDisk" SELECT photo.id, target.id FROM photo, target RETURNING disk_id),
+    updated AS (UPDATE "Disk" SET free_space = free_space - $3 FROM placed WHERE "Disk".id = placed.disk_id
+                RETURNING "Disk".id)
+    SELECT (SELECT id FROM updated), EXISTS (SELECT 1 FROM photo)
+"""
+
+ADD_PHOTO_TO_ANY_DISK_SKIP_LOCKED = registry.register("add_photo_to_any_disk_skip_locked",
+                                                      ["integer", "text", "integer"],
+                                                      ADD_PHOTO_TO_ANY_DISK.format(wait="SKIP LOCKED"))
+
+ADD_PHOTO_TO_ANY_DISK = registry.register("add_photo_to_any_disk", ["integer", "text", "integer"],
+                                          ADD_PHOTO_TO_ANY_DISK.format(wait=""))
+
+ADD_RAM_TO_DISK = registry.register("add_ram_to_disk", ["integer", "integer"], 'INSERT INTO "RAMInDisk" VALUES ($1, $2)')
+
+REMOVE_RAM_FROM_DISK = registry.register("remove_ram_from_disk", ["integer", "integer"], """
+    DELETE FROM "RAMInDisk" WHERE ram_id = $1 AND disk_id = $2
+""")
+
+ADD_PHOTOS = registry.register("add_photos", ["integer[]", "text[]", "integer[]"], """
+    INSERT INTO "Photo" SELECT * FROM unnest($1::integer[], $2::text[], $3::integer[])
+    ON CONFLICT (id) DO NOTHING RETURNING id
+""")
+
+ADD_DISKS = registry.register("add_disks", ["integer[]", "text[]", "integer[]", "integer[]", "integer[]"], """
+    INSERT INTO "Disk" (id, manufacturing_company, speed, free_space, cost_per_byte)
+    SELECT * FROM unnest($1::integer[], $2::text[], $3::integer[], $4::integer[], $5::integer[])
+    ON CONFLICT (id) DO NOTHING RETURNING id
+""")
+
+ADD_RAMS = registry.register("add_rams", ["integer[]", "integer[]", "text[]"], """
+    INSERT INTO "RAM" SELECT * FROM unnest($1::integer[], $2::integer[], $3::text[])
+    ON CONFLICT (id) DO NOTHING RETURNING id
+""")
+
+# disks are locked in id order so concurrent batches touching the same disks cannot deadlock
+PLACEMENT_DISKS = registry.register("placement_disks", ["integer[]"], """
+    SELECT id, free_space FROM "Disk" WHERE id = ANY($1::integer[]) ORDER BY id FOR NO KEY UPDATE
+""")
+
+PLACEMENT_PHOTOS = registry.register("placement_photos", ["integer[]"], """
+    SELECT id, description, disk_size_needed FROM "Photo" WHERE id = ANY($1::integer[])
+""")
+
+PLACEMENT_PAIRS = registry.register("placement_pairs", ["integer[]", "integer[]"], """
+    SELECT photo_id, disk_id FROM "PhotoInDisk" WHERE photo_id = ANY($1::integer[]) AND disk_id = ANY($2::integer[])
+""")
+
+PLACE_PHOTOS = registry.register("place_photos", ["integer[]", "integer[]", "integer[]", "integer[]"], """
+    WITH placed AS (INSERT INTO "PhotoInDisk" SELECT * FROM unnest($1::integer[], $2::integer[]))
+    UPDATE "Disk" SET free_space = free_space - used.size
+    FROM unnest($3::integer[], $4::integer[]) AS used(disk_id, size) WHERE "Disk".id = used.disk_id
+""")
+
+# Solution.placePhotos plans over unlocked disks, then locks only the disks the plan chose, in id order so concurrent
+# batches cannot deadlock, and checks them again before writing. PLANNER_DISKS_LOCKED locks every disk for the
+# last attempt after the chosen disks kept changing under the plan.
+PLANNER_DISKS_QUERY = """
+    SELECT "Disk".id, "Disk".free_space, "Disk".speed, "Disk".cost_per_byte, "DiskRAMStats".total_ram
+    FROM "Disk" LEFT JOIN "DiskRAMStats" ON "DiskRAMStats".disk_id = "Disk".id
+    ORDER BY "Disk".id
+"""
+
+PLANNER_DISKS = registry.register("planner_disks", [], PLANNER_DISKS_QUERY)
+
+PLANNER_DISKS_LOCKED = registry.register("planner_disks_locked", [], PLANNER_DISKS_QUERY + """
+    FOR NO KEY UPDATE OF "Disk"
+""")
+
+PLANNER_CHOSEN_DISKS = registry.register("planner_chosen_disks", ["integer[]"], """
+    SELECT "Disk".id, "Disk".free_space, "DiskRAMStats".total_ram
+    FROM "Disk" LEFT JOIN "DiskRAMStats" ON "DiskRAMStats".disk_id = "Disk".id
+    WHERE "Disk".id = ANY($1::integer[])
+    ORDER BY "Disk".id FOR NO KEY UPDATE OF "Disk"
+""")
+
+PLANNER_PHOTOS = registry.register("planner_photos", ["integer[]"], """
+    SELECT id, disk_size_needed FROM "Photo" WHERE id = ANY($1::integer[])
+""")
+
+PLANNER_PAIRS = registry.register("planner_pairs", ["integer[]"], """
+    SELECT photo_id, disk_id FROM "PhotoInDisk" WHERE photo_id = ANY($1::integer[])
+""")
+
+DELETE_PHOTO = registry.register("delete_photo", ["integer", "text", "integer"], """
+    WITH target AS (SELECT id, disk_size_needed FROM "Photo"
+                    WHERE (id, description, disk_size_needed) = ($1::integer, $2::text, $3::integer)),
+    locked AS (SELECT "Disk".id FROM "Disk"
+               WHERE "Disk".id IN (SELECT disk_id FROM "PhotoInDisk", target WHERE photo_id = target.id)
+               ORDER BY "Disk".id FOR NO KEY UPDATE),
+    freed AS (UPDATE "Disk" SET free_space = free_space + target.disk_size_needed
+              FROM target INNER JOIN "PhotoInDisk" ON "PhotoInDisk".photo_id = target.id
+              INNER JOIN locked ON locked.id = "PhotoInDisk".disk_id
+              WHERE "Disk".id = "PhotoInDisk".disk_id
+              RETURNING "Disk".id),
+    deleted AS (DELETE FROM "Photo" USING target WHERE "Photo".id = target.id RETURNING "Photo".id)
+    SELECT ARRAY(SELECT id FROM freed), (SELECT COUNT(*) FROM deleted)
+""")
+
+REMOVE_PHOTO_FROM_DISK = registry.register("remove_photo_from_disk", ["integer", "integer"], """
+    WITH disk AS (SELECT "Disk".id FROM "Disk" WHERE "Disk".id = $2 FOR NO KEY UPDATE),
+    removed AS (DELETE FROM "PhotoInDisk" USING disk WHERE photo_id = $1 AND disk_id = disk.id
+                RETURNING photo_id, disk_id)
+    UPDATE "Disk" SET free_space = free_space + "Photo".disk_size_needed
+    FROM removed INNER JOIN "Photo" ON "Photo".id = removed.photo_id
+    WHERE "Disk".id = removed.disk_id
+""")
+
+CLOSE_PHOTOS = registry.register("close_photos", ["integer"], """
+    WITH saved_on AS (SELECT disk_id FROM "PhotoInDisk" WHERE photo_id = $1)
+    (SELECT PID.photo_id FROM "PhotoInDisk" PID
+    WHERE PID.disk_id IN (SELECT disk_id FROM saved_on) AND PID.photo_id <> $1
+    GROUP BY PID.photo_id
+    HAVING COUNT(PID.photo_id) >= (SELECT COUNT(*) FROM saved_on) * 0.5
+    ORDER BY PID.photo_id ASC
+    LIMIT 10)
+    UNION ALL
+    (SELECT "Photo".id FROM "Photo" WHERE NOT EXISTS (SELECT 1 FROM saved_on) AND "Photo".id <> $1
+    ORDER BY "Photo".id ASC LIMIT 10)
+""")
+
+CLOSE_PHOTOS_PRECOMPUTED = registry.register("close_photos_precomputed", ["integer"], """
+    WITH saved AS (SELECT COALESCE((SELECT disk_count FROM "PhotoDiskCount" WHERE photo_id = $1), 0) AS disk_count)
+    (SELECT "PhotoCoOccurrence".other_photo_id FROM "PhotoCoOccurrence", saved
+    WHERE "PhotoCoOccurrence".photo_id = $1 AND saved.disk_count > 0
+    AND "PhotoCoOccurrence".shared_disks >= saved.disk_count * 0.5
+    ORDER BY "PhotoCoOccurrence".other_photo_id ASC
+    LIMIT 10)
+    UNION ALL
+    (SELECT "Photo".id FROM "Photo", saved WHERE saved.disk_count = 0 AND "Photo".id <> $1
+    ORDER BY "Photo".id ASC LIMIT 10)
+""")
+
+# Keyset-paged versions of the list queries: $1 (or $2 after the query's own parameter) is the last id of the previous
+# page, NULL for the first page, and the last parameter is the page size, NULL for no limit.
+# Without the LIMIT 5/10 of the originals they cover the whole ordered result the originals return the head of.
+
+CONFLICTING_DISKS_PAGE = registry.register("conflicting_disks_page", ["integer", "bigint"],
+                                            CONFLICTING_DISKS_QUERY + """
+    AND "Disk".id > COALESCE($1, 0) ORDER BY "Disk".id ASC
+    LIMIT $2
+""")
+
+PHOTOS_CAN_BE_ADDED_TO_DISK_PAGE = registry.register("photos_can_be_added_to_disk_page",
+                                                     ["integer", "integer", "bigint"], """
+    SELECT "Photo".id FROM "Disk" INNER JOIN "Photo" ON "Photo".disk_size_needed <= "Disk".free_space
+    WHERE "Disk".id = $1 AND "Photo".id < COALESCE($2, 2147483648)
+    ORDER BY "Photo".id DESC LIMIT $3
+""")
+
+PHOTOS_CAN_BE_ADDED_TO_DISK_AND_RAM_PAGE = registry.register("photos_can_be_added_to_disk_and_ram_page",
+                                                             ["integer", "integer", "bigint"], """
+    SELECT "Photo".id FROM "Disk"
+    INNER JOIN "DiskRAMStats" ON "DiskRAMStats".disk_id = "Disk".id
+    INNER JOIN "Photo" ON "Photo".disk_size_needed <= "Disk".free_space
+    AND "Photo".disk_size_needed <= "DiskRAMStats".total_ram
+    WHERE "Disk".id = $1 AND "Photo".id > COALESCE($2, 0)
+    ORDER BY "Photo".id ASC
+    LIMIT $3
+""")
+
+# ordered by (used_bytes DESC, id ASC), so the page boundary is the previous page's last disk together with its bytes
+DISKS_CONTAINING_THE_MOST_DATA_PAGE = registry.register("disks_containing_the_most_data_page",
+                                                        ["integer", "bigint"], """
+    WITH boundary AS (SELECT used_bytes FROM "DiskUsage" WHERE disk_id = $1)
+    SELECT disk_id FROM "DiskUsage"
+    WHERE photo_count > 0 AND ($1 IS NULL
+        OR used_bytes < (SELECT used_bytes FROM boundary)
+        OR (used_bytes = (SELECT used_bytes FROM boundary) AND disk_id > $1))
+    ORDER BY used_bytes DESC, disk_id ASC
+    LIMIT $2
+""")
+
+CLOSE_PHOTOS_PAGE = registry.register("close_photos_page", ["integer", "integer", "bigint"], """
+    WITH saved_on AS (SELECT disk_id FROM "PhotoInDisk" WHERE photo_id = $1)
+    (SELECT PID.photo_id FROM "PhotoInDisk" PID
+    WHERE PID.disk_id IN (SELECT disk_id FROM saved_on) AND PID.photo_id <> $1 AND PID.photo_id > COALESCE($2, 0)
+    GROUP BY PID.photo_id
+    HAVING COUNT(PID.photo_id) >= (SELECT COUNT(*) FROM saved_on) * 0.5
+    ORDER BY PID.photo_id ASC
+    LIMIT $3)
+    UNION ALL
+    (SELECT "Photo".id FROM "Photo" WHERE NOT EXISTS (SELECT 1 FROM saved_on) AND "Photo".id <> $1
+    AND "Photo".id > COALESCE($2, 0)
+    ORDER BY "Photo".id ASC LIMIT $3)
+""")
+
+CLOSE_PHOTOS_PRECOMPUTED_PAGE = registry.register("close_photos_precomputed_page", ["integer", "integer", "bigint"], """
+    WITH saved AS (SELECT COALESCE((SELECT disk_count FROM "PhotoDiskCount" WHERE photo_id = $1), 0) AS disk_count)
+    (SELECT "PhotoCoOccurrence".other_photo_id FROM "PhotoCoOccurrence", saved
+    WHERE "PhotoCoOccurrence".photo_id = $1 AND saved.disk_count > 0
+    AND "PhotoCoOccurrence".shared_disks >= saved.disk_count * 0.5
+    AND "PhotoCoOccurrence".other_photo_id > COALESCE($2, 0)
+    ORDER BY "PhotoCoOccurrence".other_photo_id ASC
+    LIMIT $3)
+    UNION ALL
+    (SELECT "Photo".id FROM "Photo", saved WHERE saved.disk_count = 0 AND "Photo".id <> $1
+    AND "Photo".id > COALESCE($2, 0)
+    ORDER BY "Photo".id ASC LIMIT $3)
+""")
+
+
+# getClosePhotos under the strategy of the database, see Solution.setClosePhotosStrategy: from "PhotoCoOccurrence"
+# while its maintenance triggers are enabled, by joining "PhotoInDisk" otherwise. The triggers are read in the same
+# statement, so every process follows the last strategy set, also across createTables and dropTables.
+CO_OCCURRENCE_MAINTAINED = """
+    COALESCE((SELECT tgenabled <> 'D' FROM pg_trigger
+              WHERE tgrelid = '"PhotoInDisk"'::regclass AND tgname = 'PhotoInDisk_co_occurrence_insert'), FALSE)
+"""
+
+CLOSE_PHOTOS_BY_STRATEGY = """
+    WITH strategy AS (SELECT {maintained} AS precomputed)
+    (SELECT * FROM ({precomputed}) AS maintained WHERE (SELECT precomputed FROM strategy))
+    UNION ALL
+    (SELECT * FROM ({query}) AS joined WHERE NOT (SELECT precomputed FROM strategy))
+"""
+
+CLOSE_PHOTOS_CURRENT = registry.register("close_photos_current", ["integer"], CLOSE_PHOTOS_BY_STRATEGY.format(
+    maintained=CO_OCCURRENCE_MAINTAINED, precomputed=CLOSE_PHOTOS_PRECOMPUTED.text, query=CLOSE_PHOTOS.text))
+
+CLOSE_PHOTOS_CURRENT_PAGE = registry.register("close_photos_current_page", ["integer", "integer", "bigint"],
+                                              CLOSE_PHOTOS_BY_STRATEGY.format(
+                                                  maintained=CO_OCCURRENCE_MAINTAINED,
+                                                  precomputed=CLOSE_PHOTOS_PRECOMPUTED_PAGE.text,
+                                                  query=CLOSE_PHOTOS_PAGE.text))
+
+# Per-shard parts of the global queries, merged by Sharding. Disks and their PhotoInDisk and RAMInDisk rows live on one
+# shard each, Photo and RAM are on every shard, so these return keys the merge can order by instead of bare ids.
+
+SHARD_PLACED_PHOTOS_PAGE = registry.register("shard_placed_photos_page", ["integer", "bigint"], """
+    SELECT DISTINCT photo_id FROM "PhotoInDisk" WHERE photo_id > COALESCE($1, 0) ORDER BY photo_id ASC LIMIT $2
+""")
+
+# $1 are the shard's photos that are also placed on another shard; the shard's other conflicts are its own
+SHARD_CONFLICTING_DISKS_PAGE = registry.register("shard_conflicting_disks_page",
+                                                 ["integer[]", "integer", "bigint"], """
+    SELECT DISTINCT p1.disk_id FROM "PhotoInDisk" AS p1
+    WHERE p1.disk_id > COALESCE($2, 0)
+    AND (p1.photo_id = ANY($1::integer[])
+         OR EXISTS (SELECT 1 FROM "PhotoInDisk" AS p2 WHERE p2.photo_id = p1.photo_id AND p2.disk_id <> p1.disk_id))
+    ORDER BY p1.disk_id ASC
+    LIMIT $3
+""")
+
+SHARD_MOST_AVAILABLE_DISKS = registry.register("shard_most_available_disks", ["bigint"],
+                                               MOST_AVAILABLE_DISKS_QUERY.format(limit="$1"))
+
+SHARD_DISK_USED_BYTES = registry.register("shard_disk_used_bytes", ["integer"], """
+    SELECT used_bytes FROM "DiskUsage" WHERE disk_id = $1
+""")
+
+# the boundary of DISKS_CONTAINING_THE_MOST_DATA_PAGE is passed in: its disk lives on one shard, the page on all
+SHARD_DISKS_CONTAINING_THE_MOST_DATA_PAGE = registry.register("shard_disks_containing_the_most_data_page",
+                                                              ["bigint", "integer", "bigint"], """
+    SELECT disk_id, used_bytes FROM "DiskUsage"
+    WHERE photo_count > 0 AND ($1 IS NULL OR used_bytes < $1 OR (used_bytes = $1 AND disk_id > $2))
+    ORDER BY used_bytes DESC, disk_id ASC
+    LIMIT $3
+""")
+
+# a (NULL, disks holding $1) row, then for every other photo on those disks the number of them it shares
+SHARD_CLOSE_PHOTO_COUNTS = registry.register("shard_close_photo_counts", ["integer"], """
+    WITH saved_on AS (SELECT disk_id FROM "PhotoInDisk" WHERE photo_id = $1)
+    SELECT NULL::integer, COUNT(*) FROM saved_on
+    UNION ALL
+    SELECT PID.photo_id, COUNT(*) FROM "PhotoInDisk" PID
+    WHERE PID.disk_id IN (SELECT disk_id FROM saved_on) AND PID.photo_id <> $1
+    GROUP BY PID.photo_id
+""")
+
+PHOTO_IDS_PAGE = registry.register("photo_ids_page", ["integer", "integer", "bigint"], """
+    SELECT id FROM "Photo" WHERE id <> $1 AND id > COALESCE($2, 0) ORDER BY id ASC LIMIT $3
+""")
+
+# the lowest-id disk of the shard that could take the photo, and whether the photo exists, without taking any lock
+SHARD_ANY_DISK_CANDIDATE = registry.register("shard_any_disk_candidate", ["integer", "text", "integer"], """
+    WITH photo AS (SELECT id, disk_size_needed FROM "Photo"
+                   WHERE (id, description, disk_size_needed) = ($1::integer, $2::text, $3::integer))
+    SELECT (SELECT MIN("Disk".id) FROM "Disk", photo
+            WHERE "Disk".free_space >= photo.disk_size_needed
+            AND NOT EXISTS (SELECT 1 FROM "PhotoInDisk" WHERE photo_id = photo.id AND disk_id = "Disk".id)),
+           EXISTS (SELECT 1 FROM photo)
+""")
+
+
+# Replicas: the primary's WAL position after a write, and how far a standby has replayed and how far behind it is.
+# A standby that has replayed everything it received is not lagging, however old its last replayed transaction is.
+
+CURRENT_WAL_LSN = registry.register("current_wal_lsn", [], "SELECT pg_current_wal_lsn()::text")
+
+REPLICA_STATUS = registry.register("replica_status", [], """
+    SELECT pg_last_wal_replay_lsn()::text,
+           CASE WHEN pg_last_wal_receive_lsn() IS NULL OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+""")
+
+
+def execute(conn, statement: Statement, *params):
+    return registry.execute(conn, statement, *params)
+
+
+def bind(statement: Statement, *params) -> BoundStatement:
+    return BoundStatement(statement, params)
+
+
+def run(conn, query):
+    """Executes either a plain SQL query or a statement bound with bind()."""
+    if isinstance(query, BoundStatement):
+        return registry.execute(conn, query.statement, *query.params)
+    return conn.execute(query)
+
+
+def stats() -> dict:
+    return registry.stats()
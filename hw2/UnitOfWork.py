@@ -0,0 +1,169 @@
+"""
+Groups many Solution calls into one transaction on one connection:
+
+    session = UnitOfWork.Session()
+    attached = session.addRAMToDisk(1, 10)
+    session.removeRAMFromDisk(2, 10)
+    session.deleteRAM(3)
+    results = session.commit()      # [ReturnValue, ...] in queue order, attached.result is results[0]
+
+Calls are queued and run in order at commit(). While they run, every connection a Solution function asks the pool
+for is a savepoint on the session's connection: its commit() releases the savepoint, its rollback() and close()
+roll back to it, so each call keeps exactly the effect and the ReturnValue it has when run alone, and a failing
+call does not undo the others. The savepoint commands ride along with the next statement instead of taking round
+trips of their own, and the whole session pays for a single COMMIT.
+"""
+from itertools import count
+from typing import Callable, List
+
+import Cache
+import ConnectionPool
+import Replicas
+import Solution
+from Utility.ReturnValue import ReturnValue
+from psycopg2 import sql
+
+_savepointNames = count(1)
+
+
+class SavepointConnection:
+    """What ConnectionPool.getConnection() returns on the session's thread while the queued calls run."""
+
+    def __init__(self, session):
+        self.session = session
+        self.name = "uow_{}".format(next(_savepointNames))
+        self.open = False
+
+    @property
+    def connector(self):
+        return self.session.conn.connector
+
+    @property
+    def prepared(self) -> set:
+        return self.session.conn.prepared
+
+    def execute(self, query):
+        control = self.session.takeControl()
+        if not self.open:
+            control.append("SAVEPOINT {}".format(self.name))
+            self.open = True
+        if isinstance(query, str):
+            query = sql.SQL(query)
+        return self.session.conn.execute(sql.Composed([sql.SQL("; ".join(control) + "; "), query]))
+
+    def commit(self):
+        if self.open:
+            self.session.defer("RELEASE SAVEPOINT {}".format(self.name))
+            self.open = False
+
+    def rollback(self):
+        if self.open:
+            self.session.defer("ROLLBACK TO SAVEPOINT {name}; RELEASE SAVEPOINT {name}".format(name=self.name))
+            self.open = False
+
+    def close(self):
+        # like the pool, which rolls back whatever a connection did not commit when it is returned
+        self.rollback()
+
+
+def failed(result):
+    """The result a call would have had if its own commit had failed."""
+    if isinstance(result, ReturnValue):
+        return ReturnValue.ERROR
+    if isinstance(result, list) and result and isinstance(result[0], ReturnValue):
+        return [ReturnValue.ERROR] * len(result)
+    if isinstance(result, tuple) and result and isinstance(result[0], ReturnValue):
+        return ReturnValue.ERROR, None
+    return result
+
+
+class Pending:
+    def __init__(self, function: Callable, args: tuple, kwargs: dict):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+
+
+class Session:
+    """
+    Queues calls to the Solution API, see the module docstring. Calls are looked up by name on Solution
+    (session.addPhoto(photo)) or passed in with queue(). Streams cannot be queued, they would outlive the session.
+    Also a context manager that commits on a clean exit and drops the queue when the block raises.
+    """
+
+    def __init__(self):
+        self.queued: List[Pending] = []
+        self.conn = None
+        self._control: List[str] = []
+
+    def queue(self, function: Callable, *args, **kwargs) -> Pending:
+        pending = Pending(function, args, kwargs)
+        self.queued.append(pending)
+        return pending
+
+    def __getattr__(self, name: str):
+        if name not in Solution.INSTRUMENTED or name.startswith("stream"):
+            raise AttributeError("{} cannot be queued in a session".format(name))
+        function = getattr(Solution, name)
+        return lambda *args, **kwargs: self.queue(function, *args, **kwargs)
+
+    def defer(self, command: str):
+        self._control.append(command)
+
+    def takeControl(self) -> List[str]:
+        control, self._control = self._control, []
+        return control
+
+    def commit(self) -> list:
+        """
+        Runs the queued calls and commits them together, returning their results in queue order. A call that
+        raised has None as its result and the exception in its Pending.error. If the final COMMIT fails nothing
+        was applied, and every ReturnValue result becomes ReturnValue.ERROR as it would for a failed commit alone.
+        """
+        queued, self.queued = self.queued, []
+        if not queued:
+            return []
+        self.conn = ConnectionPool.getConnection()
+        invalidations = Cache.collectInvalidations()
+        previous = ConnectionPool.bindThread(lambda: SavepointConnection(self))
+        try:
+            for pending in queued:
+                try:
+                    pending.result = pending.function(*pending.args, **pending.kwargs)
+                except Exception as e:
+                    pending.error = e
+        finally:
+            ConnectionPool.bindThread(previous)
+            Cache.stopCollecting()
+        try:
+            control = self.takeControl()
+            if control:
+                self.conn.execute("; ".join(control))
+            self.conn.commit()
+            Replicas.noteWrite()
+        except Exception:
+            self.conn.rollback()
+            for pending in queued:
+                pending.result = failed(pending.result)
+        finally:
+            self.conn.close()
+            self.conn = None
+            # readers may have cached the rows again before the commit made the new ones visible
+            for kind, ids in invalidations:
+                Cache.invalidateLocal(kind, ids)
+        return [pending.result for pending in queued]
+
+    def discard(self):
+        self.queued = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is None:
+            self.commit()
+        else:
+            self.discard()
+        return False
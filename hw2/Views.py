@@ -0,0 +1,57 @@
+"""
+Read-only views of Photo, Disk and RAM rows for the bulk read path.
+A view is the row tuple itself (a named tuple with no per-instance dict), built with one call and no setters,
+and it answers the same getters as the Business object, so read-only code can take either.
+Missing ids decode to BAD_PHOTO, BAD_DISK and BAD_RAM, whose getters return None like badPhoto() and friends.
+"""
+from collections import namedtuple
+
+
+class PhotoView(namedtuple("PhotoView", ["id", "description", "disk_size_needed"])):
+    __slots__ = ()
+
+    def getPhotoID(self):
+        return self.id
+
+    def getDescription(self):
+        return self.description
+
+    def getSize(self):
+        return self.disk_size_needed
+
+
+class DiskView(namedtuple("DiskView", ["id", "manufacturing_company", "speed", "free_space", "cost_per_byte"])):
+    __slots__ = ()
+
+    def getDiskID(self):
+        return self.id
+
+    def getCompany(self):
+        return self.manufacturing_company
+
+    def getSpeed(self):
+        return self.speed
+
+    def getFreeSpace(self):
+        return self.free_space
+
+    def getCost(self):
+        return self.cost_per_byte
+
+
+class RAMView(namedtuple("RAMView", ["id", "size", "company"])):
+    __slots__ = ()
+
+    def getRamID(self):
+        return self.id
+
+    def getSize(self):
+        return self.size
+
+    def getCompany(self):
+        return self.company
+
+
+BAD_PHOTO = PhotoView(None, None, None)
+BAD_DISK = DiskView(None, None, None, None, None)
+BAD_RAM = RAMView(None, None, None)
@@ -0,0 +1,141 @@
+"""
+MemoryEngine against hand-written expected results, and against PostgreSQL through Differential when
+SOLUTION_TEST_DSN names a database to run on, e.g. SOLUTION_TEST_DSN="host=localhost dbname=hw2 user=postgres".
+
+    python -m pytest test_MemorySolution.py
+"""
+import os
+
+import pytest
+
+import MemorySolution
+from Benchmark.Harness import makeDisk, makePhoto, makeRAM
+from Utility.ReturnValue import ReturnValue
+
+OUT_OF_INT4 = 2 ** 31
+
+
+@pytest.fixture
+def engine() -> MemorySolution.MemoryEngine:
+    engine = MemorySolution.MemoryEngine()
+    for photo in (makePhoto(1, "a", 10), makePhoto(2, "a", 20), makePhoto(3, "b", 30)):
+        assert engine.addPhoto(photo) == ReturnValue.OK
+    assert engine.addDisk(makeDisk(1, "alpha", 5, 100, 2)) == ReturnValue.OK
+    assert engine.addDisk(makeDisk(2, "beta", 3, 25, 1)) == ReturnValue.OK
+    assert engine.addRAM(makeRAM(1, "alpha", 50)) == ReturnValue.OK
+    assert engine.addRAM(makeRAM(2, "beta", 10)) == ReturnValue.OK
+    return engine
+
+
+def test_add_error_precedence(engine):
+    # out of int4 fails the statement before any constraint, and constraints are checked before the key
+    assert engine.addPhoto(makePhoto(OUT_OF_INT4, "a", 1)) == ReturnValue.ERROR
+    assert engine.addPhoto(makePhoto(1, "a", -1)) == ReturnValue.BAD_PARAMS
+    assert engine.addPhoto(makePhoto(1, None, 10)) == ReturnValue.BAD_PARAMS
+    assert engine.addPhoto(makePhoto(0, "a", 10)) == ReturnValue.BAD_PARAMS
+    assert engine.addPhoto(makePhoto(1, "other", 99)) == ReturnValue.ALREADY_EXISTS
+    assert engine.addDisk(makeDisk(1, "alpha", 0, 100, 2)) == ReturnValue.BAD_PARAMS
+    assert engine.addDisk(makeDisk(1, "alpha", 1, 1, 1)) == ReturnValue.ALREADY_EXISTS
+    assert engine.addRAM(makeRAM(3, "alpha", 0)) == ReturnValue.BAD_PARAMS
+    assert engine.addDiskAndPhoto(makeDisk(3, "alpha", 1, 1, 1), makePhoto(1, "a", 10)) == ReturnValue.ALREADY_EXISTS
+    assert engine.getDiskByID(3).getDiskID() is None
+
+
+def test_placement_codes_and_free_space(engine):
+    assert engine.addPhotoToDisk(makePhoto(1, "a", 10), 1) == ReturnValue.OK
+    assert engine.addPhotoToDisk(makePhoto(1, "a", 10), 1) == ReturnValue.ALREADY_EXISTS
+    assert engine.addPhotoToDisk(makePhoto(3, "b", 30), 2) == ReturnValue.BAD_PARAMS
+    assert engine.addPhotoToDisk(makePhoto(2, "b", 20), 1) == ReturnValue.NOT_EXISTS
+    assert engine.addPhotoToDisk(makePhoto(2, "a", 20), 9) == ReturnValue.NOT_EXISTS
+    assert engine.addPhotoToDisk(makePhoto(2, "a", 20), OUT_OF_INT4) == ReturnValue.ERROR
+    assert engine.addPhotoToDisk(makePhoto(2, "a", 20), 1) == ReturnValue.OK
+    assert engine.getDiskByID(1).getFreeSpace() == 70
+    assert engine.averagePhotosSizeOnDisk(1) == 15
+    assert engine.getCostForDescription("a") == 60
+    assert engine.removePhotoFromDisk(makePhoto(3, "b", 30), 1) == ReturnValue.OK
+    assert engine.removePhotoFromDisk(makePhoto(2, "a", 20), 1) == ReturnValue.OK
+    assert engine.getDiskByID(1).getFreeSpace() == 90
+    assert engine.getCostForDescription("a") == 20
+    assert engine.addPhotoToAnyDisk(makePhoto(3, "b", 30)) == (ReturnValue.OK, 1)
+    assert engine.addPhotoToAnyDisk(makePhoto(3, "b", 30)) == (ReturnValue.BAD_PARAMS, None)
+
+
+def test_batch_placement_matches_single_calls(engine):
+    placements = [(makePhoto(1, "a", 10), 1), (makePhoto(OUT_OF_INT4, "a", 1), 1), (makePhoto(1, "a", 10), 1),
+                  (makePhoto(3, "b", 30), 2), (makePhoto(2, "a", 20), OUT_OF_INT4), (makePhoto(2, "a", 20), 2)]
+    assert engine.addPhotosToDisk(placements) == [ReturnValue.OK, ReturnValue.ERROR, ReturnValue.ALREADY_EXISTS,
+                                                  ReturnValue.BAD_PARAMS, ReturnValue.ERROR, ReturnValue.OK]
+    assert engine.getDiskByID(1).getFreeSpace() == 90
+    assert engine.getDiskByID(2).getFreeSpace() == 5
+
+
+def test_delete_photo_cascades_to_its_disks(engine):
+    assert engine.addPhotoToDisk(makePhoto(1, "a", 10), 1) == ReturnValue.OK
+    assert engine.addPhotoToDisk(makePhoto(1, "a", 10), 2) == ReturnValue.OK
+    assert engine.getConflictingDisks() == [1, 2]
+    # a photo that does not match the stored row is not deleted, and that is not an error
+    assert engine.deletePhoto(makePhoto(1, "a", 11)) == ReturnValue.OK
+    assert engine.getConflictingDisks() == [1, 2]
+    assert engine.deletePhoto(makePhoto(1, "a", 10)) == ReturnValue.OK
+    assert engine.getConflictingDisks() == []
+    assert [engine.getDiskByID(disk_id).getFreeSpace() for disk_id in (1, 2)] == [100, 25]
+    assert engine.getCostForDescription("a") == 0
+    assert engine.getPhotoByID(1).getPhotoID() is None
+
+
+def test_delete_disk_and_ram_cascade(engine):
+    assert engine.addPhotoToDisk(makePhoto(2, "a", 20), 1) == ReturnValue.OK
+    assert engine.addRAMToDisk(1, 1) == ReturnValue.OK
+    assert engine.addRAMToDisk(1, 2) == ReturnValue.OK
+    assert engine.deleteDisk(1) == ReturnValue.OK
+    assert engine.deleteDisk(1) == ReturnValue.NOT_EXISTS
+    assert engine.getCostForDescription("a") == 0
+    assert engine.getTotalRamOnDisk(1) == 0
+    assert engine.addPhotoToDisk(makePhoto(2, "a", 20), 2) == ReturnValue.OK
+    assert engine.getTotalRamOnDisk(2) == 50
+    assert engine.deleteRAM(1) == ReturnValue.OK
+    assert engine.deleteRAM(1) == ReturnValue.NOT_EXISTS
+    assert engine.getTotalRamOnDisk(2) == 0
+    assert engine.removeRAMFromDisk(1, 2) == ReturnValue.NOT_EXISTS
+
+
+def test_ram_attachments(engine):
+    assert engine.addRAMToDisk(1, 1) == ReturnValue.OK
+    assert engine.addRAMToDisk(1, 1) == ReturnValue.ALREADY_EXISTS
+    assert engine.addRAMToDisk(9, 1) == ReturnValue.NOT_EXISTS
+    assert engine.addRAMToDisk(1, 9) == ReturnValue.NOT_EXISTS
+    assert engine.addRAMToDisk(1, OUT_OF_INT4) == ReturnValue.ERROR
+    assert engine.isCompanyExclusive(1)
+    assert engine.addRAMToDisk(2, 1) == ReturnValue.OK
+    assert not engine.isCompanyExclusive(1)
+    assert engine.getTotalRamOnDisk(1) == 60
+    assert engine.removeRAMFromDisk(2, 1) == ReturnValue.OK
+    assert engine.getTotalRamOnDisk(1) == 50
+    assert engine.getPhotosCanBeAddedToDiskAndRAM(1) == [1, 2, 3]
+    assert engine.getPhotosCanBeAddedToDiskAndRAM(2) == []
+
+
+def test_rankings(engine):
+    assert engine.addDisk(makeDisk(3, "alpha", 9, 30, 1)) == ReturnValue.OK
+    assert engine.addPhotoToDisk(makePhoto(1, "a", 10), 2) == ReturnValue.OK
+    # disks 1 and 3 fit all three photos and disk 3 is faster, disk 2 has 15 left and fits only photo 1
+    assert engine.mostAvailableDisks() == [3, 1, 2]
+    assert engine.getDisksContainingTheMostData() == [2]
+    assert engine.getPhotosCanBeAddedToDisk(2) == [1]
+    assert engine.getPhotosCanBeAddedToDisk(1, 2) == [3, 2]
+    assert engine.isDiskContainingAtLeastNumExists("a", 1)
+    assert not engine.isDiskContainingAtLeastNumExists("a", 2)
+
+
+@pytest.mark.skipif(not os.environ.get("SOLUTION_TEST_DSN"), reason="SOLUTION_TEST_DSN is not set")
+def test_agrees_with_postgres():
+    import ConnectionPool
+    import Differential
+    import Solution
+
+    dsn = os.environ["SOLUTION_TEST_DSN"]
+    ConnectionPool.configurePool(factory=lambda: ConnectionPool.DSNConnector(dsn))
+    Solution.dropTables()
+    Solution.createTables()
+    for seed in range(5):
+        assert Differential.run(seed, 300) == []